@@ -0,0 +1,68 @@
+"""
+Reports the memory taken by ontology terms (in bytes per term) for the dict-based term layout used before
+and for the current compact mod_sbml.onto.term.Term layout.
+
+Usage: python benchmarks/term_memory.py [ontology.txt ...]
+(by default the GO and PTS subsets shipped in mod_sbml/data are measured)
+"""
+from collections import defaultdict
+import os
+import sys
+import tracemalloc
+
+from mod_sbml.onto.term import Term
+from mod_sbml.annotation.gene_ontology.go_serializer import get_go
+from mod_sbml.annotation.pts.pts_serializer import get_pts
+
+__author__ = 'anna'
+
+
+class DictTerm:
+    """
+    The previous term layout: instance __dict__, sets for all the collections and a defaultdict for xrefs.
+    """
+
+    def __init__(self, s):
+        self.onto = None
+        self.altIds = set()
+        self.synonyms = set()
+        self.parent_ids = set()
+        self.xrefs = defaultdict(set)
+        t_id, alt_ids, name, synonyms, parent_ids, xrefs = s.splitlines()[0].split('\t\t')
+        self.id = t_id.strip().lower()
+        self.name = name.strip()
+        self.synonyms |= {it.strip() for it in synonyms.split('\t')} - {''}
+        self.altIds |= {it.strip().lower() for it in alt_ids.split('\t')} - {''}
+        self.parent_ids |= {it.strip().lower() for it in parent_ids.split('\t')} - {''}
+        for db_values in xrefs.split(';\t;'):
+            values = db_values.split('\t')
+            if len(values) > 1:
+                self.xrefs[values[0].strip().lower().replace(' ', '.')] |= {it.strip() for it in values[1:]}
+
+
+def read_term_lines(path):
+    with open(path, 'r') as f:
+        lines = [line for line in f if line.strip()]
+    start, end = lines.index('[Terms]\n') + 1, lines.index('[Relationships]\n')
+    return lines[start: end]
+
+
+def measure(lines, create):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    terms = [create(line) for line in lines]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / len(terms)
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] if len(sys.argv) > 1 else [get_go(), get_pts()]
+    lines = []
+    for path in paths:
+        lines.extend(read_term_lines(path))
+    print('%d terms from %s' % (len(lines), ', '.join(os.path.basename(path) for path in paths)))
+    before = measure(lines, DictTerm)
+    after = measure(lines, lambda line: Term(onto=None, s=line))
+    print('before (dict-based terms): %.0f bytes per term' % before)
+    print('after (compact terms):     %.0f bytes per term (%.0f%%)' % (after, 100 * after / before))
@@ -1,4 +1,3 @@
-from functools import reduce
 from itertools import chain
 import re
 
@@ -39,11 +38,36 @@ def get_chebi_term_by_annotation(entity, chebi):
     return None
 
 
+def get_species_names(m, model=None):
+    """
+    Lists the names under which the species can be looked for in ChEBI:
+    its species type name, its name and its name without the compartment name.
+    :param m: libsbml.Species species of interest
+    :param model: libsbml.Model model (optional), needed to get the species type and compartment names
+    :return: list of names
+    """
+    names = []
+    if model:
+        s_type_id = m.getSpeciesType()
+        if s_type_id:
+            s_type = model.getSpeciesType(s_type_id)
+            if s_type:
+                names.append(s_type.getName())
+    name = m.getName()
+    names.append(name)
+    if name and model:
+        c = model.getCompartment(m.getCompartment())
+        if c:
+            c_name = c.getName() if c.getName() else c.getId()
+            name = name.replace('[%s]' % c_name, '').replace(c_name, '').strip()
+            names.append(name)
+    return [name for name in names if name]
+
+
 def infer_chebi_term(m, chebi, model=None):
     term = get_chebi_term_by_annotation(m, chebi)
     if term:
         return term
-    names = []
     if model:
         s_type_id = m.getSpeciesType()
         if s_type_id:
@@ -52,42 +76,48 @@ def infer_chebi_term(m, chebi, model=None):
                 term = get_chebi_term_by_annotation(s_type, chebi)
                 if term:
                     return term
-                names.append(s_type.getName())
 
     for formula in get_formulas(m):
         if formula and formula != '.':
             term = chebi.get_term(formula, check_only_ids=False)
             if term:
                 return term
-    name = m.getName()
-    names.append(name)
-    if name and model:
-        c = model.getCompartment(m.getCompartment())
-        if c:
-            c_name = c.getName() if c.getName() else c.getId()
-            name = name.replace('[%s]' % c_name, '').replace(c_name, '').strip()
-            names.append(name)
-    for name in names:
-        if name:
-            term = chebi.get_term(name, check_only_ids=False)
-            if term:
-                return term
+    for name in get_species_names(m, model):
+        term = chebi.get_term(name, check_only_ids=False)
+        if term:
+            return term
     return None
 
 
-def annotate_metabolites(model, chebi):
+def annotate_metabolites(model, chebi, fuzzy_index=None):
     """
     Infers ChEBI terms for metabolites that lack them and annotates.
     :param model: libsbml.Model model of interest
     :param chebi: mod_sbml.onto.obo_ontology.Ontology ChEBI ontology
+    :param fuzzy_index: mod_sbml.onto.trigram_index.TrigramIndex index over the ChEBI names (optional),
+    if given, the metabolites whose names do not exactly match any ChEBI name are annotated
+    with the terms with the most similar names
     :return: void, input model is modified inplace
     """
+    unannotated = []
     for m in model.getListOfSpecies():
         if get_chebi_id(m):
             continue
         term = infer_chebi_term(m, chebi, model)
         if term:
             add_annotation(m, libsbml.BQB_IS, term.get_id(), CHEBI_PREFIX)
+        elif fuzzy_index:
+            unannotated.append(m)
+    if not unannotated:
+        return
+    m2names = {m.getId(): get_species_names(m, model) for m in unannotated}
+    name2term = fuzzy_index.get_terms(name for names in m2names.values() for name in names)
+    for m in unannotated:
+        for name in m2names[m.getId()]:
+            term = name2term[name]
+            if term:
+                add_annotation(m, libsbml.BQB_IS, term.get_id(), CHEBI_PREFIX)
+                break
 
 
 def get_species_id2chebi_id(model):
@@ -123,23 +153,30 @@ def get_cofactor_ids(onto):
     return add_equivalent_chebi_ids(onto, cofactor_ids)
 
 
-def add_equivalent_chebi_ids(ontology, chebi_ids, eq_rel=EQUIVALENT_RELATIONSHIPS):
+def add_equivalent_chebi_ids(ontology, chebi_ids, eq_rel=EQUIVALENT_RELATIONSHIPS, id2eq_ids=None):
     """
     Returns a extended set that contains the input ChEBI term id collection
     plus the ids of terms that are equivalent to those in the input collection.
     :param eq_rel: set of equivalence relationships (by default 'is_conjugate_base/acid_of' and 'is_taumer_of').
-    :param ontology: mod_sbml.onto.obo_ontology.Ontology ChEBI ontology
+    :param ontology: mod_sbml.onto.obo_ontology.Ontology ChEBI ontology (can be None if id2eq_ids is given)
     :param chebi_ids: collection of ChEBI term ids.
+    :param id2eq_ids: (optional) precalculated mapping between ChEBI term ids and the ids of their equivalents,
+    as returned by ontology.get_equivalent_id_map(eq_rel)
+    (or loaded with mod_sbml.annotation.chebi.chebi_serializer.load_equivalent_ids);
+    if no ontology is given, the ids of the terms without equivalents are returned as they are
     :return: set of ChEBI term ids (input + equivalent)
     """
-    cup = lambda s1, s2: s1 | s2
-    return \
-        reduce(cup,
-               (reduce(cup,
-                       (it.get_all_ids() for it in ontology.get_equivalents(t, relationships=eq_rel)),
-                       t.get_all_ids())
-                for t in (it for it in (ontology.get_term(ub_id) for ub_id in chebi_ids) if it)), chebi_ids)
-
-
-
-
+    if id2eq_ids is None:
+        id2eq_ids = ontology.get_equivalent_id_map(eq_rel)
+    result = set(chebi_ids)
+    for ch_id in chebi_ids:
+        if not ch_id:
+            continue
+        key = ch_id.lower().strip()
+        if key in id2eq_ids:
+            result |= id2eq_ids[key]
+        elif ontology:
+            term = ontology.get_term(key)
+            if term:
+                result.add(term.get_id())
+    return result
@@ -1,9 +1,13 @@
+import hashlib
+import logging
 import os
-from functools import reduce
+import time
+from collections import deque
 
 from mod_sbml.annotation.chebi.chebi_annotator import EQUIVALENT_RELATIONSHIPS, MOLECULAR_ENTITY, HAS_ROLE_RELATIONSHIP, \
-    add_equivalent_chebi_ids, get_cofactor_ids
-from mod_sbml.onto import parse, save_simple, save
+    COFACTOR_CHEBI_ID, add_equivalent_chebi_ids, get_cofactor_ids
+from mod_sbml.onto import parse, parse_simple, save_simple, save, Ontology, Term
+from mod_sbml.onto.obo_parser import iter_obo
 from mod_sbml import annotation
 
 __author__ = 'anna'
@@ -11,10 +15,15 @@ __author__ = 'anna'
 CHEBI = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'chebi.obo')
 SUB_CHEBI = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'subchebi.obo')
 SUB_CHEBI_TXT = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'subchebi.txt')
+# equivalence classes of the SUB_CHEBI_TXT terms (see save_equivalent_ids)
+SUB_CHEBI_EQUIVALENTS = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data',
+                                     'subchebi_equivalents.txt')
 
 COFACTORS_FILE = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'ub_cofactors.txt')
 PROTONS_FILE = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'protons.txt')
 COMMON_TERMS_FILE = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'ub_common.txt')
+# digests of the ChEBI terms the data files above were built from (see refresh_chebi_data)
+CHEBI_DIGESTS = os.path.join(os.path.dirname(os.path.abspath(annotation.__file__)), '..', 'data', 'chebi_digests.txt')
 
 
 PROTON_IDS = {'chebi:15378'}
@@ -45,31 +54,113 @@ def get_chebi():
     return SUB_CHEBI_TXT
 
 
-def get_closest_descendants_with_formulas(onto, term):
-    if term.get_formulas():
-        return {term}
-    for t in onto.get_equivalents(term, relationships=EQUIVALENT_RELATIONSHIPS):
-        if t.get_formulas():
-            return {term}
-    return reduce(lambda s1, s2: s1 | s2,
-                  (get_closest_descendants_with_formulas(onto, t)
-                   for t in onto.get_generalized_descendants(term, True)),
-                  set())
-
-
-def serialize_sub_chebi():
-    onto = parse(CHEBI, EQUIVALENT_RELATIONSHIPS)
-    terms_to_keep = reduce(lambda s1, s2: s1 | s2,
-                           (onto.get_sub_tree(t, relationships=EQUIVALENT_RELATIONSHIPS) for t in
-                               get_closest_descendants_with_formulas(onto, onto.get_term(MOLECULAR_ENTITY))), set())
-    for term in (t for t in onto.get_all_terms() if t not in terms_to_keep):
-        onto.remove_term(term, True)
+def get_chebi_equivalents():
+    return SUB_CHEBI_EQUIVALENTS
+
+
+def save_equivalent_ids(id2eq_ids, path):
+    """
+    Saves the mapping between term ids and the ids of their equivalents (see Ontology.get_equivalent_id_map),
+    one equivalence class (as tab-separated ids) per line.
+    :param id2eq_ids: dict {term id: frozenset of term ids}
+    :param path: path to the file to be created
+    :return: void
+    """
+    with open(path, 'w') as f:
+        for eq_ids in set(id2eq_ids.values()):
+            f.write('%s\n' % '\t'.join(sorted(eq_ids)))
+
+
+def load_equivalent_ids(path):
+    """
+    Loads the mapping between term ids and the ids of their equivalents saved with save_equivalent_ids.
+    :param path: path to the file
+    :return: dict {term id: frozenset of term ids} or None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    id2eq_ids = {}
+    with open(path, 'r') as f:
+        for line in f:
+            eq_ids = frozenset(line.split())
+            for t_id in eq_ids:
+                id2eq_ids[t_id] = eq_ids
+    return id2eq_ids
+
+
+def _has_formulas(onto, term):
+    return bool(term.get_formulas()) \
+        or any(t.get_formulas() for t in onto.get_equivalents(term, relationships=EQUIVALENT_RELATIONSHIPS))
+
+
+def get_closest_descendants_with_formulas(onto, term, term_ids=None):
+    """
+    Finds the closest generalized descendants of the given term (or the term itself)
+    that have formulas (or whose equivalents have formulas).
+    The descendants are explored breadth-first, each of them only once.
+    :param onto: mod_sbml.onto.obo_ontology.Ontology ChEBI ontology
+    :param term: term of interest
+    :param term_ids: (optional) collection of ids of the terms the search should be restricted to
+    :return: set of terms
+    """
+    result, checked = set(), {term}
+    to_check = deque([term])
+    while to_check:
+        term = to_check.popleft()
+        if _has_formulas(onto, term):
+            result.add(term)
+            continue
+        for t in onto.get_generalized_descendants(term, True):
+            if t not in checked and (term_ids is None or t.get_id() in term_ids):
+                checked.add(t)
+                to_check.append(t)
+    return result
+
+
+def serialize_sub_chebi(onto=None):
+    """
+    Serializes the part of ChEBI that contains the terms with formulas (and their generalized descendants)
+    into SUB_CHEBI_TXT and SUB_CHEBI, and its equivalence classes into SUB_CHEBI_EQUIVALENTS.
+    :param onto: (optional) ChEBI ontology parsed from CHEBI with the EQUIVALENT_RELATIONSHIPS,
+    if not given it will be parsed. Attention: the ontology is modified inplace.
+    The time taken by each phase is logged.
+    :return: void
+    """
+    start = time.time()
+    if not onto:
+        onto = parse(CHEBI, EQUIVALENT_RELATIONSHIPS)
+        start = _log_phase('parsed ChEBI', start)
+    terms_with_formulas = get_closest_descendants_with_formulas(onto, onto.get_term(MOLECULAR_ENTITY))
+    start = _log_phase('found %d closest terms with formulas' % len(terms_with_formulas), start)
+    terms_to_keep = set()
+    for t in terms_with_formulas:
+        if t not in terms_to_keep:
+            terms_to_keep |= onto.get_sub_tree(t, relationships=EQUIVALENT_RELATIONSHIPS)
+    start = _log_phase('collected %d terms to keep' % len(terms_to_keep), start)
+    onto.remove_terms([t for t in onto.get_all_terms() if t not in terms_to_keep], True)
+    start = _log_phase('removed the other terms', start)
     save_simple(onto, SUB_CHEBI_TXT)
     save(onto, SUB_CHEBI)
+    save_equivalent_ids(onto.get_equivalent_id_map(EQUIVALENT_RELATIONSHIPS), SUB_CHEBI_EQUIVALENTS)
+    _log_phase('saved the sub-ontology', start)
 
 
-def serialize_ubiquitous_terms():
-    chebi = parse(CHEBI, EQUIVALENT_RELATIONSHIPS | {HAS_ROLE_RELATIONSHIP})
+def _log_phase(message, start):
+    now = time.time()
+    logging.info('serialize_sub_chebi: %s in %.2f s' % (message, now - start))
+    return now
+
+
+def serialize_ubiquitous_terms(chebi=None):
+    """
+    Serializes the ids of common ubiquitous ChEBI terms (and their equivalents) into COMMON_TERMS_FILE,
+    and the ids of cofactors into COFACTORS_FILE.
+    :param chebi: (optional) ChEBI ontology parsed from CHEBI with (at least) the EQUIVALENT_RELATIONSHIPS
+    and the HAS_ROLE_RELATIONSHIP, if not given it will be parsed.
+    :return: void
+    """
+    if not chebi:
+        chebi = parse(CHEBI, EQUIVALENT_RELATIONSHIPS | {HAS_ROLE_RELATIONSHIP})
     ub_ch_ids = add_equivalent_chebi_ids(chebi, COMMON_UB_IDS)
     with open(COMMON_TERMS_FILE, 'w+') as f:
         f.write('\t'.join(ub_ch_ids))
@@ -79,14 +170,229 @@ def serialize_ubiquitous_terms():
         f.write('\t'.join(ub_ch_ids))
 
 
-def serialize_proton_terms():
-    chebi = parse(CHEBI, EQUIVALENT_RELATIONSHIPS)
+def serialize_proton_terms(chebi=None):
+    """
+    Serializes the ids of proton ChEBI terms (and their equivalents) into PROTONS_FILE.
+    :param chebi: (optional) ChEBI ontology parsed from CHEBI with (at least) the EQUIVALENT_RELATIONSHIPS,
+    if not given it will be parsed.
+    :return: void
+    """
+    if not chebi:
+        chebi = parse(CHEBI, EQUIVALENT_RELATIONSHIPS)
     proton_ch_ids = add_equivalent_chebi_ids(chebi, PROTON_IDS)
     with open(PROTONS_FILE, 'w+') as f:
         f.write('\t'.join(proton_ch_ids))
 
 
+def get_term_digest(term, rels):
+    """
+    Calculates the digest of a term as parsed from an OBO file:
+    it changes whenever the term's ids, name, synonyms, parents, xrefs (including formulas)
+    or relationships change.
+    :param term: mod_sbml.onto.term.Term term
+    :param rels: collection of the term's (subject_id, relationship, object_id) relationship tuples
+    :return: str digest
+    """
+    return hashlib.md5(('%s%s' % (term, sorted(rels))).encode('utf-8')).hexdigest()
+
+
+def parse_chebi(obo_file=CHEBI):
+    """
+    Parses ChEBI (keeping the EQUIVALENT_RELATIONSHIPS and the HAS_ROLE_RELATIONSHIP),
+    and calculates the digests of its terms (see get_term_digest) while parsing.
+    :param obo_file: path to the ChEBI OBO file
+    :return: tuple (mod_sbml.onto.obo_ontology.Ontology ChEBI ontology, dict {term id: digest})
+    """
+    chebi = Ontology()
+    t_id2digest = {}
+    for term, rels in iter_obo(obo_file, relationships=EQUIVALENT_RELATIONSHIPS | {HAS_ROLE_RELATIONSHIP}, onto=chebi):
+        chebi.add_term(term)
+        for (subj, rel, obj) in rels:
+            chebi.add_relationship(subj, rel, obj)
+        t_id2digest[term.get_id()] = get_term_digest(term, rels)
+    return chebi, t_id2digest
+
+
+def save_digests(t_id2digest, path):
+    with open(path, 'w') as f:
+        for t_id, digest in sorted(t_id2digest.items()):
+            f.write('%s\t%s\n' % (t_id, digest))
+
+
+def load_digests(path):
+    """
+    Loads the term digests saved with save_digests.
+    :param path: path to the digest file
+    :return: dict {term id: digest} or None if the file does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return dict(line.split() for line in f if line.strip())
+
+
+def _load_ids(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return {it for it in f.read().strip().split('\t') if it}
+
+
+def _save_ids(ids, path):
+    with open(path, 'w+') as f:
+        f.write('\t'.join(ids))
+
+
+def _get_neighbour_ids(chebi, t_id):
+    """
+    Returns the ids of the terms related to the given one directly (as parents, children or via relationships).
+    """
+    term = chebi.get_term(t_id)
+    if not term:
+        return set()
+    result = term.get_parent_ids() | chebi.parent2children.get(term.get_id(), set())
+    for (subj, rel, obj) in chebi.get_term_relationships(term.get_id()):
+        result |= {subj, obj}
+    return result
+
+
+def _refresh_sub_chebi(chebi, sub_chebi, changed_ids):
+    """
+    Updates the sub-ontology built by serialize_sub_chebi from the previous ChEBI release
+    to match the new release. Term membership is only recomputed for the affected region,
+    i.e. the sub-trees (via the EQUIVALENT_RELATIONSHIPS) of the changed terms in both releases.
+    :param chebi: new ChEBI ontology with (only) the EQUIVALENT_RELATIONSHIPS
+    :param sub_chebi: sub-ontology built from the previous release, modified inplace
+    :param changed_ids: ids of the terms that were added, removed or changed in the new release
+    :return: set of ids of the terms in the affected region
+    """
+    # the children of the removed terms are affected too, as they now refer to unknown parents
+    start_ids = set(changed_ids)
+    for t_id in changed_ids:
+        if not chebi.get_term(t_id):
+            start_ids |= chebi.parent2children.get(t_id, set())
+    region = set()
+    for onto in (chebi, sub_chebi):
+        onto_region = set()
+        for term in (onto.get_term(t_id) for t_id in start_ids):
+            if term and term.get_id() not in onto_region:
+                onto_region |= {t.get_id() for t in onto.get_sub_tree(term, relationships=EQUIVALENT_RELATIONSHIPS)}
+        region |= onto_region
+    if not region:
+        return region
+
+    # A term is kept if it is in the sub-tree of one of the closest to the molecular entity terms with formulas.
+    # Only the generalized ancestors of the region terms can be such terms for them,
+    # so the search for these terms is restricted to those ancestors.
+    t_id2up_ids = {}
+    for term in (chebi.get_term(t_id) for t_id in region):
+        if term and term.get_id() not in t_id2up_ids:
+            t_id2up_ids[term.get_id()] = \
+                {t.get_id() for t in chebi.get_generalized_ancestors(term, False, set(), EQUIVALENT_RELATIONSHIPS)
+                 | chebi.get_equivalents(term, None, 0, EQUIVALENT_RELATIONSHIPS)} | {term.get_id()}
+    up_ids = set().union(*t_id2up_ids.values())
+    top_ids = {t.get_id() for t in get_closest_descendants_with_formulas(chebi, chebi.get_term(MOLECULAR_ENTITY),
+                                                                         up_ids)} \
+        if MOLECULAR_ENTITY in up_ids else set()
+    kept_ids = {t_id for (t_id, t_up_ids) in t_id2up_ids.items() if t_up_ids & top_ids}
+
+    sub_chebi.remove_terms([sub_chebi.get_term(t_id) for t_id in region], True)
+
+    def is_removed(t_id):
+        term = chebi.get_term(t_id)
+        return term is not None and term.get_id() not in kept_ids and not sub_chebi.get_term(term.get_id())
+
+    rels = set()
+    for t_id in kept_ids:
+        term = Term(onto=None, s=str(chebi.get_term(t_id)))
+        parent_ids = {p_id for p_id in term.get_parent_ids() if not is_removed(p_id)}
+        if parent_ids != term.get_parent_ids():
+            term.set_parent_ids(parent_ids)
+        sub_chebi.add_term(term)
+        rels |= {(subj, rel, obj) for (subj, rel, obj) in chebi.get_term_relationships(t_id)
+                 if not is_removed(subj) and not is_removed(obj)}
+    for (subj, rel, obj) in rels:
+        sub_chebi.add_relationship(subj, rel, obj)
+    return region
+
+
+def refresh_chebi_data(obo_file=CHEBI):
+    """
+    Updates the ChEBI-derived data files (see serialize_chebi_data) to a new ChEBI release.
+    The new release is compared to the one the files were built from term by term (via the saved term digests),
+    and only the parts of the files affected by the added, removed or changed terms are re-derived:
+    the sub-ontology membership is only recomputed for the sub-trees of the changed terms,
+    and the ubiquitous, cofactor and proton files are only recomputed if the changed terms
+    (or the terms directly related to them) are among their terms.
+    If the files (or the digests) do not exist yet, all the files are built from scratch.
+    :param obo_file: path to the ChEBI OBO file of the new release
+    :return: dict with the sets of 'added', 'removed' and 'changed' term ids, and the list of 'updated' files
+    """
+    old_t_id2digest = load_digests(CHEBI_DIGESTS)
+    sub_chebi = parse_simple(SUB_CHEBI_TXT)
+    old_ub_ids, old_cofactor_ids, old_proton_ids = \
+        _load_ids(COMMON_TERMS_FILE), _load_ids(COFACTORS_FILE), _load_ids(PROTONS_FILE)
+    if old_t_id2digest is None or sub_chebi is None or None in (old_ub_ids, old_cofactor_ids, old_proton_ids):
+        logging.info('No previous ChEBI data found, building it from scratch')
+        t_id2digest = serialize_chebi_data(obo_file)
+        return {'added': set(t_id2digest.keys()), 'removed': set(), 'changed': set(),
+                'updated': [SUB_CHEBI_TXT, SUB_CHEBI, SUB_CHEBI_EQUIVALENTS, COMMON_TERMS_FILE, COFACTORS_FILE,
+                            PROTONS_FILE]}
+
+    chebi, t_id2digest = parse_chebi(obo_file)
+    added = t_id2digest.keys() - old_t_id2digest.keys()
+    removed = old_t_id2digest.keys() - t_id2digest.keys()
+    changed = {t_id for (t_id, digest) in t_id2digest.items() if old_t_id2digest.get(t_id, digest) != digest}
+    report = {'added': added, 'removed': removed, 'changed': changed, 'updated': []}
+    changed_ids = added | removed | changed
+    if not changed_ids:
+        logging.info('The ChEBI release has not changed')
+        return report
+
+    touched_ids = set(changed_ids)
+    for t_id in changed_ids:
+        touched_ids |= _get_neighbour_ids(chebi, t_id)
+    cofactor_role_ids = chebi.get_descendants(COFACTOR_CHEBI_ID, False) | {COFACTOR_CHEBI_ID}
+    for path, old_ids, anchor_ids, get_ids in \
+            ((COMMON_TERMS_FILE, old_ub_ids, COMMON_UB_IDS, lambda: add_equivalent_chebi_ids(chebi, COMMON_UB_IDS)),
+             (COFACTORS_FILE, old_cofactor_ids, cofactor_role_ids, lambda: get_cofactor_ids(chebi)),
+             (PROTONS_FILE, old_proton_ids, PROTON_IDS, lambda: add_equivalent_chebi_ids(chebi, PROTON_IDS))):
+        if touched_ids & (old_ids | anchor_ids):
+            ids = get_ids()
+            if ids != old_ids:
+                _save_ids(ids, path)
+                report['updated'].append(path)
+
+    chebi.filter_relationships(EQUIVALENT_RELATIONSHIPS)
+    region = _refresh_sub_chebi(chebi, sub_chebi, changed_ids)
+    if region:
+        save_simple(sub_chebi, SUB_CHEBI_TXT)
+        save(sub_chebi, SUB_CHEBI)
+        save_equivalent_ids(sub_chebi.get_equivalent_id_map(EQUIVALENT_RELATIONSHIPS), SUB_CHEBI_EQUIVALENTS)
+        report['updated'].extend([SUB_CHEBI_TXT, SUB_CHEBI, SUB_CHEBI_EQUIVALENTS])
+    save_digests(t_id2digest, CHEBI_DIGESTS)
+    logging.info('ChEBI refresh: %d terms added, %d removed, %d changed (%d terms re-derived), updated %s'
+                 % (len(added), len(removed), len(changed), len(region), ', '.join(report['updated']) or 'nothing'))
+    return report
+
+
+def serialize_chebi_data(obo_file=CHEBI):
+    """
+    Builds all the ChEBI-derived data files (see serialize_ubiquitous_terms, serialize_proton_terms
+    and serialize_sub_chebi) parsing the ChEBI OBO file only once,
+    and saves the digests of the ChEBI terms for the future refreshes (see refresh_chebi_data).
+    :param obo_file: path to the ChEBI OBO file
+    :return: dict {term id: digest}
+    """
+    chebi, t_id2digest = parse_chebi(obo_file)
+    serialize_ubiquitous_terms(chebi)
+    serialize_proton_terms(chebi)
+    # the sub-ontology only keeps the equivalence relationships, and is built inplace, hence the last
+    chebi.filter_relationships(EQUIVALENT_RELATIONSHIPS)
+    serialize_sub_chebi(chebi)
+    save_digests(t_id2digest, CHEBI_DIGESTS)
+    return t_id2digest
+
+
 if __name__ == "__main__":
-    serialize_sub_chebi()
-    serialize_ubiquitous_terms()
-    serialize_proton_terms()
+    refresh_chebi_data()
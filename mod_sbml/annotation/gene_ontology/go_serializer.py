@@ -20,8 +20,7 @@ def get_go():
 def serialize_sub_go():
     onto = parse(GO, {PART_OF})
     terms_to_keep = onto.get_sub_tree(onto.get_term(CELLULAR_COMPONENT), relationships={PART_OF})
-    for term in (t for t in onto.get_all_terms() if t not in terms_to_keep):
-        onto.remove_term(term, True)
+    onto.remove_terms([t for t in onto.get_all_terms() if t not in terms_to_keep], True)
     save_simple(onto, SUB_GO_TXT)
     # save(onto, SUB_GO)
 
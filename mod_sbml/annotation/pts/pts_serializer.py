@@ -35,6 +35,7 @@ def parse_csv(csv_file=PTS_CSV, sep=','):
         if not t_id:
             continue
         term = Term(onto=ontology)
+        term.thaw()
         term.set_id(t_id)
         if name:
             term.set_name(name.replace('\\"', '"'))
@@ -54,6 +55,7 @@ def parse_csv(csv_file=PTS_CSV, sep=','):
                     continue
                 db_name, value = xref[:last_colon_index], xref[last_colon_index + 1:]
                 term.add_xref(db_name, value)
+        term.freeze()
         ontology.add_term(term)
     return ontology
 
@@ -61,8 +63,7 @@ def parse_csv(csv_file=PTS_CSV, sep=','):
 def serialize_sub_pts():
     onto = parse_csv()
     terms_to_keep = onto.get_descendants(METABOLIC_PATHWAY, False)
-    for term in (t for t in onto.get_all_terms() if t.get_id() not in terms_to_keep):
-        onto.remove_term(term, True)
+    onto.remove_terms([t for t in onto.get_all_terms() if t.get_id() not in terms_to_keep], True)
     save_simple(onto, SUB_PTS_TXT)
 
 
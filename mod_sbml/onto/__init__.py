@@ -1,18 +1,33 @@
 import os
-from functools import reduce
 
-from mod_sbml.onto.obo_ontology import Ontology
-from mod_sbml.onto.term import Term, FORMULA
+from mod_sbml.onto.lazy_ontology import LazyOntology
+from mod_sbml.onto.obo_ontology import Ontology, TERMS_HEADER, RELS_HEADER
+from mod_sbml.onto.obo_parser import iter_obo
+from mod_sbml.onto.ontology_view import OntologyView
+from mod_sbml.onto.snapshot import load_snapshot, save_snapshot
+from mod_sbml.onto.term import Term
 
 __author__ = 'anna'
 
-RELS_HEADER = '[Relationships]\n'
-TERMS_HEADER = '[Terms]\n'
 
-
-def parse_simple(path):
+def parse_simple(path, use_snapshot=True, lazy=False):
+    """
+    Parses an ontology saved in the simple tab-delimited format (see save_simple).
+    :param path: path to the ontology file
+    :param use_snapshot: whether to load the ontology from its binary snapshot (if it is up-to-date),
+    and to save the snapshot after parsing otherwise
+    :param lazy: whether to only index the term lines by id and to create the terms (and the other indices)
+    when they are first accessed (see mod_sbml.onto.lazy_ontology.LazyOntology), the snapshot is not used then
+    :return: mod_sbml.onto.obo_ontology.Ontology ontology or None if the file does not exist
+    """
     if not os.path.exists(path):
         return None
+    if lazy:
+        return LazyOntology(path)
+    if use_snapshot:
+        ontology = load_snapshot(path)
+        if ontology is not None:
+            return ontology
     ontology = Ontology()
     TERMS = 0
     RELS = 1
@@ -34,85 +49,40 @@ def parse_simple(path):
                 line = line.splitlines()[0]
                 subj, rel, obj = line.split('\t')
                 ontology.add_relationship(subj=subj, rel=rel, obj=obj)
+    if use_snapshot:
+        save_snapshot(ontology, path)
     return ontology
 
 
 def parse(obo_file, relationships=None):
+    """
+    Parses an ontology in OBO format (obsolete terms are skipped).
+    :param obo_file: path to the OBO file
+    :param relationships: collection of relationships to be kept (or None to keep all of them)
+    :return: mod_sbml.onto.obo_ontology.Ontology ontology or None if the file does not exist
+    """
     if not obo_file or obo_file.find(".obo") == -1 or not os.path.exists(obo_file):
         return None
     ontology = Ontology()
-    term = None
-    with open(obo_file, 'r') as obo:
-        for line in obo:
-            line = line.replace("\n", '')
-            if line.find("[Term]") != -1:
-                if term:
-                    ontology.add_term(term)
-                term = Term(onto=ontology)
-                continue
-            if not term:
-                continue
-            semicolon = line.find(":")
-            if semicolon == -1:
-                continue
-            prefix = line[0:semicolon].strip()
-            value = line[semicolon + 1: len(line)].strip()
-            comment = value.find("!")
-            if comment != -1:
-                value = value[0:comment].strip()
-            if prefix == "id":
-                term.set_id(value)
-            elif prefix == "is_obsolete" and value == "true":
-                term = None
-            elif prefix == "alt_id":
-                term.add_alt_id(value)
-            elif prefix == "name":
-                term.set_name(value.replace('\\"', '"'))
-            elif prefix == "is_a":
-                term.add_parent(value)
-            elif prefix == "relationship":
-                comment_start = value.find("!")
-                if comment_start != -1:
-                    value = value[0:comment_start]
-                first, second = value.strip().split(" ")
-                if not relationships or first in relationships:
-                    ontology.add_relationship(term.get_id(), first, second.lower())
-            elif prefix == "synonym":
-                start = value.find('"')
-                if start == -1:
-                    continue
-                st = start + 1
-                while -1 != value.find('\\"', st):
-                    st = value.find('\\"', st) + 2
-                end = value.find('"', st)
-                if end == -1:
-                    continue
-                synonym = value[start + 1:end].replace('\\"', '"')
-                if synonym and synonym != '.':
-                    term.add_synonym(synonym)
-                    if end + 1 < len(value) and -1 != value[end + 1:].find('FORMULA'):
-                        term.add_xref(FORMULA, synonym)
-            elif prefix == "xref":
-                value = value.strip()
-                if not value:
-                    continue
-                comment = value.find('"')
-                if comment != - 1:
-                    value = value[:comment]
-                modifier = value.find("{")
-                if modifier != -1:
-                    value = value[:modifier]
-                colon = value.find(':')
-                if -1 != colon:
-                    db_name = value[:colon]
-                    value = value[colon + 1:].strip()
-                    if db_name and value:
-                        term.add_xref(db_name, value)
-    if term:
+    for term, rels in iter_obo(obo_file, relationships=relationships, onto=ontology):
         ontology.add_term(term)
+        for (subj, rel, obj) in rels:
+            ontology.add_relationship(subj, rel, obj)
     return ontology
 
 
+def _get_terms_to_keep(onto, terms_collection, relationships=None, min_deepness=None):
+    terms_to_keep = set()
+    for term in terms_collection:
+        if term in terms_to_keep:
+            continue
+        terms_to_keep |= onto.get_sub_tree(term, relationships=relationships)
+        for ancestor in onto.get_generalized_ancestors(term, direct=False, checked=set(), relationships=relationships,
+                                                       depth=min_deepness):
+            terms_to_keep |= onto.get_sub_tree(ancestor, relationships=relationships)
+    return terms_to_keep
+
+
 def filter_ontology(onto, terms_collection, relationships=None, min_deepness=None):
     """
     Filters a given ontology by removing the terms that are not in the given collection, nor their/ or their
@@ -125,23 +95,29 @@ def filter_ontology(onto, terms_collection, relationships=None, min_deepness=Non
     level of ancestry will be considered (or None to get ancestors up to root)
     :return: void, the ontology is modified inplace
     """
-    terms_to_keep = set()
-
-    for term in terms_collection:
-        if term in terms_to_keep:
-            continue
-        terms_to_keep |= onto.get_sub_tree(term, relationships=relationships)
-        for ancestor in onto.get_generalized_ancestors(term, direct=False, checked=set(), relationships=relationships,
-                                                       depth=min_deepness):
-            terms_to_keep |= onto.get_sub_tree(ancestor, relationships=relationships)
+    terms_to_keep = _get_terms_to_keep(onto, terms_collection, relationships, min_deepness)
+    onto.remove_terms([t for t in onto.get_all_terms() if t not in terms_to_keep], True)
+    onto.filter_relationships(relationships)
 
-    for term in (t for t in onto.get_all_terms() if t not in terms_to_keep):
-        onto.remove_term(term, True)
 
-    onto.filter_relationships(relationships)
+def get_filtered_view(onto, terms_collection, relationships=None, min_deepness=None):
+    """
+    Creates a filtered view of a given ontology (see mod_sbml.onto.ontology_view.OntologyView),
+    that contains the same terms and relationships as the ontology filtered with filter_ontology,
+    but leaves the ontology itself unchanged.
+    :param onto: mod_sbml.onto.obo_ontology.Ontology ontology
+    :param terms_collection: collection of terms to be kept
+    :param relationships: collection of terms to be kept (or None to keep all of them)
+    :param min_deepness: int, generalized (via specified relationships) ancestors' up to the min_deepness
+    level of ancestry will be considered (or None to get ancestors up to root)
+    :return: mod_sbml.onto.ontology_view.OntologyView view
+    """
+    return OntologyView(onto, _get_terms_to_keep(onto, terms_collection, relationships, min_deepness), relationships)
 
 
 def save_simple(onto, path):
+    if isinstance(onto, OntologyView):
+        onto = onto.to_ontology()
     processed_terms = set()
     with open(path, 'w') as f:
         f.write(TERMS_HEADER)
@@ -152,11 +128,13 @@ def save_simple(onto, path):
             processed_terms.add(id_)
             f.write(str(term))
         f.write(RELS_HEADER)
-        for rel in reduce(lambda s1, s2: s1 | s2, onto.rel_map.values(), set()):
+        for rel in onto.get_all_relationships():
             f.write("%s\t%s\t%s\n" % rel)
 
 
 def save(onto, path):
+    if isinstance(onto, OntologyView):
+        onto = onto.to_ontology()
     processed = set()
     with open(path, 'w') as f:
         f.write('format-version: 1.2\n')
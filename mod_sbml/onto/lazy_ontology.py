@@ -0,0 +1,163 @@
+from collections import defaultdict
+from collections.abc import MutableMapping
+import mmap
+
+from mod_sbml.onto.obo_ontology import Ontology, normalize, TERMS_HEADER, RELS_HEADER
+from mod_sbml.onto.term import Term, normalize_id
+
+__author__ = 'anna'
+
+FIELD_SEPARATOR = b'\t\t'
+
+# the indices that are only built when they are first accessed
+TERM_INDICES = {'name2term_ids', 'xref2term_ids', 'parent2children', 'roots'}
+RELATIONSHIP_INDICES = {'subj2rel2obj_ids', 'obj2rel2subj_ids', 'rel2subj_ids'}
+
+
+class LazyTermMap(MutableMapping):
+    """
+    Dict {key: term} whose terms are only created when they are accessed.
+    """
+
+    def __init__(self, key2t_id, get_term):
+        """
+        :param key2t_id: dict {key: id of the term (to be created by get_term) or the term itself}
+        :param get_term: function that returns the term with the given id
+        """
+        self._key2t_id = key2t_id
+        self._get_term = get_term
+
+    def __getitem__(self, key):
+        value = self._key2t_id[key]
+        return self._get_term(value) if isinstance(value, str) else value
+
+    def __setitem__(self, key, term):
+        self._key2t_id[key] = term
+
+    def __delitem__(self, key):
+        del self._key2t_id[key]
+
+    def __contains__(self, key):
+        return key in self._key2t_id
+
+    def __iter__(self):
+        return iter(self._key2t_id)
+
+    def __len__(self):
+        return len(self._key2t_id)
+
+
+class LazyOntology(Ontology):
+    """
+    Ontology read from a file in the simple tab-delimited format (see mod_sbml.onto.save_simple),
+    that at startup only indexes the file offsets of the term lines by term id and alternative id.
+    A term is created from its line when it is first accessed;
+    the name, xref and hierarchy indices are built (from the term lines, without creating the terms)
+    when they are first needed, and the relationships are read when they are first needed.
+    """
+
+    def __init__(self, path):
+        """
+        Indexes the term lines of the given ontology file.
+        :param path: path to the ontology file in the simple tab-delimited format
+        """
+        self._path = path
+        self._cache = {}
+        self._t_id2term = {}
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._t_id2offset, self._rels_offset = {}, None
+        alt_id2t_id = {}
+        terms_header, rels_header = TERMS_HEADER.encode(), RELS_HEADER.encode()
+        offset, in_terms = 0, False
+        for line in iter(self._mmap.readline, b''):
+            if line == terms_header:
+                in_terms = True
+            elif line == rels_header:
+                in_terms = False
+                self._rels_offset = offset + len(line)
+            elif in_terms and line.strip():
+                t_id, alt_ids = line.split(FIELD_SEPARATOR, 2)[:2]
+                t_id = normalize_id(t_id.decode('utf-8'))
+                self._t_id2offset[t_id] = offset
+                alt_id2t_id[t_id] = t_id
+                for alt_id in alt_ids.decode('utf-8').split('\t'):
+                    alt_id = normalize_id(alt_id)
+                    if alt_id:
+                        alt_id2t_id[alt_id] = t_id
+            offset += len(line)
+        self.id2term = LazyTermMap({t_id: t_id for t_id in self._t_id2offset.keys()}, self._get_term)
+        self.alt_id2term = LazyTermMap(alt_id2t_id, self._get_term)
+
+    def __reduce__(self):
+        # a pickled lazy ontology is loaded as a regular one
+        state = {name: getattr(self, name) for name in TERM_INDICES | RELATIONSHIP_INDICES}
+        state['id2term'] = dict(self.id2term.items())
+        state['alt_id2term'] = dict(self.alt_id2term.items())
+        return Ontology.__new__, (Ontology,), state
+
+    def __getattr__(self, name):
+        if name in TERM_INDICES:
+            self._index_terms()
+        elif name in RELATIONSHIP_INDICES:
+            self._read_relationships()
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
+
+    def _read_line(self, offset):
+        end = self._mmap.find(b'\n', offset)
+        return self._mmap[offset: end if end != -1 else len(self._mmap)].decode('utf-8')
+
+    def _get_term(self, t_id):
+        if t_id not in self._t_id2term:
+            term = Term(onto=None, s=self._read_line(self._t_id2offset[t_id]))
+            term.onto = self
+            self._t_id2term[t_id] = term
+        return self._t_id2term[t_id]
+
+    def _index_terms(self):
+        """
+        Builds the name, xref and hierarchy indices from the term lines (without creating the terms).
+        """
+        name2term_ids, xref2term_ids, parent2children = defaultdict(set), defaultdict(set), defaultdict(set)
+        root_ids = []
+        for t_id, offset in self._t_id2offset.items():
+            _, _, name, synonyms, parent_ids, xrefs = self._read_line(offset).split('\t\t')
+            for it in synonyms.split('\t') + [name]:
+                it = normalize(it.strip())
+                if it:
+                    name2term_ids[it].add(t_id)
+            has_parents = False
+            for parent_id in parent_ids.split('\t'):
+                parent_id = normalize_id(parent_id)
+                if parent_id:
+                    parent2children[parent_id].add(t_id)
+                    has_parents = True
+            if not has_parents:
+                root_ids.append(t_id)
+            for db_values in xrefs.split(';\t;'):
+                values = db_values.split('\t')
+                if len(values) > 1:
+                    db = values[0].strip().lower().replace(' ', '.')
+                    for value in values[1:]:
+                        value = value.strip().lower()
+                        if db and value:
+                            xref2term_ids[value].add(t_id)
+                            xref2term_ids['%s:%s' % (db, value)].add(t_id)
+        self.__dict__.update(name2term_ids=name2term_ids, xref2term_ids=xref2term_ids,
+                             parent2children=parent2children, roots={self.id2term[t_id] for t_id in root_ids})
+
+    def _read_relationships(self):
+        """
+        Reads the relationships from the relationship section of the file.
+        """
+        self.__dict__.update(subj2rel2obj_ids={}, obj2rel2subj_ids={}, rel2subj_ids={})
+        if self._rels_offset is None:
+            return
+        self._mmap.seek(self._rels_offset)
+        for line in iter(self._mmap.readline, b''):
+            line = line.decode('utf-8')
+            if line.strip():
+                subj, rel, obj = line.splitlines()[0].split('\t')
+                Ontology.add_relationship(self, subj, rel, obj)
@@ -4,27 +4,81 @@ from collections import defaultdict
 from functools import reduce
 
 from natsort import natsorted
+import numpy as np
 
-from mod_sbml.utils.misc import remove_from_map
+from mod_sbml.onto.traversal import get_closure, get_post_order, bfs
+from mod_sbml.utils.misc import remove_from_map, UnionFind
 
 PART_OF = "part_of"
 
+RELS_HEADER = '[Relationships]\n'
+TERMS_HEADER = '[Terms]\n'
+
+DESCENDANTS = 'descendants'
+ANCESTORS = 'ancestors'
+GENERALIZED_PART_OF = 'generalized_part_of'
+PART_OF_CLOSURE = 'part_of_closure'
+LEVELS = 'levels'
+GENERALIZED_DESCENDANTS = 'generalized_descendants'
+GENERALIZED_ANCESTORS = 'generalized_ancestors'
+EQUIVALENCE_CLASSES = 'equivalence_classes'
+EQUIVALENT_IDS = 'equivalent_ids'
+XREF_RANKING = 'xref_ranking'
+NAME_RANKING = 'name_ranking'
+TERM_INDEX = 'term_index'
+DESCENDANT_VECTORS = 'descendant_vectors'
+
 __author__ = 'anna'
 
 
+EMPTY = frozenset()
+
+
 def normalize(name):
     return ''.join(e for e in name if e.isalnum()).lower()
 
 
+def get_term_keys(term):
+    """
+    Lists the keys a term is indexed by for the name and xref lookups (see Ontology.get_term).
+    :param term: mod_sbml.onto.term.Term term
+    :return: tuple (set of normalized names and synonyms, set of xref keys: values and db:value pairs)
+    """
+    names = {it for it in (normalize(name) for name in term.get_synonyms() | {term.get_name()} if name) if it}
+    xrefs = set()
+    for db in term.get_dbs():
+        for value in term.get_xrefs(db):
+            value = value.lower()
+            xrefs |= {value, '%s:%s' % (db, value)}
+    return names, xrefs
+
+
 class Ontology(object):
     def __init__(self):
         self.roots = set()
         self.id2term = {}
         self.alt_id2term = {}
         self.name2term_ids = defaultdict(set)
-        self.rel_map = defaultdict(set)
+        # relationships, indexed by role: {subj: {rel: {obj}}}, {obj: {rel: {subj}}}, {rel: {subj}}
+        self.subj2rel2obj_ids = {}
+        self.obj2rel2subj_ids = {}
+        self.rel2subj_ids = {}
         self.xref2term_ids = defaultdict(set)
         self.parent2children = defaultdict(set)
+        # derived indices (e.g. transitive closures), built lazily and dropped on any modification
+        self._cache = {}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_cache'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._cache = {}
+
+    def _invalidate(self):
+        self._cache.clear()
 
     def get_all_terms(self):
         return list(self.id2term.values())
@@ -36,125 +90,204 @@ class Ontology(object):
         return set(self.id2term.keys())
 
     def add_relationship(self, subj, rel, obj):
-        relationship = (subj, rel, obj)
-        self.rel_map[subj].add(relationship)
-        self.rel_map[obj].add(relationship)
-        self.rel_map[rel].add(relationship)
+        self._invalidate()
+        self.subj2rel2obj_ids.setdefault(subj, {}).setdefault(rel, set()).add(obj)
+        self.obj2rel2subj_ids.setdefault(obj, {}).setdefault(rel, set()).add(subj)
+        self.rel2subj_ids.setdefault(rel, set()).add(subj)
+
+    def _remove_relationship(self, subj, rel, obj):
+        rel2obj_ids = self.subj2rel2obj_ids.get(subj)
+        if not rel2obj_ids or rel not in rel2obj_ids or obj not in rel2obj_ids[rel]:
+            return
+        remove_from_map(rel2obj_ids, rel, obj)
+        if not rel2obj_ids:
+            del self.subj2rel2obj_ids[subj]
+        if rel not in rel2obj_ids:
+            remove_from_map(self.rel2subj_ids, rel, subj)
+        rel2subj_ids = self.obj2rel2subj_ids[obj]
+        remove_from_map(rel2subj_ids, rel, subj)
+        if not rel2subj_ids:
+            del self.obj2rel2subj_ids[obj]
+
+    @staticmethod
+    def _get_role_relationships(term_id, rel2ids, rel, as_subject):
+        if not rel2ids:
+            return
+        for r, ids in ((rel, rel2ids.get(rel, EMPTY)),) if rel else rel2ids.items():
+            for it in ids:
+                yield (term_id, r, it) if as_subject else (it, r, term_id)
 
     # role: 0 for any, 1 for subj, 2 for obj
     def get_term_relationships(self, term_id, rel=None, role=0):
-        if not (term_id in self.rel_map):
-            return iter(())
-        relationships = set(self.rel_map[term_id])
-        if rel:
-            relationships = ((subj, r, obj) for (subj, r, obj) in relationships if rel == r)
-        if 1 == role:
-            relationships = ((subj, r, obj) for (subj, r, obj) in relationships if term_id == subj)
-        if 2 == role:
-            relationships = ((subj, r, obj) for (subj, r, obj) in relationships if term_id == obj)
-        return relationships
+        """
+        Lists the relationships the term with the given id participates in.
+        :param term_id: id of the term of interest
+        :param rel: relationship of interest (or None for any)
+        :param role: 0 for any role of the term in the relationship, 1 for subject, 2 for object
+        :return: list of (subject_id, relationship, object_id) tuples
+        """
+        result = []
+        if 2 != role:
+            result.extend(self._get_role_relationships(term_id, self.subj2rel2obj_ids.get(term_id), rel, True))
+        if 1 != role:
+            result.extend(it for it in self._get_role_relationships(term_id, self.obj2rel2subj_ids.get(term_id),
+                                                                    rel, False)
+                          # a relationship of a term to itself was already listed above
+                          if 0 != role or it[0] != term_id)
+        return result
 
     def get_relationship_participants(self, rel):
-        return set(self.rel_map[rel])
+        return {(subj, rel, obj) for subj in self.rel2subj_ids.get(rel, EMPTY)
+                for obj in self.subj2rel2obj_ids[subj][rel]}
 
     def get_relationships(self):
-        result = set()
-        for rel_set in self.rel_map.values():
-            result |= {rel for (subj, rel, obj) in rel_set}
-        return result
+        return set(self.rel2subj_ids.keys())
+
+    def get_all_relationships(self):
+        """
+        Iterates over all the relationships of this ontology.
+        :return: generator of (subject_id, relationship, object_id) tuples
+        """
+        for subj, rel2obj_ids in self.subj2rel2obj_ids.items():
+            for rel, obj_ids in rel2obj_ids.items():
+                for obj in obj_ids:
+                    yield subj, rel, obj
+
+    @property
+    def rel_map(self):
+        """
+        Relationships in the form {term_id or relationship: {(subject_id, relationship, object_id)}},
+        calculated on demand (kept for compatibility, use get_term_relationships or get_all_relationships instead).
+        """
+        rel_map = defaultdict(set)
+        for relationship in self.get_all_relationships():
+            subj, rel, obj = relationship
+            rel_map[subj].add(relationship)
+            rel_map[obj].add(relationship)
+            rel_map[rel].add(relationship)
+        return rel_map
 
     def add_term(self, term):
         if not term:
             return
+        self._invalidate()
         t_id = term.get_id()
         self.id2term[t_id] = term
         for alt_id in term.get_all_ids():
             alt_id = alt_id
             self.alt_id2term[alt_id] = term
-        names = set(term.get_synonyms())
-        names.add(term.get_name())
+        names, xrefs = get_term_keys(term)
         for name in names:
-            name = normalize(name)
-            if name:
-                self.name2term_ids[name].add(t_id)
+            self.name2term_ids[name].add(t_id)
+        if term.onto is None:
+            term.onto = self
+        for parent_id in term.parent_ids:
+            self.parent2children[parent_id].add(t_id)
         if not term.get_parent_ids():
             self.roots.add(term)
-        for db in term.get_dbs():
-            for value in term.get_xrefs(db):
-                value = value.lower()
-                self.xref2term_ids[value].add(t_id)
-                self.xref2term_ids['%s:%s' % (db, value)].add(t_id)
+        for xref in xrefs:
+            self.xref2term_ids[xref].add(t_id)
 
     def filter_relationships(self, rel_to_keep):
-        to_remove = set()
-        for rel_set in self.rel_map.values():
-            for (subj, rel, obj) in rel_set:
-                if rel not in rel_to_keep:
-                    to_remove.add((subj, rel, obj))
-        for (subj, rel, obj) in to_remove:
-            if subj in self.rel_map:
-                self.rel_map[subj] -= {(subj, rel, obj)}
-                if not self.rel_map[subj]:
-                    del self.rel_map[subj]
-            if obj in self.rel_map:
-                self.rel_map[obj] -= {(subj, rel, obj)}
-                if not self.rel_map[obj]:
-                    del self.rel_map[obj]
+        """
+        Removes the relationships that are not in the given collection.
+        :param rel_to_keep: collection of relationships to be kept (or None to keep all of them)
+        :return: void
+        """
+        if rel_to_keep is None:
+            return
+        self._invalidate()
+        for rel in self.get_relationships() - set(rel_to_keep):
+            for (subj, r, obj) in self.get_relationship_participants(rel):
+                self._remove_relationship(subj, r, obj)
 
     def remove_term(self, term, brutally=False):
-        if not term:
+        """
+        Removes the given term from this ontology (see remove_terms).
+        :param term: term to be removed
+        :param brutally: if True, the children of the removed term lose it as a parent without getting new parents,
+        otherwise they get its parents instead
+        :return: void
+        """
+        if term:
+            self.remove_terms([term], brutally)
+
+    def remove_terms(self, terms, brutally=False):
+        """
+        Removes the given terms from this ontology, together with their relationships.
+        The children and the indices are updated once for all the removed terms.
+        :param terms: collection of terms to be removed
+        :param brutally: if True, the kept children of the removed terms lose them as parents
+        without getting new parents, otherwise they get the closest kept ancestors instead
+        :return: void
+        """
+        t_id2term = {term.get_id(): term for term in terms if term}
+        if not t_id2term:
             return
-        t_id = term.get_id()
-        if t_id in self.id2term:
-            del self.id2term[t_id]
-        for alt_id in term.get_all_ids():
-            if alt_id in self.alt_id2term:
-                del self.alt_id2term[alt_id]
-        names = set(term.get_synonyms())
-        names.add(term.get_name())
-        for name in names:
-            name = normalize(name)
-            if name and name in self.name2term_ids:
-                self.name2term_ids[name] -= {t_id}
-                if not self.name2term_ids[name]:
-                    del self.name2term_ids[name]
-        for db in term.get_dbs():
-            for value in term.get_xrefs(db):
-                value = value.lower()
-                self.xref2term_ids[value] -= {t_id}
-                if not self.xref2term_ids[value]:
-                    del self.xref2term_ids[value]
-                db_value = '%s:%s' % (db, value)
-                self.xref2term_ids[db_value] -= {t_id}
-                if not self.xref2term_ids[db_value]:
-                    del self.xref2term_ids[db_value]
-        parents = term.get_parent_ids()
-        if not parents:
-            self.roots -= {term}
-        child_ids = self.get_descendants(t_id)
-        for child_id in child_ids:
-            child = self.get_term(child_id)
-            if not child:
+        self._invalidate()
+        removed_ids = set()
+        for term in t_id2term.values():
+            removed_ids |= term.get_all_ids()
+
+        def get_removed_term_id(t_id):
+            term = self.get_term(t_id)
+            return term.get_id() if term and term.get_id() in t_id2term else None
+
+        # the closest kept (or unknown) ancestors of the removed terms, parents before children
+        t_id2replacement_ids = {}
+        if not brutally:
+            def get_removed_parent_ids(t_id):
+                return [it for it in (get_removed_term_id(p_id) for p_id in t_id2term[t_id].parent_ids) if it]
+
+            for t_id in get_post_order(t_id2term.keys(), get_removed_parent_ids):
+                replacement_ids = set()
+                for p_id in t_id2term[t_id].parent_ids:
+                    removed_p_id = get_removed_term_id(p_id)
+                    if removed_p_id:
+                        # a replacement is missing only if there is a cycle in the hierarchy
+                        replacement_ids |= t_id2replacement_ids.get(removed_p_id, EMPTY)
+                    else:
+                        replacement_ids.add(p_id)
+                t_id2replacement_ids[t_id] = replacement_ids
+
+        child_ids = set()
+        for r_id in removed_ids:
+            child_ids |= self.parent2children.get(r_id, EMPTY)
+        for child in (self.get_term(c_id) for c_id in child_ids):
+            if not child or child.get_id() in t_id2term:
                 continue
-            child.parent_ids -= term.get_all_ids()
+            parent_ids = {p_id for p_id in child.parent_ids if p_id not in removed_ids}
             if not brutally:
-                child.parent_ids |= parents
-            if not child.parent_ids:
+                for p_id in child.parent_ids:
+                    if p_id in removed_ids:
+                        parent_ids |= t_id2replacement_ids.get(get_removed_term_id(p_id), EMPTY)
+            child.set_parent_ids(parent_ids)
+            for p_id in parent_ids:
+                self.parent2children[p_id].add(child.get_id())
+            if not parent_ids:
                 self.roots.add(child)
-        if t_id in self.parent2children:
-            del self.parent2children[t_id]
-            for par_id in parents:
-                self.parent2children[par_id] -= {t_id}
-                if not brutally:
-                    self.parent2children[par_id] |= child_ids
 
-        for (subj, rel, obj) in self.get_term_relationships(t_id):
-            if t_id == subj and t_id != obj:
-                remove_from_map(self.rel_map, obj, (subj, rel, obj))
-            elif t_id == obj:
-                remove_from_map(self.rel_map, subj, (subj, rel, obj))
-        if t_id in self.rel_map:
-            del self.rel_map[t_id]
+        names, xrefs, removed_t_ids = set(), set(), set(t_id2term.keys())
+        for t_id, term in t_id2term.items():
+            for r_id in term.get_all_ids():
+                self.parent2children.pop(r_id, None)
+                self.alt_id2term.pop(r_id, None)
+            for p_id in term.parent_ids:
+                if p_id in self.parent2children:
+                    self.parent2children[p_id].discard(t_id)
+            self.id2term.pop(t_id, None)
+            self.roots.discard(term)
+            term_names, term_xrefs = get_term_keys(term)
+            names |= term_names
+            xrefs |= term_xrefs
+            for (subj, rel, obj) in self.get_term_relationships(t_id):
+                self._remove_relationship(subj, rel, obj)
+        for key2term_ids, keys in ((self.name2term_ids, names), (self.xref2term_ids, xrefs)):
+            for key in keys:
+                if key in key2term_ids:
+                    key2term_ids[key] -= removed_t_ids
+                    if not key2term_ids[key]:
+                        del key2term_ids[key]
 
     def get_term(self, key, check_only_ids=True):
         """
@@ -172,37 +305,200 @@ class Ontology(object):
         """
         if not key:
             return None
-        key = key.lower().strip()
+        return self._get_term_by_key(key.lower().strip(), check_only_ids)
+
+    def get_terms(self, keys, check_only_ids=True):
+        """
+        Looks for the terms corresponding to the given keys (see get_term).
+        The keys are normalized once, and the keys that are the same after normalization are only looked for once.
+        :param keys: iterable of str keys, by default the terms' ids or alternative ids.
+        :param check_only_ids: boolean, optional. If set to False (by default it's True),
+        the keys are also looked for in term names and xrefs.
+        :return: dict {key: term (instance of class mod_sbml.onto.term.Term) or None if no term was found}
+        """
+        norm_key2term = {}
+        key2term = {}
+        for key in keys:
+            if key in key2term:
+                continue
+            norm_key = key.lower().strip() if key else None
+            if norm_key not in norm_key2term:
+                norm_key2term[norm_key] = self._get_term_by_key(norm_key, check_only_ids) if norm_key else None
+            key2term[key] = norm_key2term[norm_key]
+        return key2term
+
+    def _get_term_by_key(self, key, check_only_ids):
+        """
+        Looks for a term corresponding to the given (lower-cased and stripped) key (see get_term).
+        """
         if key in self.id2term:
             return self.id2term[key]
         if key in self.alt_id2term:
             return self.alt_id2term[key]
         if not check_only_ids:
-            if key in self.xref2term_ids:
-                for t_id in natsorted(self.xref2term_ids[key], key=lambda y: y.lower()):
-                    if t_id in self.id2term:
-                        return self.id2term[t_id]
-            key = normalize(key)
-            if key in self.name2term_ids:
-                for t_id in natsorted(self.name2term_ids[key], key=lambda y: y.lower()):
-                    if t_id in self.id2term:
-                        return self.id2term[t_id]
+            term = self._get_best_candidate(XREF_RANKING, self.xref2term_ids, key)
+            if not term:
+                term = self._get_best_candidate(NAME_RANKING, self.name2term_ids, normalize(key))
+            return term
         return None
 
+    def _get_best_candidate(self, cache_key, key2term_ids, key):
+        """
+        Returns the first existing term (in the natural order of ids) among the ones matching the given key
+        in the given index. The only candidate of a key is returned without being ranked.
+        """
+        t_ids = key2term_ids.get(key, EMPTY) if key else EMPTY
+        if 1 == len(t_ids):
+            return self.id2term.get(next(iter(t_ids)), None)
+        for t_id in self._get_ranked_term_ids(cache_key, key2term_ids, key):
+            if t_id in self.id2term:
+                return self.id2term[t_id]
+        return None
+
+    def _get_ranked_term_ids(self, cache_key, key2term_ids, key):
+        """
+        Returns the ids of the terms matching the given key in the given index, naturally sorted.
+        The sorted id tuples are calculated once per key and cached until the ontology is modified.
+        """
+        if not key or key not in key2term_ids:
+            return EMPTY
+        key2ranked_ids = self._cache.setdefault(cache_key, {})
+        if key not in key2ranked_ids:
+            key2ranked_ids[key] = tuple(natsorted(key2term_ids[key], key=lambda y: y.lower()))
+        return key2ranked_ids[key]
+
     def get_descendants(self, term_id, direct=True):
-        result = set(self.parent2children[term_id])
         if direct:
-            return result
-        for child_id in self.parent2children[term_id]:
-            result |= self.get_descendants(child_id, False)
-        return result
+            return set(self.parent2children[term_id])
+        return set(self._get_descendant_closure(term_id))
+
+    def _get_closure(self, cache_key, term_id, get_next_ids):
+        """
+        Returns the (cached) frozen set of ids of all the terms reachable from the term with the given id
+        via the edges given by get_next_ids (see mod_sbml.onto.traversal.get_closure).
+        """
+        return get_closure(self._cache.setdefault(cache_key, {}), term_id, get_next_ids)
+
+    def _get_parent_ids(self, term_id):
+        term = self.get_term(term_id)
+        return term.parent_ids if term else EMPTY
+
+    def _get_child_ids(self, term_id):
+        return self.parent2children.get(term_id, EMPTY)
+
+    def _get_descendant_closure(self, term_id):
+        return self._get_closure(DESCENDANTS, term_id, self._get_child_ids)
+
+    def _get_ancestor_closure(self, term_id):
+        return self._get_closure(ANCESTORS, term_id, self._get_parent_ids)
+
+    def _get_part_of_closure(self, term_id):
+        """
+        Returns the (cached) frozen set of ids of the terms the term with the given id is a part of, i.e.
+        the terms reachable from it via is_a and part_of relationships, excluding its is_a ancestors,
+        unless they are also reachable as an object of a part_of relationship.
+        """
+        t_id2wholes = self._cache.setdefault(PART_OF_CLOSURE, {})
+        if term_id in t_id2wholes:
+            return t_id2wholes[term_id]
+
+        def get_whole_ids(t_id):
+            return {obj for (subj, r, obj) in self.get_term_relationships(t_id, PART_OF, role=1)}
+
+        def get_next_ids(t_id):
+            return set(self._get_parent_ids(t_id)) | get_whole_ids(t_id)
+
+        reachable = self._get_closure(GENERALIZED_PART_OF, term_id, get_next_ids)
+        ancestors = self._get_ancestor_closure(term_id)
+        whole_ids = get_whole_ids(term_id)
+        for t_id in reachable:
+            whole_ids |= get_whole_ids(t_id)
+        t_id2wholes[term_id] = frozenset(t_id for t_id in reachable if t_id not in ancestors or t_id in whole_ids)
+        return t_id2wholes[term_id]
+
+    def build_descendant_index(self):
+        """
+        Precomputes the transitive closure of the is_a hierarchy of this ontology,
+        so that is_a and get_descendants(..., direct=False) queries are answered without graph traversal.
+        The index is dropped whenever the ontology is modified, and then rebuilt lazily term by term.
+        :return: void
+        """
+        for t_id in list(self.parent2children.keys()):
+            self._get_descendant_closure(t_id)
 
     def is_a(self, child_id, parent_id):
-        return child_id and child_id.lower() in self.get_descendants(parent_id, False)
+        return child_id and child_id.lower() in self._get_descendant_closure(parent_id)
+
+    def _get_term_index(self):
+        """
+        Returns the (cached) dict {term id: position} numbering the terms of this ontology
+        (the positions of the descendant vectors, see get_is_a_matrix).
+        """
+        if TERM_INDEX not in self._cache:
+            self._cache[TERM_INDEX] = {t_id: i for (i, t_id) in enumerate(self.id2term.keys())}
+        return self._cache[TERM_INDEX]
+
+    def _get_descendant_vector(self, parent_id):
+        """
+        Returns the (cached) numpy boolean vector that tells for each term of this ontology (see _get_term_index)
+        if it is a descendant of the term with the given id, the extra last position stands for the unknown terms.
+        """
+        id2vector = self._cache.setdefault(DESCENDANT_VECTORS, {})
+        if parent_id not in id2vector:
+            t_id2index = self._get_term_index()
+            vector = np.zeros(len(t_id2index) + 1, dtype=bool)
+            vector[np.array([t_id2index[t_id] for t_id in self._get_descendant_closure(parent_id)
+                             if t_id in t_id2index], dtype=int)] = True
+            id2vector[parent_id] = vector
+        return id2vector[parent_id]
+
+    def get_is_a_matrix(self, child_ids, parent_ids):
+        """
+        Checks at once which of the given terms are descendants of which of the given parent terms (see is_a).
+        The descendants of each parent term are cached as a boolean vector over all the terms of this ontology,
+        so that a check only picks the positions of the child terms in those vectors.
+        :param child_ids: list of ids of the potential child terms
+        :param parent_ids: list of ids of the potential parent terms
+        :return: numpy boolean array of shape (len(child_ids), len(parent_ids)),
+        whose element [i, j] tells if the i-th child term is_a the j-th parent term
+        """
+        t_id2index = self._get_term_index()
+        unknown = len(t_id2index)
+        indices = np.array([t_id2index.get(t_id.lower(), unknown) if t_id else unknown for t_id in child_ids],
+                           dtype=int)
+        matrix = np.zeros((len(indices), len(parent_ids)), dtype=bool)
+        for j, parent_id in enumerate(parent_ids):
+            matrix[:, j] = self._get_descendant_vector(parent_id.lower())[indices]
+        return matrix
+
+    def get_part_of_matrix(self, part_ids, whole_ids):
+        """
+        Checks at once which of the given terms are parts of which of the given whole terms
+        (as part_of does for a single whole term).
+        :param part_ids: list of ids of the potential part terms
+        :param whole_ids: list of ids of the potential whole terms
+        :return: numpy boolean array of shape (len(part_ids), len(whole_ids)),
+        whose element [i, j] tells if the i-th term is a part of the j-th whole term
+        """
+        whole_id2indices = defaultdict(list)
+        for j, whole_id in enumerate(whole_ids):
+            whole_id2indices[whole_id.lower().strip()].append(j)
+        matrix = np.zeros((len(part_ids), len(whole_ids)), dtype=bool)
+        for i, part_id in enumerate(part_ids):
+            part = self.get_term(part_id)
+            if part:
+                # the direct wholes of a term are among the terms it is a part of
+                for whole_id in self._get_part_of_closure(part.get_id()) & whole_id2indices.keys():
+                    matrix[i, whole_id2indices[whole_id]] = True
+        return matrix
 
     def part_of(self, part_id, whole_ids):
         """
-        Checks if a term with id part_id is a part of any of the terms with ids in whole_ids
+        Checks if a term with id part_id is a part of any of the terms with ids in whole_ids.
+        If the term is directly part_of some of the whole terms, only those are returned;
+        otherwise the terms reachable from it via is_a and part_of relationships are considered,
+        excluding its is_a ancestors (unless they are reached via part_of).
+        The reachable terms are cached, so that repeated queries are set intersections.
         :param part_id: id of the part term
         :param whole_ids: ids of the potential whole terms
         :return: ids of the terms among whole_ids that has_part part_id
@@ -210,72 +506,124 @@ class Ontology(object):
         part = self.get_term(part_id)
         if not part:
             return None
-        part_of_rel = lambda t_id: {obj for (subj, r, obj) in self.get_term_relationships(t_id, PART_OF, role=1)}
         whole_ids = {t_id.lower().strip() for t_id in whole_ids}
-        result = whole_ids & part_of_rel(part_id)
+        result = whole_ids & {obj for (subj, r, obj) in self.get_term_relationships(part.get_id(), PART_OF, role=1)}
         if result:
             return result
-        term_set = {part}
-        result = set()
-        while term_set:
-            items = set()
-            for term in term_set:
-                parents = term.get_parent_ids()
-                wholes = part_of_rel(term.get_id())
-                candidates = parents | wholes
-                for candidate_id in candidates:
-                    if (candidate_id in whole_ids) and not self.is_a(part_id, candidate_id):
-                        result.add(candidate_id)
-                        continue
-                    candidate = self.get_term(candidate_id)
-                    result |= whole_ids & part_of_rel(candidate_id)
-                    result |= {t_id for t_id in set(whole_ids) & candidate.get_parent_ids() if
-                               not self.is_a(part_id, t_id)}
-                    items.add(candidate)
-            term_set = items
-        return result
+        return whole_ids & self._get_part_of_closure(part.get_id())
 
     def get_ancestors(self, term, direct=True, rel=None, checked=None):
-        if not checked:
-            checked = set()
-        parents = term.get_parent_ids() if not rel else {obj for (subj, rel, obj) in
-                                                         self.get_term_relationships(term.get_id(), rel, 1)}
-        direct_parents = set(map(lambda t_id: self.get_term(t_id), parents))
         if direct:
-            return direct_parents
-        result = set(direct_parents)
-        checked.add(term)
-        for parent in direct_parents:
-            if not (parent in checked):
-                result |= self.get_ancestors(parent, direct, rel, checked)
-        return result
+            parents = self._get_parent_ids(term.get_id()) if not rel else \
+                {obj for (subj, r, obj) in self.get_term_relationships(term.get_id(), rel, 1)}
+            return {self.get_term(t_id) for t_id in parents}
+        if checked:
+            # the ancestors of the already checked terms are not explored
+            return bfs([term], lambda it: self.get_ancestors(it, True, rel) - {None}, expanded=checked)
+        if rel:
+            ancestor_ids = self._get_closure((ANCESTORS, rel), term.get_id(),
+                                             lambda t_id: {obj for (subj, r, obj) in
+                                                           self.get_term_relationships(t_id, rel, 1)})
+        else:
+            ancestor_ids = self._get_ancestor_closure(term.get_id())
+        return {it for it in (self.get_term(t_id) for t_id in ancestor_ids) if it}
+
+    def _get_levels(self):
+        """
+        Calculates (once, in topological order) the levels of all the terms:
+        0 for terms without (known) parents, parent levels + 1 for the others.
+        :return: dict {term_id: frozenset of levels}
+        """
+        if LEVELS in self._cache:
+            return self._cache[LEVELS]
+
+        t_id2parent_ids = {t_id: [parent.get_id() for parent in
+                                  (self.get_term(p_id) for p_id in self._get_parent_ids(t_id)) if parent]
+                           for t_id in self.id2term.keys()}
+        t_id2levels = {}
+        for t_id in get_post_order(self.id2term.keys(), lambda it: t_id2parent_ids[it]):
+            parent_ids = t_id2parent_ids[t_id]
+            if not parent_ids:
+                t_id2levels[t_id] = frozenset([0])
+                continue
+            # a parent is missing only if there is a cycle in the hierarchy
+            t_id2levels[t_id] = frozenset(level + 1 for p_id in parent_ids if p_id in t_id2levels
+                                          for level in t_id2levels[p_id])
+        self._cache[LEVELS] = t_id2levels
+        return t_id2levels
 
     def get_t_id2level(self):
-        t_id2level = defaultdict(set)
-
-        def _update_level(t_id, cur_level):
-            t_id2level[t_id].add(cur_level)
-            for it in self.get_descendants(t_id, True):
-                _update_level(it, cur_level + 1)
-
-        for t in self.roots:
-            _update_level(t.get_id(), 0)
-
-        return t_id2level
+        """
+        Calculates the levels of the terms: 0 for roots, parent levels + 1 for the others.
+        :return: dict {term_id: set of levels}
+        """
+        return defaultdict(set, ((t_id, set(levels)) for (t_id, levels) in self._get_levels().items()))
 
     def get_level(self, term):
-        parents = self.get_ancestors(term)
-        if not parents:
-            return [0]
-        level = set()
-        for p in parents:
-            level |= set(self.get_level(p))
-        return [1 + i for i in level]
+        """
+        Calculates the levels of the term: 0 for roots, parent levels + 1 for the others.
+        :param term: term of interest
+        :return: list of levels
+        """
+        return sorted(self._get_levels().get(term.get_id(), [0]))
+
+    def get_equivalence_classes(self, relationships=None):
+        """
+        Partitions the terms of this ontology into classes of terms that are connected
+        by the given relationships (taken in any direction).
+        The classes are calculated once (with union-find) and cached until the ontology is modified.
+        :param relationships: collection of relationships of interest (or None to consider all of them)
+        :return: dict {term_id: frozenset of ids of the terms in its class},
+        contains only the terms participating in at least one of the relationships
+        """
+        key = (EQUIVALENCE_CLASSES, frozenset(relationships) if relationships else None)
+        if key in self._cache:
+            return self._cache[key]
+        classes = UnionFind()
+        for rel in (relationships if relationships else self.get_relationships()):
+            for (subj, r, obj) in self.get_relationship_participants(rel):
+                subj_term, obj_term = self.get_term(subj), self.get_term(obj)
+                if subj_term and obj_term:
+                    classes.union(subj_term.get_id(), obj_term.get_id())
+        self._cache[key] = classes.get_classes()
+        return self._cache[key]
+
+    def get_equivalent_id_map(self, relationships=None):
+        """
+        Maps the ids (including the alternative ones) of the terms of this ontology
+        to the ids (including the alternative ones) of all the terms in their equivalence classes
+        (see get_equivalence_classes). The ids of a class share the same frozenset.
+        The ids of the terms that have neither equivalents nor alternative ids are not included,
+        as they are only equivalent to themselves.
+        The mapping is calculated once and cached until the ontology is modified.
+        :param relationships: collection of relationships of interest (or None to consider all of them)
+        :return: dict {term id: frozenset of term ids}
+        """
+        key = (EQUIVALENT_IDS, frozenset(relationships) if relationships else None)
+        if key in self._cache:
+            return self._cache[key]
+        id2eq_ids = {}
+        for t_ids in set(self.get_equivalence_classes(relationships).values()):
+            eq_ids = frozenset().union(*(self.id2term[t_id].get_all_ids() for t_id in t_ids))
+            for t_id in eq_ids:
+                id2eq_ids[t_id] = eq_ids
+        for term in self.get_all_terms():
+            if term.altIds and term.get_id() not in id2eq_ids:
+                eq_ids = frozenset(term.get_all_ids())
+                for t_id in eq_ids:
+                    id2eq_ids[t_id] = eq_ids
+        self._cache[key] = id2eq_ids
+        return id2eq_ids
 
     def get_equivalents(self, term, rel=None, direction=0, relationships=None, checked=None):
         if not term:
             return set()
         term_id = term.get_id()
+        if rel is None and 0 == direction and checked is None:
+            t_id2class = self.get_equivalence_classes(relationships)
+            if term_id not in t_id2class:
+                return set()
+            return {self.get_term(t_id) for t_id in t_id2class[term_id] if t_id != term_id}
         if checked is None:
             checked = set()
         checked.add(term_id)
@@ -324,47 +672,94 @@ class Ontology(object):
         return self.get_generalized_descendants(t, False, set(), relationships, depth=depth) \
                | self.get_equivalents(t, None, 0, relationships) | {t}
 
-    def get_generalized_descendants(self, term, direct=True, checked=None, relationships=None, depth=None):
+    def _get_generalized_closure(self, cache_key, get_relative_ids, term_id, relationships):
+        """
+        Finds the ids of all the terms related to the given one via the given edges,
+        where equivalent terms are merged together.
+        The traversal is performed (and cached) on the graph of equivalence classes.
+        :return: frozenset of term ids
+        """
+        rel_key = frozenset(relationships) if relationships else None
+        t_id2class = self.get_equivalence_classes(relationships)
+        class2ids = self._cache.setdefault((cache_key, rel_key), {})
+
+        def get_class(t_id):
+            return t_id2class.get(t_id, None) or frozenset([t_id])
+
+        cls = get_class(term_id)
+        if cls not in class2ids:
+            def get_next_classes(t_ids):
+                result = set()
+                for t_id in t_ids:
+                    for r_id in get_relative_ids(t_id):
+                        it = self.get_term(r_id)
+                        if it:
+                            result.add(get_class(it.get_id()))
+                return result
+
+            classes = get_closure(self._cache.setdefault((cache_key, EQUIVALENCE_CLASSES, rel_key), {}),
+                                  cls, get_next_classes)
+            class2ids[cls] = frozenset().union(*classes)
+        return class2ids[cls]
+
+    def _get_generalized_relatives(self, cache_key, get_relative_ids, term, direct, checked, relationships, depth):
+        """
+        Finds (breadth-first, up to the given depth) the terms related to the given one via the given edges,
+        where equivalent terms are merged together.
+        """
+        if direct:
+            depth = 1
         if depth is not None and depth <= 0:
             return set()
-        if checked is None:
-            checked = set()
-        term2eqs = lambda t: {t} | self.get_equivalents(t, None, 0, relationships)
-        cup = lambda s1, s2: s1 | s2
-        terms = term2eqs(term)
-        direct_children = \
-            reduce(cup,
-                   (reduce(cup,
-                           (term2eqs(self.get_term(t)) for t in self.get_descendants(it.get_id(), True)),
-                           set()) for it in terms),
-                   set())
-        if direct or 1 == depth:
-            return direct_children
-        checked |= terms
-        return reduce(cup, (self.get_generalized_descendants(t, direct, checked, relationships,
-                                                             depth - 1 if depth is not None else depth)
-                            for t in direct_children - checked), direct_children)
+
+        def term2eqs(t):
+            return {t} | self.get_equivalents(t, None, 0, relationships)
+
+        # a full traversal does not depend on the (empty) checked set,
+        # which ends up containing all the met terms
+        if depth is None and not checked:
+            result = {self.id2term[t_id] for t_id in
+                      self._get_generalized_closure(cache_key, get_relative_ids, term.get_id(), relationships)}
+            if checked is not None:
+                checked |= term2eqs(term) | result
+            return result
+
+        def get_next_terms(t):
+            result = set()
+            for t_id in get_relative_ids(t.get_id()):
+                it = self.get_term(t_id)
+                # equivalent terms are added all together
+                if it and it not in result:
+                    result |= term2eqs(it)
+            return result
+
+        return bfs(term2eqs(term), get_next_terms, depth, checked)
+
+    def get_generalized_descendants(self, term, direct=True, checked=None, relationships=None, depth=None):
+        """
+        Finds the descendants of the term and of its equivalents (and the equivalents of those descendants).
+        :param term: term of interest
+        :param direct: whether only the direct children should be considered
+        :param checked: (optional) set of terms whose descendants should not be explored, it gets updated
+        :param relationships: relationships that define term equivalence
+        :param depth: maximal distance to the descendants (or None for no limit)
+        :return: set of terms
+        """
+        return self._get_generalized_relatives(GENERALIZED_DESCENDANTS, self._get_child_ids,
+                                               term, direct, checked, relationships, depth)
 
     def get_generalized_ancestors(self, term, direct=True, checked=None, relationships=None, depth=None):
-        if depth is not None and depth <= 0:
-            return set()
-        if not checked:
-            checked = set()
-        terms = {term} | self.get_equivalents(term, None, 0, relationships)
-        direct_parents = set()
-        for it in terms:
-            parents = {self.get_term(t_id) for t_id in it.get_parent_ids()}
-            direct_parents |= parents
-            for par in parents:
-                direct_parents |= self.get_equivalents(par, None, 0, relationships)
-        if direct or 1 == depth:
-            return direct_parents
-        checked |= terms
-        result = set(direct_parents)
-        for parent in direct_parents - checked:
-            result |= self.get_generalized_ancestors(parent, direct, checked, relationships,
-                                                     depth - 1 if depth is not None else depth)
-        return result
+        """
+        Finds the ancestors of the term and of its equivalents (and the equivalents of those ancestors).
+        :param term: term of interest
+        :param direct: whether only the direct parents should be considered
+        :param checked: (optional) set of terms whose ancestors should not be explored, it gets updated
+        :param relationships: relationships that define term equivalence
+        :param depth: maximal distance to the ancestors (or None for no limit)
+        :return: set of terms
+        """
+        return self._get_generalized_relatives(GENERALIZED_ANCESTORS, self._get_parent_ids,
+                                               term, direct, checked, relationships, depth)
 
     def get_generalized_ancestors_of_level(self, term, checked=None, relationships=None, depth=None):
         if depth is None:
@@ -376,7 +771,7 @@ class Ontology(object):
         terms = {term} | self.get_equivalents(term, None, 0, relationships)
         direct_parents = set()
         for it in terms:
-            parents = {self.get_term(t_id) for t_id in it.get_parent_ids()}
+            parents = {self.get_term(t_id) for t_id in self._get_parent_ids(it.get_id())}
             direct_parents |= parents
             for par in parents:
                 direct_parents |= self.get_equivalents(par, None, 0, relationships)
@@ -394,21 +789,67 @@ class Ontology(object):
         return set(self.roots)
 
     def common_points(self, terms, depth=None, relationships=None):
-        if not terms or depth is not None and depth <= 0:
-            return None
-        terms = set(terms)
-        first = terms.pop()
-        common = self.get_generalized_ancestors(term=first, direct=False, checked=set(), depth=depth, relationships=relationships) | \
-                 self.get_equivalents(first, relationships=relationships) | {
-            first}
-        for t in terms:
-            common &= self.get_generalized_ancestors(t, False, set(), depth=depth, relationships=relationships) | \
-                      self.get_equivalents(t, relationships=relationships) | {t}
-        result = set(common)
-        return [it for it in common
-                if not self.get_generalized_descendants(it, False, set(), relationships=relationships) & result]
+        """
+        Finds the most specific common generalized ancestors of the given terms
+        (a term itself and its equivalents count as its ancestors).
+        :param terms: collection of terms of interest
+        :param depth: maximal distance from the terms to their common ancestors (or None for no limit)
+        :param relationships: relationships that define term equivalence
+        :return: list of the common ancestors that have no descendants among the common ancestors,
+        from the most specific (deepest in the hierarchy) to the most general ones,
+        or None if no terms were given
+        """
+        return self.get_common_points([terms], depth, relationships)[0]
+
+    def get_common_points(self, term_groups, depth=None, relationships=None):
+        """
+        Finds the most specific common generalized ancestors (see common_points) for each of the given term groups.
+        The ancestors of the terms are only calculated once, even if the terms appear in several groups.
+        :param term_groups: iterable of collections of terms
+        :param depth: maximal distance from the terms to their common ancestors (or None for no limit)
+        :param relationships: relationships that define term equivalence
+        :return: list of the common_points results, in the order of the given term groups
+        """
+        if depth is not None and depth <= 0:
+            return [None for _ in term_groups]
+        t_id2class = self.get_equivalence_classes(relationships)
+        t_id2levels = self._get_levels()
+        t_id2up_ids = {}
+
+        def get_ancestor_ids(t_id):
+            return self._get_generalized_closure(GENERALIZED_ANCESTORS, self._get_parent_ids, t_id, relationships)
+
+        def get_key(t_id):
+            return -max(t_id2levels.get(t_id, (0,))), t_id
+
+        def get_up_ids(t):
+            t_id = t.get_id()
+            if t_id not in t_id2up_ids:
+                ancestor_ids = get_ancestor_ids(t_id) if depth is None \
+                    else {it.get_id() for it in self.get_generalized_ancestors(t, False, set(), relationships, depth)}
+                t_id2up_ids[t_id] = ancestor_ids | t_id2class.get(t_id, EMPTY) | {t_id}
+            return t_id2up_ids[t_id]
+
+        result = []
+        for terms in term_groups:
+            if not terms:
+                result.append(None)
+                continue
+            terms = iter(set(terms))
+            common_ids = set(get_up_ids(next(terms)))
+            for t in terms:
+                common_ids &= get_up_ids(t)
+            # a common point is too general if it is an ancestor of another common point;
+            # the ancestors of a too general point are too general as well, so the deepest points are checked first
+            too_general_ids = set()
+            for t_id in sorted(common_ids, key=get_key):
+                if t_id not in too_general_ids:
+                    too_general_ids |= get_ancestor_ids(t_id)
+            result.append([self.id2term[t_id] for t_id in sorted(common_ids - too_general_ids, key=get_key)])
+        return result
 
     def remove_relationships(self, relationships, brutally=False):
+        self._invalidate()
         for (subj_id, r, o_id) in relationships:
             if "is_a" == r:
                 subj, obj = self.get_term(subj_id), self.get_term(o_id)
@@ -423,8 +864,7 @@ class Ontology(object):
                 if not subj.parents:
                     self.roots.add(subj)
             else:
-                remove_from_map(self.rel_map, subj_id, (subj_id, r, o_id))
-                remove_from_map(self.rel_map, o_id, (subj_id, r, o_id))
+                self._remove_relationship(subj_id, r, o_id)
 
     def trim(self, root_ids, relationships=None):
         """
@@ -433,9 +873,12 @@ class Ontology(object):
         :param relationships: set of relationships for detecting generalized ancestors
         :return: void (updates this ontology inplace)
         """
-        for r_id in root_ids:
-            r = self.get_term(r_id)
+        root_ids = set(root_ids)
+        to_remove = set()
+        for r in (self.get_term(r_id) for r_id in root_ids):
+            if not r:
+                continue
             ancestors = self.get_generalized_ancestors(r, relationships=relationships)
             if not {a.id for a in ancestors} & root_ids:
-                for it in ancestors:
-                    self.remove_term(it, True)
+                to_remove |= ancestors
+        self.remove_terms(to_remove, True)
@@ -0,0 +1,147 @@
+from mod_sbml.onto.term import Term, FORMULA
+
+__author__ = 'anna'
+
+TERM_STANZA = '[Term]'
+
+ID = 'id'
+IS_OBSOLETE = 'is_obsolete'
+ALT_ID = 'alt_id'
+NAME = 'name'
+IS_A = 'is_a'
+RELATIONSHIP = 'relationship'
+SYNONYM = 'synonym'
+XREF = 'xref'
+
+
+def _parse_id(term, value, rels, relationships):
+    term.set_id(value)
+
+
+def _parse_alt_id(term, value, rels, relationships):
+    term.add_alt_id(value)
+
+
+def _parse_name(term, value, rels, relationships):
+    term.set_name(value.replace('\\"', '"'))
+
+
+def _parse_is_a(term, value, rels, relationships):
+    term.add_parent(value)
+
+
+def _parse_relationship(term, value, rels, relationships):
+    rel_obj = value.split()
+    if len(rel_obj) < 2:
+        return
+    rel, obj = rel_obj[0], rel_obj[1]
+    if not relationships or rel in relationships:
+        rels.append((rel, obj.lower()))
+
+
+def _parse_synonym(term, value, rels, relationships):
+    start = value.find('"')
+    if start == -1:
+        return
+    st = start + 1
+    while -1 != value.find('\\"', st):
+        st = value.find('\\"', st) + 2
+    end = value.find('"', st)
+    if end == -1:
+        return
+    synonym = value[start + 1:end].replace('\\"', '"')
+    if synonym and synonym != '.':
+        term.add_synonym(synonym)
+        if end + 1 < len(value) and -1 != value.find('FORMULA', end + 1):
+            term.add_xref(FORMULA, synonym)
+
+
+def _parse_xref(term, value, rels, relationships):
+    comment = value.find('"')
+    if comment != - 1:
+        value = value[:comment]
+    modifier = value.find("{")
+    if modifier != -1:
+        value = value[:modifier]
+    colon = value.find(':')
+    if -1 != colon:
+        db_name = value[:colon]
+        value = value[colon + 1:].strip()
+        if db_name and value:
+            term.add_xref(db_name, value)
+
+
+TAG2PARSER = {ID: _parse_id, ALT_ID: _parse_alt_id, NAME: _parse_name, IS_A: _parse_is_a,
+              RELATIONSHIP: _parse_relationship, SYNONYM: _parse_synonym, XREF: _parse_xref}
+
+
+def iter_obo(obo_file, relationships=None, tags=None, skip_obsolete=True, onto=None):
+    """
+    Streams the [Term] stanzas of an OBO file.
+    Only one stanza is kept in memory at a time, and the lines of the stanzas that turn out to be obsolete
+    (as well as the tags that are not of interest) are skipped without being processed.
+    :param obo_file: path to the OBO file
+    :param relationships: collection of relationships to be kept (or None to keep all of them)
+    :param tags: collection of tags (e.g. 'id', 'is_a', 'synonym') to be parsed (or None to parse all the supported ones),
+    the id tag is always parsed
+    :param skip_obsolete: whether the obsolete terms should be skipped
+    :param onto: mod_sbml.onto.obo_ontology.Ontology ontology the terms are created for (optional)
+    :return: generator of tuples (term, relationships), where term is a mod_sbml.onto.term.Term
+    and relationships is a list of its (subject_id, relationship, object_id) relationship tuples
+    """
+    tag2parser = TAG2PARSER if tags is None \
+        else {tag: parser for (tag, parser) in TAG2PARSER.items() if tag in tags or ID == tag}
+    term, rels, obsolete = None, None, False
+    with open(obo_file, 'r') as obo:
+        for line in obo:
+            if line.startswith('['):
+                if term and not obsolete:
+                    term.freeze()
+                    t_id = term.get_id()
+                    yield term, [(t_id, rel, obj) for (rel, obj) in rels]
+                term, rels, obsolete = None, None, False
+                if line.startswith(TERM_STANZA):
+                    term, rels = Term(onto=onto), []
+                    term.thaw()
+                continue
+            if not term or obsolete:
+                continue
+            tag, colon, value = line.partition(':')
+            if not colon:
+                continue
+            tag = tag.strip()
+            if IS_OBSOLETE == tag:
+                obsolete = skip_obsolete and value.partition('!')[0].strip() == 'true'
+                continue
+            parser = tag2parser.get(tag)
+            if not parser:
+                continue
+            value = value.partition('!')[0].strip()
+            if value:
+                parser(term, value, rels, relationships)
+    if term and not obsolete:
+        term.freeze()
+        t_id = term.get_id()
+        yield term, [(t_id, rel, obj) for (rel, obj) in rels]
+
+
+def parse_obo(obo_file, on_term=None, on_relationship=None, relationships=None, tags=None, skip_obsolete=True,
+              onto=None):
+    """
+    Streams the [Term] stanzas of an OBO file (see iter_obo) into the given callbacks.
+    :param obo_file: path to the OBO file
+    :param on_term: function to be called on each term (mod_sbml.onto.term.Term)
+    :param on_relationship: function to be called on each relationship as on_relationship(subject_id, rel, object_id)
+    :param relationships: collection of relationships to be kept (or None to keep all of them)
+    :param tags: collection of tags to be parsed (or None to parse all the supported ones)
+    :param skip_obsolete: whether the obsolete terms should be skipped
+    :param onto: mod_sbml.onto.obo_ontology.Ontology ontology the terms are created for (optional)
+    :return: void
+    """
+    for term, rels in iter_obo(obo_file, relationships=relationships, tags=tags, skip_obsolete=skip_obsolete,
+                               onto=onto):
+        if on_term:
+            on_term(term)
+        if on_relationship:
+            for (subj, rel, obj) in rels:
+                on_relationship(subj, rel, obj)
@@ -0,0 +1,88 @@
+from mod_sbml.onto.obo_ontology import Ontology, get_term_keys, EMPTY
+from mod_sbml.onto.term import Term
+
+__author__ = 'anna'
+
+
+class OntologyView(Ontology):
+    """
+    Read-only filtered view of an ontology, that keeps only the given terms and relationships.
+
+    The view shares the term objects with the underlying ontology, and only indexes the kept terms,
+    so it takes time and memory proportional to the number of kept terms.
+    The kept terms lose their parents that are not kept (but keep the unknown ones),
+    and only the relationships of the given types that the kept terms participate in
+    with other kept (or unknown) terms are kept,
+    as if the other terms and relationships were removed from the underlying ontology
+    (see mod_sbml.onto.filter_ontology).
+
+    As the terms are shared, their own parent ids are not filtered:
+    use the view to get the parents (e.g. get_ancestors), or materialize it with to_ontology.
+    The underlying ontology should not be modified while the view is in use.
+    """
+
+    def __init__(self, onto, terms=None, relationships=None):
+        """
+        Creates a view of the given ontology.
+        :param onto: mod_sbml.onto.obo_ontology.Ontology ontology to be filtered
+        :param terms: collection of the terms (or term ids) to be kept (or None to keep all of them)
+        :param relationships: collection of relationships to be kept (or None to keep all of them)
+        """
+        super(OntologyView, self).__init__()
+        self.base = onto
+        for term in (onto.get_all_terms() if terms is None else
+                     (onto.get_term(t) if isinstance(t, str) else t for t in terms)):
+            if term:
+                self.id2term[term.get_id()] = term
+                for alt_id in term.get_all_ids():
+                    self.alt_id2term[alt_id] = term
+        # the parents are filtered against the kept ids, so all of them should be known first
+        for t_id, term in self.id2term.items():
+            names, xrefs = get_term_keys(term)
+            for name in names:
+                self.name2term_ids[name].add(t_id)
+            for xref in xrefs:
+                self.xref2term_ids[xref].add(t_id)
+            parent_ids = self._get_parent_ids(t_id)
+            for parent_id in parent_ids:
+                self.parent2children[parent_id].add(t_id)
+            if not parent_ids:
+                self.roots.add(term)
+        rels = set()
+        for t_id in self.id2term.keys():
+            for (subj, rel, obj) in onto.get_term_relationships(t_id):
+                if (relationships is None or rel in relationships) and self._is_kept(subj) and self._is_kept(obj):
+                    rels.add((subj, rel, obj))
+        for (subj, rel, obj) in rels:
+            Ontology.add_relationship(self, subj, rel, obj)
+        self._read_only = True
+
+    def _is_kept(self, t_id):
+        # the ids unknown to the underlying ontology are kept, like they would be after a removal
+        return self.get_term(t_id) is not None or self.base.get_term(t_id) is None
+
+    def _get_parent_ids(self, term_id):
+        term = self.get_term(term_id)
+        if not term:
+            return EMPTY
+        return tuple(p_id for p_id in term.parent_ids if self._is_kept(p_id))
+
+    def _invalidate(self):
+        if getattr(self, '_read_only', False):
+            raise TypeError('An ontology view can not be modified, use to_ontology to get a modifiable copy')
+        super(OntologyView, self)._invalidate()
+
+    def to_ontology(self):
+        """
+        Copies the kept terms and relationships into a new (modifiable) ontology.
+        :return: mod_sbml.onto.obo_ontology.Ontology ontology
+        """
+        onto = Ontology()
+        for t_id, term in self.id2term.items():
+            copy = Term(onto=None, t_id=t_id, name=term.name, parent_ids=self._get_parent_ids(t_id))
+            copy.altIds, copy.synonyms = term.altIds, term.synonyms
+            copy.xrefs = dict(term.xrefs) if term.xrefs else None
+            onto.add_term(copy)
+        for (subj, rel, obj) in self.get_all_relationships():
+            onto.add_relationship(subj, rel, obj)
+        return onto
@@ -0,0 +1,126 @@
+import logging
+import os
+import sys
+from threading import RLock
+
+from mod_sbml.onto import parse, parse_simple
+
+__author__ = 'anna'
+
+
+def get_size(obj):
+    """
+    Estimates the memory taken by the given object and by all the objects it (transitively) refers to,
+    each object being counted once.
+    :param obj: object of interest (e.g. mod_sbml.onto.obo_ontology.Ontology ontology)
+    :return: int, size in bytes
+    """
+    size, seen, to_visit = 0, set(), [obj]
+    while to_visit:
+        obj = to_visit.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            to_visit.extend(obj.keys())
+            to_visit.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            to_visit.extend(obj)
+        if hasattr(obj, '__dict__'):
+            to_visit.append(obj.__dict__)
+        for slot in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, slot):
+                to_visit.append(getattr(obj, slot))
+    return size
+
+
+class OntologyRegistry(object):
+    """
+    Process-wide store of the loaded ontologies, which makes sure that each ontology
+    (identified by its file path and the way it is loaded) is loaded at most once,
+    even if it is requested by several threads at the same time.
+
+    The ontologies are shared by all the callers and therefore should not be modified.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._key2lock = {}
+        self._key2onto = {}
+
+    @staticmethod
+    def _get_key(path, relationships, lazy):
+        return os.path.abspath(path), frozenset(relationships) if relationships else None, lazy
+
+    def get(self, path, relationships=None, lazy=False):
+        """
+        Returns the ontology stored in the given file, loading it if it has not been loaded yet.
+        :param path: path to the ontology file, either in OBO format (with the .obo extension, see parse)
+        or in the simple tab-delimited format (see parse_simple)
+        :param relationships: (for OBO files only) collection of relationships to be kept (or None to keep all of them)
+        :param lazy: (for simple files only) whether the ontology should be loaded lazily (see parse_simple)
+        :return: mod_sbml.onto.obo_ontology.Ontology ontology or None if the file does not exist
+        """
+        key = self._get_key(path, relationships, lazy)
+        with self._lock:
+            if key in self._key2onto:
+                return self._key2onto[key]
+            key_lock = self._key2lock.setdefault(key, RLock())
+        # only the loads of the same ontology wait for each other
+        with key_lock:
+            with self._lock:
+                if key in self._key2onto:
+                    return self._key2onto[key]
+            onto = parse(path, relationships) if path.endswith('.obo') else parse_simple(path, lazy=lazy)
+            if onto is None:
+                logging.warning('Could not load the ontology from %s' % path)
+                return None
+            with self._lock:
+                self._key2onto[key] = onto
+            return onto
+
+    def warm_up(self, paths):
+        """
+        Loads the ontologies stored in the given files (see get), so that the later requests do not wait for them.
+        :param paths: collection of paths to the ontology files
+        :return: list of the loaded ontologies (None for the files that do not exist)
+        """
+        return [self.get(path) for path in paths]
+
+    def memory_usage(self):
+        """
+        Estimates the memory taken by each of the loaded ontologies (see get_size).
+        :return: dict {(path, relationships, lazy): size in bytes}
+        """
+        with self._lock:
+            key2onto = dict(self._key2onto)
+        return {key: get_size(onto) for (key, onto) in key2onto.items()}
+
+    def evict(self, path=None):
+        """
+        Forgets the loaded ontologies stored in the given file (or all the loaded ontologies),
+        so that they can be garbage-collected once they are not used anymore, and are reloaded on the next request.
+        :param path: path to the ontology file (or None to evict all the ontologies)
+        :return: int, number of the evicted ontologies
+        """
+        with self._lock:
+            keys = [key for key in self._key2onto.keys() if path is None or key[0] == os.path.abspath(path)]
+            # the per-key locks are kept, as another thread might be reloading the ontology under its lock
+            for key in keys:
+                del self._key2onto[key]
+            return len(keys)
+
+    def __contains__(self, path):
+        with self._lock:
+            return any(key[0] == os.path.abspath(path) for key in self._key2onto.keys())
+
+
+registry = OntologyRegistry()
+
+
+def get_ontology(path, relationships=None, lazy=False):
+    """
+    Returns the ontology stored in the given file from the process-wide registry (see OntologyRegistry.get).
+    """
+    return registry.get(path, relationships, lazy)
@@ -0,0 +1,393 @@
+"""
+Read-only ontology store that is memory-mapped from a file,
+so that all the processes working with the same ontology share one physical copy of it.
+
+The store consists of flat arrays: string tables (term ids, term lines in the simple format, and the sorted
+id, name and xref lookup keys) and compressed sparse row (CSR) adjacency arrays (parents, children,
+and the subject-to-object and object-to-subject edges of each relationship).
+Terms are only materialized (parsed from their lines) when requested.
+"""
+from array import array
+import mmap
+import os
+import pickle
+
+from natsort import natsorted
+import numpy as np
+
+from mod_sbml.onto.obo_ontology import normalize, PART_OF
+from mod_sbml.onto.ontology_view import OntologyView
+from mod_sbml.onto.term import Term
+from mod_sbml.onto.traversal import bfs
+
+__author__ = 'anna'
+
+MAGIC = b'MODSBMLO'
+SHARED_ONTOLOGY_VERSION = 1
+
+OFFSET_TYPE = 'Q'
+INDEX_TYPE = 'I'
+BYTE_TYPE = 'B'
+
+NODE_IDS = 'node_ids'
+TERMS = 'terms'
+IDS = 'ids'
+NAMES = 'names'
+XREFS = 'xrefs'
+PARENTS = 'parents'
+CHILDREN = 'children'
+
+
+def _get_string_table(strings):
+    offsets, blob = array(OFFSET_TYPE, [0]), bytearray()
+    for s in strings:
+        blob.extend(s.encode('utf-8'))
+        offsets.append(len(blob))
+    return offsets, blob
+
+
+def _get_csr(n, node2values):
+    offsets, values = array(OFFSET_TYPE, [0]), array(INDEX_TYPE)
+    for node in range(n):
+        values.extend(node2values.get(node, ()))
+        offsets.append(len(values))
+    return offsets, values
+
+
+def save_shared_ontology(onto, path):
+    """
+    Saves the given ontology into the read-only store file that can be opened with SharedOntology.
+    :param onto: mod_sbml.onto.obo_ontology.Ontology ontology
+    :param path: path to the store file
+    :return: void
+    """
+    if isinstance(onto, OntologyView):
+        onto = onto.to_ontology()
+    term_ids = sorted(onto.id2term.keys())
+    # nodes: the terms, followed by the unknown ids the terms refer to (e.g. as parents)
+    node_ids = list(term_ids)
+    id2node = {t_id: i for (i, t_id) in enumerate(term_ids)}
+    key2nodes = {}
+    for i, t_id in enumerate(term_ids):
+        for alt_id in onto.id2term[t_id].get_all_ids():
+            key2nodes.setdefault(alt_id, [i])
+
+    def get_node(t_id):
+        key = t_id.lower().strip()
+        if key in key2nodes:
+            return key2nodes[key][0]
+        if key not in id2node:
+            id2node[key] = len(node_ids)
+            node_ids.append(key)
+        return id2node[key]
+
+    node2parents, node2children = {}, {}
+    for i, t_id in enumerate(term_ids):
+        for parent in sorted({get_node(p_id) for p_id in onto.id2term[t_id].parent_ids}):
+            node2parents.setdefault(i, []).append(parent)
+            node2children.setdefault(parent, []).append(i)
+    relationships = sorted(onto.get_relationships())
+    rel2out, rel2in = {rel: {} for rel in relationships}, {rel: {} for rel in relationships}
+    for (subj, rel, obj) in sorted(onto.get_all_relationships()):
+        subj, obj = get_node(subj), get_node(obj)
+        rel2out[rel].setdefault(subj, []).append(obj)
+        rel2in[rel].setdefault(obj, []).append(subj)
+
+    def get_ranked_nodes(key2term_ids):
+        return {key: [id2node[t_id] for t_id in natsorted(t_ids, key=lambda y: y.lower()) if t_id in onto.id2term]
+                for (key, t_ids) in key2term_ids.items()}
+
+    sections = {}
+
+    def add_key_map(name, key2values):
+        keys = sorted((key for (key, values) in key2values.items() if values), key=lambda it: it.encode('utf-8'))
+        sections[name + '_key_offsets'], sections[name + '_keys'] = _get_string_table(keys)
+        sections[name + '_offsets'], sections[name + '_values'] = \
+            _get_csr(len(keys), {i: key2values[key] for (i, key) in enumerate(keys)})
+
+    def add_graph(name, node2values):
+        sections[name + '_offsets'], sections[name + '_values'] = _get_csr(len(node_ids), node2values)
+
+    add_key_map(IDS, key2nodes)
+    add_key_map(NAMES, get_ranked_nodes(onto.name2term_ids))
+    add_key_map(XREFS, get_ranked_nodes(onto.xref2term_ids))
+    add_graph(PARENTS, node2parents)
+    add_graph(CHILDREN, node2children)
+    for i, rel in enumerate(relationships):
+        add_graph('rel_%d_out' % i, rel2out[rel])
+        add_graph('rel_%d_in' % i, rel2in[rel])
+    sections[TERMS + '_offsets'], sections[TERMS] = _get_string_table(str(onto.id2term[t_id]) for t_id in term_ids)
+    sections[NODE_IDS + '_offsets'], sections[NODE_IDS] = _get_string_table(node_ids)
+
+    # section data is 8-byte aligned, so that it can be viewed as arrays without copying
+    layout, offset = {}, 0
+    for name, data in sections.items():
+        typecode = data.typecode if isinstance(data, array) else BYTE_TYPE
+        size = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        layout[name] = (offset, size, typecode)
+        offset += size + (-size % 8)
+    header = pickle.dumps({'version': SHARED_ONTOLOGY_VERSION, 'n_terms': len(term_ids), 'n_nodes': len(node_ids),
+                           'relationships': relationships, 'layout': layout}, protocol=pickle.HIGHEST_PROTOCOL)
+    header += b'\0' * (-(len(MAGIC) + 8 + len(header)) % 8)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(array(OFFSET_TYPE, [len(header)]).tobytes())
+        f.write(header)
+        for name, data in sections.items():
+            data = data.tobytes() if isinstance(data, array) else bytes(data)
+            f.write(data)
+            f.write(b'\0' * (-len(data) % 8))
+    os.replace(tmp_path, path)
+
+
+class SharedOntology(object):
+    """
+    Read-only ontology, memory-mapped from a file saved with save_shared_ontology.
+    Supports the query methods of mod_sbml.onto.obo_ontology.Ontology that do not modify it
+    (get_term, get_descendants, get_equivalents, part_of, is_a),
+    and can be passed to other processes (which map the same file).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._terms = {}
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            view.release()
+            self._mmap.close()
+            raise ValueError('%s is not a shared ontology file' % path)
+        start = len(MAGIC) + 8
+        header_size = view[len(MAGIC): start].cast(OFFSET_TYPE)[0]
+        header = pickle.loads(view[start: start + header_size])
+        if SHARED_ONTOLOGY_VERSION != header['version']:
+            view.release()
+            self._mmap.close()
+            raise ValueError('%s was saved by an incompatible version' % path)
+        start += header_size
+        self.n_terms, self.n_nodes = header['n_terms'], header['n_nodes']
+        self.rel2index = {rel: i for (i, rel) in enumerate(header['relationships'])}
+        self._views = [view]
+        self._sections = {}
+        for name, (offset, size, typecode) in header['layout'].items():
+            section = view[start + offset: start + offset + size]
+            self._sections[name] = section.cast(typecode) if BYTE_TYPE != typecode else section
+            self._views.append(section)
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def close(self):
+        """
+        Unmaps the ontology file, the ontology can not be used afterwards.
+        :return: void
+        """
+        for section in self._sections.values():
+            section.release()
+        for view in self._views:
+            view.release()
+        self._sections, self._views = {}, []
+        self._mmap.close()
+
+    def __len__(self):
+        return self.n_terms
+
+    def _get_string(self, name, i):
+        offsets = self._sections[name + '_offsets']
+        return bytes(self._sections[name][offsets[i]: offsets[i + 1]]).decode('utf-8')
+
+    def _get_neighbours(self, name, i):
+        offsets = self._sections[name + '_offsets']
+        return self._sections[name + '_values'][offsets[i]: offsets[i + 1]]
+
+    def _lookup(self, name, key):
+        """
+        Looks for the key among the sorted keys of the given key map (binary search).
+        :return: memoryview of the node indices corresponding to the key (possibly empty)
+        """
+        key = key.encode('utf-8')
+        offsets, keys = self._sections[name + '_key_offsets'], self._sections[name + '_keys']
+        lo, hi = 0, len(offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_key = bytes(keys[offsets[mid]: offsets[mid + 1]])
+            if mid_key < key:
+                lo = mid + 1
+            elif mid_key > key:
+                hi = mid
+            else:
+                return self._get_neighbours(name, mid)
+        return self._sections[name + '_values'][0: 0]
+
+    def _get_node(self, t_id):
+        if not t_id:
+            return None
+        nodes = self._lookup(IDS, t_id.lower().strip())
+        return nodes[0] if len(nodes) else None
+
+    def _get_term_by_node(self, node):
+        if node is None or node >= self.n_terms:
+            return None
+        if node not in self._terms:
+            self._terms[node] = Term(onto=None, s=self._get_string(TERMS, node))
+        return self._terms[node]
+
+    def _get_id(self, node):
+        return self._get_string(NODE_IDS, node)
+
+    def get_all_term_ids(self):
+        return {self._get_id(node) for node in range(self.n_terms)}
+
+    def get_relationships(self):
+        return set(self.rel2index.keys())
+
+    def get_term(self, key, check_only_ids=True):
+        """
+        Looks for a term corresponding to the given key (see mod_sbml.onto.obo_ontology.Ontology.get_term).
+        :param key: str, by default the term's id or alternative id.
+        :param check_only_ids: boolean, optional. If set to False (by default it's True),
+        the key is also looked for in term names and xrefs.
+        :return: term (instance of class mod_sbml.onto.term.Term) corresponding to the given key,
+        or None if no such term was found.
+        """
+        if not key:
+            return None
+        key = key.lower().strip()
+        node = self._get_node(key)
+        if node is None and not check_only_ids:
+            nodes = self._lookup(XREFS, key)
+            if not len(nodes):
+                nodes = self._lookup(NAMES, normalize(key))
+            node = nodes[0] if len(nodes) else None
+        return self._get_term_by_node(node)
+
+    def get_descendants(self, term_id, direct=True):
+        node = self._get_node(term_id)
+        if node is None:
+            return set()
+        if direct:
+            nodes = self._get_neighbours(CHILDREN, node)
+        else:
+            nodes = bfs([node], lambda it: set(self._get_neighbours(CHILDREN, it)))
+        return {self._get_id(it) for it in nodes}
+
+    def _get_ancestor_nodes(self, node):
+        return bfs([node], lambda it: set(self._get_neighbours(PARENTS, it)))
+
+    def is_a(self, child_id, parent_id):
+        child, parent = self._get_node(child_id), self._get_node(parent_id)
+        if child is None or parent is None:
+            return False
+        return parent in self._get_ancestor_nodes(child)
+
+    def get_is_a_matrix(self, child_ids, parent_ids):
+        """
+        Checks which of the given terms are descendants of which of the given parent terms
+        (see mod_sbml.onto.obo_ontology.Ontology.get_is_a_matrix).
+        The ancestors of each child term are found once and checked against all the parent terms.
+        :param child_ids: list of ids of the potential child terms
+        :param parent_ids: list of ids of the potential parent terms
+        :return: numpy boolean array of shape (len(child_ids), len(parent_ids))
+        """
+        matrix = np.zeros((len(child_ids), len(parent_ids)), dtype=bool)
+        parents = [self._get_node(parent_id) for parent_id in parent_ids]
+        for i, child_id in enumerate(child_ids):
+            child = self._get_node(child_id)
+            if child is None:
+                continue
+            ancestors = self._get_ancestor_nodes(child)
+            matrix[i] = [parent is not None and parent in ancestors for parent in parents]
+        return matrix
+
+    def get_part_of_matrix(self, part_ids, whole_ids):
+        """
+        Checks which of the given terms are parts of which of the given whole terms
+        (see mod_sbml.onto.obo_ontology.Ontology.get_part_of_matrix).
+        The wholes of each part term are found once and checked against all the whole terms.
+        :param part_ids: list of ids of the potential part terms
+        :param whole_ids: list of ids of the potential whole terms
+        :return: numpy boolean array of shape (len(part_ids), len(whole_ids))
+        """
+        matrix = np.zeros((len(part_ids), len(whole_ids)), dtype=bool)
+        whole_ids = [t_id.lower().strip() for t_id in whole_ids]
+        for i, part_id in enumerate(part_ids):
+            part = self._get_node(part_id)
+            if part is None or part >= self.n_terms:
+                continue
+            wholes = self._get_whole_ids(part)
+            matrix[i] = [whole_id in wholes for whole_id in whole_ids]
+        return matrix
+
+    def _get_related_nodes(self, node, rel, direction):
+        result = set()
+        rel_index = self.rel2index.get(rel, None)
+        if rel_index is None:
+            return result
+        if 2 != direction:
+            result.update(self._get_neighbours('rel_%d_out' % rel_index, node))
+        if 1 != direction:
+            result.update(self._get_neighbours('rel_%d_in' % rel_index, node))
+        return result
+
+    def get_equivalents(self, term, rel=None, direction=0, relationships=None):
+        """
+        Finds the terms connected to the given one by the given relationships
+        (see mod_sbml.onto.obo_ontology.Ontology.get_equivalents).
+        :param term: term of interest
+        :param rel: relationship of interest (or None for any of the relationships)
+        :param direction: 0 for any direction, 1 for the relationships where the term is the subject, 2 for the object
+        :param relationships: collection of relationships to be considered (or None for all of them)
+        :return: set of terms
+        """
+        node = self._get_node(term.get_id()) if term else None
+        if node is None:
+            return set()
+        rels = [it for it in self.rel2index.keys()
+                if (not rel or rel == it) and (not relationships or it in relationships)]
+
+        def get_next_nodes(it):
+            result = set()
+            for r in rels:
+                result |= self._get_related_nodes(it, r, direction)
+            return {n for n in result if n < self.n_terms}
+
+        return {self._get_term_by_node(it) for it in bfs([node], get_next_nodes) if it != node}
+
+    def part_of(self, part_id, whole_ids):
+        """
+        Checks if a term with id part_id is a part of any of the terms with ids in whole_ids
+        (see mod_sbml.onto.obo_ontology.Ontology.part_of).
+        :param part_id: id of the part term
+        :param whole_ids: ids of the potential whole terms
+        :return: ids of the terms among whole_ids that has_part part_id
+        """
+        part = self._get_node(part_id)
+        if part is None or part >= self.n_terms:
+            return None
+        whole_ids = {t_id.lower().strip() for t_id in whole_ids}
+        result = whole_ids & {self._get_id(it) for it in self._get_related_nodes(part, PART_OF, 1)}
+        if result:
+            return result
+        return whole_ids & self._get_whole_ids(part)
+
+    def _get_whole_ids(self, part):
+        """
+        Finds the ids of the terms reachable from the given one via is_a and part_of relationships,
+        excluding its is_a ancestors (unless they are reached via part_of), see part_of.
+        :param part: node of the part term
+        :return: set of term ids
+        """
+        def get_whole_nodes(node):
+            return self._get_related_nodes(node, PART_OF, 1)
+
+        reachable = bfs([part], lambda it: set(self._get_neighbours(PARENTS, it)) | get_whole_nodes(it))
+        ancestors = self._get_ancestor_nodes(part)
+        whole_nodes = get_whole_nodes(part)
+        for it in reachable:
+            whole_nodes |= get_whole_nodes(it)
+        return {self._get_id(it) for it in reachable if it not in ancestors or it in whole_nodes}
@@ -0,0 +1,92 @@
+import gc
+import hashlib
+import logging
+import os
+import pickle
+
+__author__ = 'anna'
+
+SNAPSHOT_EXTENSION = '.snapshot'
+
+# Increase whenever the pickled layout of Ontology or Term changes,
+# so that the snapshots written by the previous versions are ignored.
+SNAPSHOT_VERSION = 3
+
+
+def get_snapshot_path(path):
+    """
+    Returns the path of the binary snapshot corresponding to the given ontology file.
+    :param path: path to the ontology file
+    :return: path to the snapshot file
+    """
+    return '%s%s' % (path, SNAPSHOT_EXTENSION)
+
+
+def _get_digest(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _get_source_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, _get_digest(path)
+
+
+def load_snapshot(path):
+    """
+    Loads the ontology snapshot for the given ontology file,
+    if the snapshot exists and is up-to-date with the file, i.e. the file's size and modification time
+    have not changed since the snapshot was saved. The file content is only hashed (and compared to the hash
+    saved in the snapshot) if its modification time has changed but not its size, e.g. if it was copied.
+    :param path: path to the ontology file
+    :return: mod_sbml.onto.obo_ontology.Ontology ontology or None if there is no valid snapshot
+    """
+    snapshot_path = get_snapshot_path(path)
+    if not os.path.exists(snapshot_path) or not os.path.exists(path):
+        return None
+    try:
+        with open(snapshot_path, 'rb') as f:
+            version, size, mtime, digest = pickle.load(f)
+            if SNAPSHOT_VERSION != version:
+                return None
+            stat = os.stat(path)
+            if size != stat.st_size or (mtime != stat.st_mtime_ns and digest != _get_digest(path)):
+                return None
+            # the snapshot consists of many small objects and no garbage,
+            # so there is no point in letting the collector scan them while they are being created
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                return pickle.load(f)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+    except Exception as e:
+        logging.warning('Ignoring the ontology snapshot %s as it could not be read: %s' % (snapshot_path, e))
+        return None
+
+
+def save_snapshot(onto, path):
+    """
+    Saves a binary snapshot of the given (fully indexed) ontology next to the ontology file it was parsed from.
+    Failures (e.g. a read-only data directory) are logged and otherwise ignored.
+    :param onto: mod_sbml.onto.obo_ontology.Ontology ontology
+    :param path: path to the ontology file the ontology was parsed from
+    :return: boolean, whether the snapshot was saved
+    """
+    snapshot_path = get_snapshot_path(path)
+    tmp_path = '%s.%d.tmp' % (snapshot_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((SNAPSHOT_VERSION,) + _get_source_signature(path), f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(onto, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+        return True
+    except Exception as e:
+        logging.warning('Could not save the ontology snapshot %s: %s' % (snapshot_path, e))
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
@@ -1,4 +1,5 @@
 from collections import defaultdict
+from sys import intern
 
 __author__ = 'anna'
 
@@ -6,35 +7,69 @@ __author__ = 'anna'
 FORMULA = 'formula'
 KEGG = 'kegg.compound'
 
+EMPTY = ()
+
+
+class Term(object):
+    """
+    Ontology term.
+
+    To keep large ontologies (e.g. ChEBI) small in memory, the terms have no __dict__,
+    their ids and xref database names are interned, the rarely modified alt id, synonym, parent and xref value
+    collections are stored as tuples (without duplicates), and the xref storage is only created
+    for terms that have xrefs.
+
+    While a term is being parsed, these collections are kept as (insertion-ordered) dicts instead,
+    so that adding a value does not copy and scan the collection: see thaw and freeze.
+    """
+    __slots__ = ('onto', 'id', 'altIds', 'name', 'synonyms', 'parent_ids', 'xrefs')
 
-class Term:
     def __init__(self, onto, t_id=None, name=None, parent_ids=None, s=None):
         self.onto = onto
-        self.id = normalize(t_id)
-        self.altIds = set()
+        self.id = normalize_id(t_id)
+        self.altIds = EMPTY
         self.name = name
-        self.synonyms = set()
-        self.parent_ids = set()
-        self.xrefs = defaultdict(set)
+        self.synonyms = EMPTY
+        self.parent_ids = EMPTY
+        # db -> tuple of values, created on the first xref addition
+        self.xrefs = None
         if parent_ids:
+            self.thaw()
             for p_id in parent_ids:
                 self.add_parent(p_id)
+            self.freeze()
         if s:
             self.__from_string(s)
 
+    def thaw(self):
+        """
+        Makes the term collections cheap to add to (see freeze), should be called before adding many values.
+        """
+        self.altIds, self.synonyms, self.parent_ids = \
+            dict.fromkeys(self.altIds), dict.fromkeys(self.synonyms), dict.fromkeys(self.parent_ids)
+        # the values of a new xref db are created as a dict as well
+        self.xrefs = defaultdict(dict, ((db, dict.fromkeys(values)) for (db, values) in (self.xrefs or {}).items()))
+
+    def freeze(self):
+        """
+        Turns the term collections back into compact tuples, should be called once the values are added (see thaw).
+        """
+        self.altIds, self.synonyms, self.parent_ids = tuple(self.altIds), tuple(self.synonyms), tuple(self.parent_ids)
+        self.xrefs = {db: tuple(values) for (db, values) in self.xrefs.items()} if self.xrefs else None
+
     def get_id(self):
         return str(self.id)
 
     def add_alt_id(self, t_id):
-        t_id = normalize(t_id)
+        t_id = normalize_id(t_id)
         if t_id:
-            self.altIds.add(t_id)
+            self.altIds = _add(self.altIds, t_id)
 
     def get_all_ids(self):
-        return self.altIds | {self.id}
+        return set(self.altIds) | {self.id}
 
     def set_id(self, t_id):
-        t_id = normalize(t_id)
+        t_id = normalize_id(t_id)
         if t_id:
             self.id = t_id
 
@@ -49,7 +84,7 @@ class Term:
     def add_synonym(self, synonym):
         synonym = synonym.strip()
         if synonym:
-            self.synonyms.add(synonym)
+            self.synonyms = _add(self.synonyms, synonym)
 
     def get_synonyms(self):
         return set(self.synonyms)
@@ -60,11 +95,19 @@ class Term:
     def get_parent_ids(self):
         return set(self.parent_ids)
 
+    def set_parent_ids(self, parent_ids):
+        """
+        Replaces the parents of this term (does not update the ontology's parent-children mapping).
+        :param parent_ids: collection of parent term ids
+        """
+        self.parent_ids = tuple({normalize_id(p_id) for p_id in parent_ids if p_id})
+
     def add_parent(self, parent_id):
-        parent_id = normalize(parent_id)
+        parent_id = normalize_id(parent_id)
         if parent_id:
-            self.parent_ids.add(parent_id)
-            self.onto.parent2children[parent_id] |= {self.id}
+            self.parent_ids = _add(self.parent_ids, parent_id)
+            if self.onto is not None:
+                self.onto.parent2children[parent_id] |= {self.id}
 
     def get_kegg_ids(self):
         return self.get_xrefs(KEGG)
@@ -73,20 +116,28 @@ class Term:
         db = normalize(db).replace(' ', '.')
         value = value.strip()
         if db and value:
-            self.xrefs[db].add(value)
+            if self.xrefs is None:
+                self.xrefs = {}
+            db = intern(db)
+            # a thawed term creates the values of a new db itself (see thaw)
+            values = self.xrefs[db] if isinstance(self.xrefs, defaultdict) else self.xrefs.get(db, EMPTY)
+            self.xrefs[db] = _add(values, value)
 
     def get_xrefs(self, db):
+        if not self.xrefs:
+            return set()
         db = normalize(db).replace(' ', '.')
-        return set(self.xrefs[db]) if db else set()
+        return set(self.xrefs.get(db, EMPTY)) if db else set()
 
     def get_dbs(self):
-        return set(self.xrefs.keys())
+        return set(self.xrefs.keys()) if self.xrefs else set()
 
     def __from_string(self, s):
         if not s:
             return
         s = s.splitlines()[0]
         t_id, alt_ids, name, synonyms, parent_ids, xrefs = s.split('\t\t')
+        self.thaw()
         self.set_id(t_id)
         self.set_name(name)
         for synonym in synonyms.split('\t'):
@@ -101,6 +152,7 @@ class Term:
                 db = values[0]
                 for value in values[1:]:
                     self.add_xref(db, value)
+        self.freeze()
 
     def __str__(self):
         return "%s\t\t%s\t\t%s\t\t%s\t\t%s\t\t%s\n" % (self.id, '\t'.join(self.altIds),
@@ -108,7 +160,8 @@ class Term:
                                                        '\t'.join(self.parent_ids),
                                                        ';\t;'.join(
                                                            ('%s\t%s' % (db, '\t'.join(values))
-                                                            for (db, values) in self.xrefs.items())))
+                                                            for (db, values) in self.xrefs.items()))
+                                                       if self.xrefs else '')
 
     def __eq__(self, other):
         if not other or not isinstance(other, Term):
@@ -122,8 +175,23 @@ class Term:
         return hash(self.id)
 
 
+def _add(items, item):
+    if isinstance(items, dict):
+        items[item] = None
+        return items
+    return items if item in items else items + (item,)
+
+
 def normalize(s):
     if s:
         return s.strip().lower()
     return s
 
+
+def normalize_id(s):
+    """
+    Normalizes (see normalize) and interns an identifier, so that all the terms referring to it share one string.
+    """
+    if s:
+        return intern(s.strip().lower())
+    return s
@@ -0,0 +1,128 @@
+"""
+Iterative (recursion-free) graph traversals shared by the ontology queries.
+The graphs are given implicitly, by functions that return the ids of the successors of a node id.
+"""
+
+__author__ = 'anna'
+
+EMPTY = frozenset()
+
+
+def get_closure(id2closure, start_id, get_next_ids):
+    """
+    Calculates the frozen set of ids of all the nodes reachable (in at least one step) from the start node,
+    reusing and updating the given closure cache: the closures of all the nodes met on the way are cached as well.
+    The strongly connected components are found with (an iterative version of) Tarjan's algorithm,
+    and all the nodes of a component share the same closure, so cycles are handled correctly.
+    :param id2closure: dict {node_id: frozenset of reachable node ids}, cache to be used and updated
+    :param start_id: id of the start node
+    :param get_next_ids: function that returns the ids of the successors of a node id
+    :return: frozenset of reachable node ids
+    """
+    if start_id in id2closure:
+        return id2closure[start_id]
+    id2index, id2low, id2next_ids = {}, {}, {}
+    component_stack, on_stack = [], set()
+
+    def visit(node_id):
+        id2index[node_id] = id2low[node_id] = len(id2index)
+        id2next_ids[node_id] = [next_id for next_id in get_next_ids(node_id)]
+        component_stack.append(node_id)
+        on_stack.add(node_id)
+        return node_id, iter(id2next_ids[node_id])
+
+    stack = [visit(start_id)]
+    while stack:
+        node_id, next_ids = stack[-1]
+        for next_id in next_ids:
+            if next_id in id2closure:
+                continue
+            if next_id not in id2index:
+                stack.append(visit(next_id))
+                break
+            if next_id in on_stack:
+                id2low[node_id] = min(id2low[node_id], id2index[next_id])
+        else:
+            stack.pop()
+            if stack:
+                parent_id = stack[-1][0]
+                id2low[parent_id] = min(id2low[parent_id], id2low[node_id])
+            if id2low[node_id] != id2index[node_id]:
+                continue
+            # node_id is the root of a strongly connected component: all its successors outside it are done
+            component = set()
+            while True:
+                it = component_stack.pop()
+                on_stack.remove(it)
+                component.add(it)
+                if it == node_id:
+                    break
+            closure, cyclic = set(), len(component) > 1
+            for it in component:
+                for next_id in id2next_ids[it]:
+                    if next_id in component:
+                        cyclic = True
+                    else:
+                        closure.add(next_id)
+                        closure |= id2closure[next_id]
+            if cyclic:
+                closure |= component
+            closure = frozenset(closure) if closure else EMPTY
+            for it in component:
+                id2closure[it] = closure
+    return id2closure[start_id]
+
+
+def get_post_order(start_ids, get_next_ids):
+    """
+    Orders the nodes reachable from the start nodes (including them) so that each node comes after its successors
+    (e.g. parents before children, if get_next_ids returns parents). In case of cycles the order within a cycle
+    is arbitrary.
+    :param start_ids: ids of the start nodes
+    :param get_next_ids: function that returns the ids of the successors of a node id
+    :return: list of node ids
+    """
+    order, visited = [], set()
+    for start_id in start_ids:
+        if start_id in visited:
+            continue
+        visited.add(start_id)
+        stack = [(start_id, iter(get_next_ids(start_id)))]
+        while stack:
+            node_id, next_ids = stack[-1]
+            for next_id in next_ids:
+                if next_id not in visited:
+                    visited.add(next_id)
+                    stack.append((next_id, iter(get_next_ids(next_id))))
+                    break
+            else:
+                stack.pop()
+                order.append(node_id)
+    return order
+
+
+def bfs(start_ids, get_next_ids, depth=None, expanded=None):
+    """
+    Finds the nodes reachable from the start nodes in at most depth steps.
+    :param start_ids: ids of the start nodes (any hashable objects can be used as ids)
+    :param get_next_ids: function that returns the set of ids of the successors of a node id
+    :param depth: maximal number of steps (or None for no limit)
+    :param expanded: (optional) set of ids of the nodes whose successors should not be explored
+    (the start nodes are explored anyway), it is updated with the ids of the explored nodes
+    :return: set of ids of the reached nodes (the start nodes are only included if they are reachable from
+    the start nodes)
+    """
+    if expanded is None:
+        expanded = set()
+    result = set()
+    frontier = set(start_ids)
+    step = 0
+    while frontier and (depth is None or step < depth):
+        expanded |= frontier
+        next_ids = set()
+        for node_id in frontier:
+            next_ids |= get_next_ids(node_id)
+        result |= next_ids
+        frontier = next_ids - expanded
+        step += 1
+    return result
@@ -0,0 +1,119 @@
+from array import array
+from math import ceil
+
+from natsort import natsorted
+
+from mod_sbml.onto.obo_ontology import normalize
+
+__author__ = 'anna'
+
+DEFAULT_THRESHOLD = 0.8
+
+
+def get_trigrams(name):
+    """
+    Splits a normalized name into the set of its character trigrams
+    (the name is padded, so that even short names have trigrams and the name starts and ends are taken into account).
+    :param name: normalized name (see mod_sbml.onto.obo_ontology.normalize)
+    :return: set of trigrams
+    """
+    name = '  %s ' % name
+    return {name[i: i + 3] for i in range(len(name) - 2)}
+
+
+def get_similarity(trigrams_1, trigrams_2):
+    """
+    Calculates the Dice similarity of two trigram sets.
+    :return: float between 0 and 1
+    """
+    if not trigrams_1 or not trigrams_2:
+        return 0.
+    return 2. * len(trigrams_1 & trigrams_2) / (len(trigrams_1) + len(trigrams_2))
+
+
+class TrigramIndex(object):
+    """
+    Approximate (character trigram based) index over the (normalized) term names and synonyms of an ontology.
+
+    The names are stored once, and each trigram is mapped to a compact array of the indices of the names
+    containing it. When a name is looked for, only the names found in the rarest of its trigram lists
+    can reach the similarity threshold (prefix filtering), so only those candidates are compared to the name.
+    """
+
+    def __init__(self, onto, threshold=DEFAULT_THRESHOLD):
+        """
+        Builds the index over the term names of the given ontology.
+        :param onto: mod_sbml.onto.obo_ontology.Ontology ontology
+        :param threshold: minimal Dice similarity (between 0 and 1) of trigram sets for the names to match
+        """
+        self.onto = onto
+        self.threshold = threshold
+        self.names = []
+        self.trigram2name_indices = {}
+        for name in onto.name2term_ids.keys():
+            index = len(self.names)
+            self.names.append(name)
+            for trigram in get_trigrams(name):
+                if trigram not in self.trigram2name_indices:
+                    self.trigram2name_indices[trigram] = array('I')
+                self.trigram2name_indices[trigram].append(index)
+
+    def find_names(self, name, threshold=None):
+        """
+        Finds the indexed names that are similar to the given one.
+        :param name: name of interest
+        :param threshold: minimal similarity (by default the index threshold is used)
+        :return: list of (similarity, indexed name) pairs, from the most similar name to the least similar one
+        """
+        if threshold is None:
+            threshold = self.threshold
+        name = normalize(name) if name else None
+        if not name:
+            return []
+        trigrams = get_trigrams(name)
+        # A name matches only if it shares at least min_shared trigrams with the query,
+        # hence it must contain at least one of the (len(trigrams) - min_shared + 1) rarest query trigrams.
+        min_shared = max(1, int(ceil(threshold * len(trigrams) / (2. - threshold) - 1e-9)))
+        indices = sorted((self.trigram2name_indices.get(trigram, ()) for trigram in trigrams), key=len)
+        candidates = set()
+        for name_indices in indices[: len(trigrams) - min_shared + 1]:
+            candidates.update(name_indices)
+        result = []
+        for index in candidates:
+            candidate = self.names[index]
+            similarity = get_similarity(trigrams, get_trigrams(candidate))
+            if similarity >= threshold:
+                result.append((similarity, candidate))
+        result.sort(key=lambda it: (-it[0], it[1]))
+        return result
+
+    def get_term(self, name, threshold=None):
+        """
+        Finds the term whose name or synonym is the most similar to the given name.
+        :param name: name of interest
+        :param threshold: minimal similarity (by default the index threshold is used)
+        :return: term (instance of class mod_sbml.onto.term.Term), or None if no similar enough name was found
+        """
+        for similarity, candidate in self.find_names(name, threshold):
+            for t_id in natsorted(self.onto.name2term_ids.get(candidate, ()), key=lambda y: y.lower()):
+                term = self.onto.get_term(t_id)
+                if term:
+                    return term
+        return None
+
+    def get_terms(self, names, threshold=None):
+        """
+        Finds the terms whose names or synonyms are the most similar to the given names (see get_term).
+        Names that are the same after normalization are only looked for once.
+        :param names: iterable of names of interest
+        :param threshold: minimal similarity (by default the index threshold is used)
+        :return: dict {name: term or None}
+        """
+        key2term = {}
+        name2term = {}
+        for name in names:
+            key = normalize(name) if name else None
+            if key not in key2term:
+                key2term[key] = self.get_term(key, threshold) if key else None
+            name2term[name] = key2term[key]
+        return name2term
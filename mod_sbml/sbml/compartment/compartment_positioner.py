@@ -1,6 +1,10 @@
 from functools import reduce
 
+import numpy as np
+
 from mod_sbml.annotation.gene_ontology.go_annotator import get_go_id
+from mod_sbml.annotation.gene_ontology.go_serializer import get_go
+from mod_sbml.onto.registry import get_ontology
 
 GO_CYTOPLASM = 'go:0005737'
 GO_CYTOSOL = 'go:0005829'
@@ -18,19 +22,72 @@ GO_LIPID_PARTICLE = 'go:0005811'
 __author__ = 'anna'
 
 partOfCheck = lambda it, t_id, onto: onto.part_of(it, [t_id])
-partOf = lambda t_id, onto, candidate_ids: {it for it in candidate_ids if partOfCheck(it, t_id, onto)}
 isACheck = lambda it, t_id, onto: onto.is_a(it, t_id) or (t_id.lower() == it.lower())
-isA = lambda t_id, onto, candidate_ids: {it for it in candidate_ids if isACheck(it, t_id, onto)}
-isAorPartOf = lambda t_id, onto, candidate_ids: {it for it in candidate_ids if
-                                                 isACheck(it, t_id, onto) or partOfCheck(it, t_id, onto)}
 
 
-def comp2level(model, onto):
+def _get_is_a_matrix(candidate_ids, t_ids, onto):
+    matrix = onto.get_is_a_matrix(candidate_ids, t_ids)
+    # each term is also considered to be itself
+    matrix |= np.array([it.lower() for it in candidate_ids], dtype=object).reshape(-1, 1) \
+        == np.array([t_id.lower() for t_id in t_ids], dtype=object).reshape(1, -1)
+    return matrix
+
+
+def _select(candidate_ids, matrix):
+    return {it for (it, selected) in zip(candidate_ids, matrix.any(axis=1)) if selected}
+
+
+def _get_ids(t_ids):
+    return [t_ids] if isinstance(t_ids, str) else list(t_ids)
+
+
+def partOf(t_ids, onto, candidate_ids):
+    """
+    Selects the candidate terms that are parts of any of the given terms
+    (checked at once, see mod_sbml.onto.obo_ontology.Ontology.get_part_of_matrix).
+    :param t_ids: id of the (whole) term of interest, or a collection of such ids
+    :param onto: the Gene Ontology
+    :param candidate_ids: ids of the candidate terms
+    :return: set of the selected candidate ids
+    """
+    candidate_ids = list(candidate_ids)
+    return _select(candidate_ids, onto.get_part_of_matrix(candidate_ids, _get_ids(t_ids)))
+
+
+def isA(t_ids, onto, candidate_ids):
+    """
+    Selects the candidate terms that are (or are descendants of) any of the given terms
+    (checked at once, see mod_sbml.onto.obo_ontology.Ontology.get_is_a_matrix).
+    :param t_ids: id of the (parent) term of interest, or a collection of such ids
+    :param onto: the Gene Ontology
+    :param candidate_ids: ids of the candidate terms
+    :return: set of the selected candidate ids
+    """
+    candidate_ids = list(candidate_ids)
+    return _select(candidate_ids, _get_is_a_matrix(candidate_ids, _get_ids(t_ids), onto))
+
+
+def isAorPartOf(t_ids, onto, candidate_ids):
+    """
+    Selects the candidate terms that are (or are descendants of) or are parts of any of the given terms
+    (see isA and partOf).
+    :param t_ids: id of the term of interest, or a collection of such ids
+    :param onto: the Gene Ontology
+    :param candidate_ids: ids of the candidate terms
+    :return: set of the selected candidate ids
+    """
+    candidate_ids, t_ids = list(candidate_ids), _get_ids(t_ids)
+    return _select(candidate_ids,
+                   _get_is_a_matrix(candidate_ids, t_ids, onto) | onto.get_part_of_matrix(candidate_ids, t_ids))
+
+
+def comp2level(model, onto=None):
     """
     Calculates levels of compartments in a given model, where 0 level corresponds to the outmost compartment(s),
     level i to the compartments surrounded by compartments of level i-1.
     :param model: libSBML model containing the compartments to be classified
-    :param onto: the Gene Ontology
+    :param onto: (optional) the Gene Ontology, if not given the shared one is used
+    (see mod_sbml.onto.registry.get_ontology)
     :return: dict: compartment_id -> level, e.g. {Boundary: 0, Cytosol: 1, Mitochondrion: 2, Peroxisome: 2}
     """
     outs_are_set = next((True for comp in model.getListOfCompartments() if comp.getOutside() is not None
@@ -91,12 +148,10 @@ def classify_cellular_components(t_ids, onto):
     inside_cell = isAorPartOf(GO_CELL, onto, t_ids)
 
     # organelles and their parts
-    organelle_parts = partOf(GO_ORGANELLE, onto, t_ids) | partOf(GO_NUCLEUS, onto, t_ids) \
-                      | partOf(GO_LIPID_PARTICLE, onto, t_ids)
+    organelle_parts = partOf((GO_ORGANELLE, GO_NUCLEUS, GO_LIPID_PARTICLE), onto, t_ids)
 
     not_org_parts = t_ids - organelle_parts
-    organelles = isA(GO_ORGANELLE, onto, not_org_parts) | isA(GO_NUCLEUS, onto, not_org_parts) | \
-                 isA(GO_LIPID_PARTICLE, onto, not_org_parts)
+    organelles = isA((GO_ORGANELLE, GO_NUCLEUS, GO_LIPID_PARTICLE), onto, not_org_parts)
     organelle_parts |= organelles
 
     inside_cell |= organelle_parts
@@ -138,7 +193,7 @@ def classify_organelle_parts(parts, onto):
     inner membranes, organelles, parts located inside organelles)
     """
     # envelope, membrane
-    envelopes = isAorPartOf(GO_ENVELOPE, onto, parts) | isAorPartOf(GO_MEMBRANE, onto, parts)
+    envelopes = isAorPartOf((GO_ENVELOPE, GO_MEMBRANE), onto, parts)
     insides = parts - envelopes
     # organelles
     organelles = isA(GO_ORGANELLE, onto, insides)
@@ -156,13 +211,16 @@ def classify_organelle_parts(parts, onto):
     return out_membranes, other_membranes, other_envelopes, in_membranes, organelles, insides
 
 
-def nest_compartments_with_gene_ontology(t_ids, onto):
+def nest_compartments_with_gene_ontology(t_ids, onto=None):
     """
     Update compartment hierarchy using the Gene Ontology
     :param t_ids: the Gene Ontology term ids for which the hierarchy is to be found
-    :param onto: the Gene Ontology
+    :param onto: (optional) the Gene Ontology, if not given the shared one is used
+    (see mod_sbml.onto.registry.get_ontology)
     :return: dict that maps compartment_term_id to outside_compartment_term_id
     """
+    if onto is None:
+        onto = get_ontology(get_go())
     # Look for outside compartments in the Gene Ontology
     comp2out = {t_id: get_outside_comp_id(t_id, onto, t_ids) for t_id in t_ids}
 
@@ -0,0 +1,164 @@
+"""
+Evaluation of the gene associations of a model for many gene sets (e.g. knockouts or expression scenarios) at once.
+
+The gene associations are compiled into disjunctive normal form:
+a reaction is active if all the genes of any of its clauses are available.
+The clauses are stored as a clause x gene boolean matrix, and their reactions as a clause x reaction one,
+so that a batch of scenarios is evaluated with two matrix products.
+The gene associations whose normal form would have more than MAX_CLAUSES clauses
+(e.g. complexes of many subunits with several isoforms each) are evaluated on their AND/OR tree instead,
+one numpy operation per tree node.
+"""
+import numpy as np
+
+from mod_sbml.sbml.gpr_parser import AND, get_genes
+from mod_sbml.sbml.sbml_manager import get_gene_association
+
+__author__ = 'anna'
+
+# number of scenarios evaluated at once, bounds the size of the intermediate scenario x clause matrix
+CHUNK_SIZE = 1024
+
+# maximal number of clauses of a gene association in disjunctive normal form
+MAX_CLAUSES = 256
+
+
+def _minimize(clauses):
+    # removes the clauses that include other ones, the smaller clauses are kept first
+    result = []
+    for clause in sorted(clauses, key=len):
+        if not any(other <= clause for other in result):
+            result.append(clause)
+    return set(result)
+
+
+def get_clauses(expression, max_clauses=MAX_CLAUSES):
+    """
+    Converts a parsed gene association into disjunctive normal form.
+    The clauses that include other ones are removed after each step of the conversion,
+    which stops as soon as there are too many clauses.
+    :param expression: the parsed gene association (see mod_sbml.sbml.sbml_manager.parse_gene_association),
+    e.g. (('A', 'and', 'B'), 'or', 'C')
+    :param max_clauses: maximal number of clauses (before their removal) to be considered
+    :return: set of clauses (frozensets of genes), without the clauses that include other ones,
+    e.g. {frozenset({'A', 'B'}), frozenset({'C'})}, or None if there are more than max_clauses of them
+    """
+    if not isinstance(expression, (list, tuple)):
+        return {frozenset([expression])}
+    operand_clauses = []
+    for it in expression[::2]:
+        clauses = get_clauses(it, max_clauses)
+        if clauses is None:
+            return None
+        operand_clauses.append(clauses)
+    if expression[1] in AND:
+        clauses = {frozenset()}
+        for it in operand_clauses:
+            if len(clauses) * len(it) > max_clauses:
+                return None
+            clauses = _minimize({clause | other for clause in clauses for other in it})
+        return clauses
+    if sum(len(it) for it in operand_clauses) > max_clauses:
+        return None
+    return _minimize(set().union(*operand_clauses))
+
+
+def _evaluate_tree(expression, gene2column):
+    if not isinstance(expression, (list, tuple)):
+        return gene2column[expression]
+    operands = [_evaluate_tree(it, gene2column) for it in expression[::2]]
+    return np.logical_and.reduce(operands) if expression[1] in AND else np.logical_or.reduce(operands)
+
+
+class CompiledGPR(object):
+    """
+    Gene associations of a set of reactions compiled into boolean matrices (see the module description).
+    The reactions without gene associations are active in any scenario,
+    and the reactions whose gene associations could not be parsed are never active.
+    The reactions whose gene associations have too many clauses (see get_clauses) are evaluated on their trees.
+    """
+
+    def __init__(self, r_id2ga):
+        """
+        Compiles the given gene associations.
+        :param r_id2ga: dict {reaction id: parsed gene association}, where the gene association is
+        either parsed (see mod_sbml.sbml.sbml_manager.parse_gene_association with flatten=False),
+        or empty (for the reactions that do not need genes), or None (if it could not be parsed)
+        """
+        self.r_ids = list(r_id2ga.keys())
+        r_id2clauses = {r_id: get_clauses(ga) for (r_id, ga) in r_id2ga.items() if ga}
+        # (reaction index, gene association) for the gene associations with too many clauses
+        self.trees = [(j, r_id2ga[r_id]) for (j, r_id) in enumerate(self.r_ids)
+                      if r_id in r_id2clauses and r_id2clauses[r_id] is None]
+        r_id2clauses = {r_id: clauses for (r_id, clauses) in r_id2clauses.items() if clauses is not None}
+        self.genes = sorted({gene for clauses in r_id2clauses.values() for clause in clauses for gene in clause}
+                            | {gene for (_, ga) in self.trees for gene in get_genes(ga)})
+        self.gene2index = {gene: i for (i, gene) in enumerate(self.genes)}
+        self.clauses = sorted({clause for clauses in r_id2clauses.values() for clause in clauses}, key=sorted)
+        clause2index = {clause: i for (i, clause) in enumerate(self.clauses)}
+
+        self.clause_gene_matrix = np.zeros((len(self.clauses), len(self.genes)), dtype=np.float32)
+        for i, clause in enumerate(self.clauses):
+            self.clause_gene_matrix[i, [self.gene2index[gene] for gene in clause]] = 1
+        self.clause_reaction_matrix = np.zeros((len(self.clauses), len(self.r_ids)), dtype=np.float32)
+        self.always_active = np.zeros(len(self.r_ids), dtype=bool)
+        for j, r_id in enumerate(self.r_ids):
+            if r_id in r_id2clauses:
+                self.clause_reaction_matrix[[clause2index[clause] for clause in r_id2clauses[r_id]], j] = 1
+            elif r_id2ga[r_id] is not None and not r_id2ga[r_id]:
+                self.always_active[j] = True
+
+    @staticmethod
+    def from_model(model):
+        """
+        Compiles the gene associations of the model reactions (see mod_sbml.sbml.sbml_manager.get_gene_association).
+        :param model: libsbml.Model model of interest
+        :return: CompiledGPR compiled gene associations
+        """
+        return CompiledGPR({r.getId(): get_gene_association(r, flatten=False) for r in model.getListOfReactions()})
+
+    def get_gene_matrix(self, gene_sets, knockout=False):
+        """
+        Converts the gene sets into a scenario x gene boolean matrix of the available genes.
+        :param gene_sets: list of collections of genes, one per scenario
+        :param knockout: if False the genes of each scenario are the available ones (the others are not),
+        otherwise they are the unavailable ones (and the others are available)
+        :return: numpy boolean array of shape (len(gene_sets), len(self.genes))
+        """
+        matrix = np.full((len(gene_sets), len(self.genes)), knockout, dtype=bool)
+        for i, genes in enumerate(gene_sets):
+            matrix[i, [self.gene2index[gene] for gene in genes if gene in self.gene2index]] = not knockout
+        return matrix
+
+    def evaluate(self, gene_sets, knockout=False):
+        """
+        Evaluates which reactions are active in each of the scenarios.
+        Note that unlike for mod_sbml.sbml.sbml_manager.get_gene_association with allowed_genes,
+        an empty collection of available genes makes all the gene-dependent reactions inactive.
+        :param gene_sets: list of collections of genes, one per scenario
+        :param knockout: if False the genes of each scenario are the available ones (the others are not),
+        otherwise they are the unavailable ones (and the others are available)
+        :return: numpy boolean array of shape (len(gene_sets), len(self.r_ids)), whose element [i, j] tells
+        if the j-th reaction (see self.r_ids) is active in the i-th scenario
+        """
+        return self.evaluate_gene_matrix(self.get_gene_matrix(gene_sets, knockout))
+
+    def evaluate_gene_matrix(self, gene_matrix):
+        """
+        Evaluates which reactions are active in each of the scenarios.
+        :param gene_matrix: numpy boolean array of shape (number of scenarios, len(self.genes)) of the available genes
+        :return: numpy boolean array of shape (number of scenarios, len(self.r_ids)) of the active reactions
+        """
+        result = np.empty((len(gene_matrix), len(self.r_ids)), dtype=bool)
+        for start in range(0, len(gene_matrix), CHUNK_SIZE):
+            chunk = gene_matrix[start: start + CHUNK_SIZE]
+            missing = (~chunk).astype(np.float32)
+            # a clause is satisfied if none of its genes is missing
+            satisfied = (missing @ self.clause_gene_matrix.T) == 0
+            result[start: start + CHUNK_SIZE] = \
+                (satisfied.astype(np.float32) @ self.clause_reaction_matrix > 0) | self.always_active
+            if self.trees:
+                gene2column = {gene: chunk[:, i] for (i, gene) in enumerate(self.genes)}
+                for j, ga in self.trees:
+                    result[start: start + CHUNK_SIZE, j] = _evaluate_tree(ga, gene2column)
+        return result
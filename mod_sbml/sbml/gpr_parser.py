@@ -0,0 +1,166 @@
+"""
+Parser of gene associations (gene-protein-reaction rules), e.g. '(3906 and 2683) or 8704'.
+
+The parser accepts the same language and produces the same structure
+as the pyparsing grammar it replaces (see parse_with_pyparsing, kept as a reference):
+'and' binds tighter than 'or', the operands of a chain of the same operator are grouped together,
+e.g. 'A and B and C or D' is parsed into [['A', 'and', 'B', 'and', 'C'], 'or', 'D'],
+and the parentheses only group their content.
+"""
+from functools import lru_cache
+
+import pyparsing as pp
+
+__author__ = 'anna'
+
+OR = ["OR", "or", "Or"]
+
+AND = ["AND", "and", "And"]
+
+GENE_CHARS = frozenset(pp.alphanums + "_.-")
+
+WHITESPACE = ' \n\t\r'
+
+CACHE_SIZE = 1 << 14
+
+
+def parse_with_pyparsing(ga, gene_parse_action=None):
+    """
+    Parses a gene association with pyparsing (the reference implementation of parse).
+    :param ga: str, gene association
+    :param gene_parse_action: (optional) function to be applied to each gene (see parse)
+    :return: the parsed gene association (see parse)
+    """
+    gene = pp.Word(initChars=pp.alphanums + "_.-")
+
+    if gene_parse_action:
+        gene = gene.setParseAction(gene_parse_action)
+
+    and_op = pp.oneOf(AND)
+    or_op = pp.oneOf(OR)
+
+    expr = pp.operatorPrecedence(gene, [
+        (and_op, 2, pp.opAssoc.LEFT,),
+        (or_op, 2, pp.opAssoc.LEFT,)
+    ])
+
+    return expr.parseString(ga, parseAll=True).asList()
+
+
+class _Parser(object):
+    """
+    Recursive-descent parser of a gene association string.
+    """
+
+    def __init__(self, ga):
+        self.ga = ga
+        self.pos = 0
+
+    def error(self, message):
+        return pp.ParseException(self.ga, self.pos, message)
+
+    def skip_whitespace(self):
+        while self.pos < len(self.ga) and self.ga[self.pos] in WHITESPACE:
+            self.pos += 1
+
+    def parse_operator(self, operators):
+        # like pyparsing oneOf, the operators are matched as prefixes, even if followed by a gene character
+        self.skip_whitespace()
+        for op in operators:
+            if self.ga.startswith(op, self.pos):
+                self.pos += len(op)
+                return op
+        return None
+
+    def parse_operand(self):
+        self.skip_whitespace()
+        if self.ga.startswith('(', self.pos):
+            self.pos += 1
+            result = self.parse_or()
+            self.skip_whitespace()
+            if not self.ga.startswith(')', self.pos):
+                raise self.error('Expected ")"')
+            self.pos += 1
+            return result
+        start = self.pos
+        while self.pos < len(self.ga) and self.ga[self.pos] in GENE_CHARS:
+            self.pos += 1
+        if start == self.pos:
+            raise self.error('Expected a gene')
+        return self.ga[start: self.pos]
+
+    def parse_chain(self, parse_operand, operators):
+        result = [parse_operand()]
+        while True:
+            op = self.parse_operator(operators)
+            if not op:
+                break
+            result.append(op)
+            result.append(parse_operand())
+        return result if len(result) > 1 else result[0]
+
+    def parse_and(self):
+        return self.parse_chain(self.parse_operand, AND)
+
+    def parse_or(self):
+        return self.parse_chain(self.parse_and, OR)
+
+    def parse(self):
+        result = self.parse_or()
+        self.skip_whitespace()
+        if self.pos < len(self.ga):
+            raise self.error('Expected end of text')
+        return result
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(ga):
+    def freeze(expression):
+        return tuple(freeze(it) for it in expression) if isinstance(expression, list) else expression
+
+    return freeze(_Parser(ga).parse())
+
+
+def _apply(expression, gene_parse_action):
+    if not isinstance(expression, tuple):
+        # like in pyparsing, an action that returns None keeps the gene unchanged
+        value = gene_parse_action([expression])
+        return expression if value is None else value
+    return [it if i % 2 else _apply(it, gene_parse_action) for (i, it) in enumerate(expression)]
+
+
+def parse(ga, gene_parse_action=None):
+    """
+    Parses a gene association.
+    The parsed (action-free) structures are cached by gene association string,
+    so that the genes of a repeated gene association are not parsed again.
+    :param ga: str, gene association, e.g. '(3906 and 2683) or 8704'
+    :param gene_parse_action: (optional) function to be applied to each gene occurrence:
+    it takes a list containing the gene as an input and returns its new value
+    (or None to keep the gene unchanged).
+    :return: the parsed gene association: either a gene or a list [operand_1, op, operand_2, op, ..., operand_n],
+    where the operands are genes or lists themselves, e.g. [['3906', 'and', '2683'], 'or', '8704']
+    :raise pyparsing.ParseException: if the gene association is malformed
+    """
+    result = _parse(ga)
+    if gene_parse_action:
+        return _apply(result, gene_parse_action)
+
+    def thaw(expression):
+        return [thaw(it) for it in expression] if isinstance(expression, tuple) else expression
+
+    return thaw(result)
+
+
+def get_genes(expression):
+    """
+    Lists the genes of a parsed gene association.
+    :param expression: the parsed gene association (see parse)
+    :return: set of genes
+    """
+    if not isinstance(expression, (list, tuple)):
+        return {expression} if expression else set()
+    genes = set()
+    for it in expression[::2]:
+        genes |= get_genes(it)
+    return genes
@@ -0,0 +1,175 @@
+from collections import defaultdict
+
+from mod_sbml.sbml.sbml_manager import get_stoichiometry
+
+__author__ = 'anna'
+
+
+def _get_participants(species_refs, stoichiometry=True):
+    return [(species_ref.getSpecies(), get_stoichiometry(species_ref) if stoichiometry else 1)
+            for species_ref in species_refs]
+
+
+class ModelIndex(object):
+    """
+    Adjacency of the reactions, species and compartments of a libsbml.Model,
+    read from the model in one pass, so that the queries do not rescan the model (nor call libsbml).
+
+    The helpers that take an optional index (e.g. mod_sbml.sbml.sbml_manager.get_r_comps) use it
+    instead of the model, and the ones that modify the model (e.g. mod_sbml.sbml.sbml_manager.create_reaction,
+    mod_sbml.sbml.submodel_manager.submodel) update or invalidate it.
+    An invalidated index is rebuilt from the model when it is next queried.
+    If the model is modified by other means, invalidate the index explicitly.
+    """
+
+    def __init__(self, model):
+        """
+        Creates an index of the given model (that is built when it is first queried).
+        :param model: libsbml.Model model to be indexed
+        """
+        self.model = model
+        self._built = False
+
+    def invalidate(self):
+        """
+        Marks the index as outdated, so that it is rebuilt from the model when it is next queried.
+        :return: void
+        """
+        self._built = False
+
+    def _build(self):
+        self.r_ids = []
+        self.r_id2reactants, self.r_id2products, self.r_id2modifiers = {}, {}, {}
+        self.s_id2r_ids, self.s_id2modifier_r_ids = defaultdict(set), defaultdict(set)
+        self.c_id2r_ids = defaultdict(set)
+        self.r_id2c_ids = {}
+        self.s_id2c_id = {s.getId(): s.getCompartment() for s in self.model.getListOfSpecies()}
+        self._built = True
+        for r in self.model.getListOfReactions():
+            self.add_reaction(r)
+
+    def _check(self):
+        if not self._built:
+            self._build()
+
+    def add_species(self, species):
+        """
+        Adds a species that was just created in the model to the index (if the index is already built).
+        :param species: libsbml.Species the new species
+        :return: void
+        """
+        if self._built:
+            self.s_id2c_id[species.getId()] = species.getCompartment()
+
+    def add_reaction(self, reaction):
+        """
+        Adds a reaction that was just created in the model to the index (if the index is already built).
+        The reaction's participants should already be set.
+        :param reaction: libsbml.Reaction the new reaction
+        :return: void
+        """
+        if not self._built:
+            return
+        r_id = reaction.getId()
+        self.r_ids.append(r_id)
+        self.r_id2reactants[r_id] = _get_participants(reaction.getListOfReactants())
+        self.r_id2products[r_id] = _get_participants(reaction.getListOfProducts())
+        # modifiers have no stoichiometry
+        self.r_id2modifiers[r_id] = _get_participants(reaction.getListOfModifiers(), False)
+        c_ids = set()
+        for (s_id, _) in self.r_id2reactants[r_id] + self.r_id2products[r_id]:
+            self.s_id2r_ids[s_id].add(r_id)
+            if s_id in self.s_id2c_id:
+                c_ids.add(self.s_id2c_id[s_id])
+        for (s_id, _) in self.r_id2modifiers[r_id]:
+            self.s_id2modifier_r_ids[s_id].add(r_id)
+        self.r_id2c_ids[r_id] = c_ids
+        for c_id in c_ids:
+            self.c_id2r_ids[c_id].add(r_id)
+
+    def get_reaction_ids(self):
+        """
+        :return: list of the ids of the model reactions, in the model order
+        """
+        self._check()
+        return self.r_ids
+
+    def get_reactants(self, r_id, stoichiometry=False):
+        """
+        :param r_id: id of the reaction of interest
+        :param stoichiometry: whether to return the stoichiometries as well
+        :return: list of the reactant ids (or of the (reactant id, stoichiometry) pairs if stoichiometry is True)
+        """
+        self._check()
+        return self._get_ids(self.r_id2reactants.get(r_id, []), stoichiometry)
+
+    def get_products(self, r_id, stoichiometry=False):
+        """
+        :param r_id: id of the reaction of interest
+        :param stoichiometry: whether to return the stoichiometries as well
+        :return: list of the product ids (or of the (product id, stoichiometry) pairs if stoichiometry is True)
+        """
+        self._check()
+        return self._get_ids(self.r_id2products.get(r_id, []), stoichiometry)
+
+    def get_modifiers(self, r_id, stoichiometry=False):
+        """
+        :param r_id: id of the reaction of interest
+        :param stoichiometry: whether to return the stoichiometries as well
+        :return: list of the modifier ids (or of the (modifier id, stoichiometry) pairs if stoichiometry is True)
+        """
+        self._check()
+        return self._get_ids(self.r_id2modifiers.get(r_id, []), stoichiometry)
+
+    @staticmethod
+    def _get_ids(participants, stoichiometry):
+        return list(participants) if stoichiometry else [s_id for (s_id, _) in participants]
+
+    def get_metabolites(self, r_id, stoichiometry=False, include_modifiers=False):
+        """
+        Lists the participants of a reaction (see mod_sbml.sbml.sbml_manager.get_metabolites).
+        :param r_id: id of the reaction of interest
+        :param stoichiometry: whether to return the stoichiometries as well
+        :param include_modifiers: whether the modifiers should be included
+        :return: set of the participant ids (or of the (participant id, stoichiometry) pairs if stoichiometry is True)
+        """
+        result = set(self.get_reactants(r_id, stoichiometry)) | set(self.get_products(r_id, stoichiometry))
+        if include_modifiers:
+            result |= set(self.get_modifiers(r_id, stoichiometry))
+        return result
+
+    def get_r_ids(self, s_id, include_modifiers=False):
+        """
+        :param s_id: id of the species of interest
+        :param include_modifiers: whether the reactions the species is a modifier of should be included
+        :return: set of the ids of the reactions the species participates in
+        """
+        self._check()
+        r_ids = set(self.s_id2r_ids.get(s_id, ()))
+        if include_modifiers:
+            r_ids |= self.s_id2modifier_r_ids.get(s_id, set())
+        return r_ids
+
+    def get_compartment(self, s_id):
+        """
+        :param s_id: id of the species of interest
+        :return: id of the species compartment (or None if there is no such species)
+        """
+        self._check()
+        return self.s_id2c_id.get(s_id, None)
+
+    def get_r_comps(self, r_id):
+        """
+        :param r_id: id of the reaction of interest
+        :return: set of the ids of the compartments of the reaction reactants and products
+        """
+        self._check()
+        return set(self.r_id2c_ids.get(r_id, ()))
+
+    def get_r_ids_by_comp(self, c_id):
+        """
+        :param c_id: id of the compartment of interest
+        :return: set of the ids of the reactions that have reactants or products in this compartment
+        """
+        self._check()
+        return set(self.c_id2r_ids.get(c_id, ()))
@@ -3,6 +3,9 @@ from mod_sbml.sbml.sbml_manager import get_metabolites, get_r_comps, get_reactan
 
 __author__ = 'anna'
 
+# The filters that look at the reaction participants accept an optional index of the model
+# (mod_sbml.sbml.model_index.ModelIndex) to be used instead of the model.
+
 
 # by genes
 def matches_genes(gene_collection, reaction):
@@ -36,30 +39,30 @@ def matches_name(name, reaction):
 
 
 # by compartment
-def matches_compartment_id_weakly(compartment_id, reaction, model):
-    return compartment_id in get_r_comps(reaction.getId(), model)
+def matches_compartment_id_weakly(compartment_id, reaction, model, index=None):
+    return compartment_id in get_r_comps(reaction.getId(), model, index)
 
 
-def matches_compartment_id(compartment_ids, reaction, model):
-    return not (get_r_comps(reaction.getId(), model) - compartment_ids)
+def matches_compartment_id(compartment_ids, reaction, model, index=None):
+    return not (get_r_comps(reaction.getId(), model, index) - compartment_ids)
 
 
-def matches_compartment_name_weakly(comp_name, reaction, model):
+def matches_compartment_name_weakly(comp_name, reaction, model, index=None):
     if not comp_name:
         return False
     comp_name = comp_name.lower()
-    for c_id in get_r_comps(reaction.getId(), model):
+    for c_id in get_r_comps(reaction.getId(), model, index):
         c_name = model.getCompartment(c_id).getName()
         if c_name and c_name.lower().find(comp_name) != -1:
             return True
     return False
 
 
-def matches_compartment_name(comp_name, reaction, model):
+def matches_compartment_name(comp_name, reaction, model, index=None):
     if not comp_name:
         return False
     comp_name = comp_name.lower()
-    c_ids = get_r_comps(reaction.getId(), model)
+    c_ids = get_r_comps(reaction.getId(), model, index)
     for c_id in c_ids:
         c_name = model.getCompartment(c_id).getName()
         if not c_name or c_name.lower().find(comp_name) == -1:
@@ -67,12 +70,11 @@ def matches_compartment_name(comp_name, reaction, model):
     return len(c_ids) > 0
 
 
-def is_not_transport(reaction, model):
+def is_not_transport(reaction, model, index=None):
     c_id = None
-    participants = get_metabolites(reaction)
+    participants = index.get_metabolites(reaction.getId()) if index else get_metabolites(reaction)
     for speciesId in participants:
-        species = model.getSpecies(speciesId)
-        compartment_id = species.getCompartment()
+        compartment_id = index.get_compartment(speciesId) if index else model.getSpecies(speciesId).getCompartment()
         if not compartment_id:
             return False
         if not c_id:
@@ -83,15 +85,20 @@ def is_not_transport(reaction, model):
 
 
 # by species
-def matches_species_id(species_ids, reaction, include_modifiers=True):
-    return set(species_ids) & get_metabolites(reaction, include_modifiers=include_modifiers)
+def _get_metabolites(reaction, include_modifiers, index):
+    return index.get_metabolites(reaction.getId(), include_modifiers=include_modifiers) if index \
+        else get_metabolites(reaction, include_modifiers=include_modifiers)
+
+
+def matches_species_id(species_ids, reaction, include_modifiers=True, index=None):
+    return set(species_ids) & _get_metabolites(reaction, include_modifiers, index)
 
 
-def matches_species_name(name, reaction, model, include_modifiers=True):
+def matches_species_name(name, reaction, model, include_modifiers=True, index=None):
     if not name:
         return False
     name = name.lower()
-    for speciesId in get_metabolites(reaction, include_modifiers=include_modifiers):
+    for speciesId in _get_metabolites(reaction, include_modifiers, index):
         species = model.getSpecies(speciesId)
         if not species:
             continue
@@ -101,21 +108,21 @@ def matches_species_name(name, reaction, model, include_modifiers=True):
     return False
 
 
-def matches_reactant_id(s_id, reaction):
-    return s_id in set(get_reactants(reaction))
+def matches_reactant_id(s_id, reaction, index=None):
+    return s_id in set(index.get_reactants(reaction.getId()) if index else get_reactants(reaction))
 
 
-def matches_product_id(s_id, reaction):
-    return s_id in set(get_products(reaction))
+def matches_product_id(s_id, reaction, index=None):
+    return s_id in set(index.get_products(reaction.getId()) if index else get_products(reaction))
 
 
-def matches_modifier_id(s_id, reaction):
-    return s_id in set(get_modifiers(reaction))
+def matches_modifier_id(s_id, reaction, index=None):
+    return s_id in set(index.get_modifiers(reaction.getId()) if index else get_modifiers(reaction))
 
 
-def matches_reactant_product_pair(reaction, s_id1, s_id2):
-    reactants = set(get_reactants(reaction))
-    products = set(get_products(reaction))
+def matches_reactant_product_pair(reaction, s_id1, s_id2, index=None):
+    reactants = set(index.get_reactants(reaction.getId()) if index else get_reactants(reaction))
+    products = set(index.get_products(reaction.getId()) if index else get_products(reaction))
     if s_id1 in reactants:
         return s_id2 in products
     elif s_id2 in reactants:
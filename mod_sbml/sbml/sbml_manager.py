@@ -1,15 +1,14 @@
 from collections import defaultdict
+from functools import lru_cache
 import logging
 import os
 
 import libsbml
 import pyparsing as pp
 
-SBO_COMPARTMENT = 'SBO:0000290'
-
-OR = ["OR", "or", "Or"]
+from mod_sbml.sbml.gpr_parser import parse, get_genes as get_parsed_genes, AND, CACHE_SIZE
 
-AND = ["AND", "and", "And"]
+SBO_COMPARTMENT = 'SBO:0000290'
 
 SBO_MATERIAL_ENTITY = "SBO:0000240"
 
@@ -23,6 +22,10 @@ PATHWAY_PREFIX = "SUBSYSTEM:"
 
 FORMULA_PREFIX = "FORMULA:"
 
+PW_PREFIX = "Pathway:"
+
+NOTES_PREFIXES = (GA_PREFIX, PATHWAY_PREFIX, PW_PREFIX, EC_PREFIX, FORMULA_PREFIX)
+
 
 def get_model_name(sbml=None, model=None):
     if not model:
@@ -34,25 +37,63 @@ def get_model_name(sbml=None, model=None):
     return model_name.replace('_', ' ').strip()
 
 
-def _get_prefixed_notes_value(notes, result, prefix):
+def _get_notes_texts(notes, result):
     if not notes:
         return
     for i in range(0, notes.getNumChildren()):
         child = notes.getChild(i)
         note = child.getCharacters()
         if note:
+            result.append(note)
+        _get_notes_texts(child, result)
+
+
+def get_notes_values(element, memo=None):
+    """
+    Collects all the prefixed values of the element notes (e.g. GENE_ASSOCIATION: A or B) in one pass over them.
+    The known prefixes (GENE_ASSOCIATION:, SUBSYSTEM:, Pathway:, EC Number:, FORMULA:) are found anywhere in a note,
+    the other notes are split at their first colon.
+    :param element: libsbml.SBase element of interest (e.g. libsbml.Reaction)
+    :param memo: (optional) dict {element id: notes values} owned by the caller, where the values of the elements
+    of one model are kept between calls; the functions of this module that modify the notes
+    (e.g. set_gene_association) remove the element from the memo they are given.
+    :return: dict {prefix (including the colon): frozenset of values}
+    """
+    e_id = element.getId() if memo is not None else None
+    if e_id and e_id in memo:
+        return memo[e_id]
+    texts = []
+    _get_notes_texts(element.getNotes(), texts)
+    prefix2values = defaultdict(set)
+    for note in texts:
+        known = False
+        for prefix in NOTES_PREFIXES:
             start = note.find(prefix)
             if start != -1:
-                start += len(prefix)
-                result.add(note[start:].strip())
-        _get_prefixed_notes_value(child, result, prefix)
+                prefix2values[prefix].add(note[start + len(prefix):].strip())
+                known = True
+        if not known:
+            prefix, colon, value = note.partition(':')
+            if colon and prefix.strip():
+                prefix2values[prefix.strip() + colon].add(value.strip())
+    result = {prefix: frozenset(values) for (prefix, values) in prefix2values.items()}
+    if e_id:
+        memo[e_id] = result
+    return result
 
 
-def get_ec_numbers(reaction):
-    result = set()
-    node = reaction.getNotes()
-    _get_prefixed_notes_value(node, result, EC_PREFIX)
-    return result
+def _get_notes_values(element, memo, *prefixes):
+    prefix2values = get_notes_values(element, memo)
+    return set().union(*(prefix2values.get(prefix, ()) for prefix in prefixes))
+
+
+def _forget_notes(element, memo):
+    if memo is not None:
+        memo.pop(element.getId(), None)
+
+
+def get_ec_numbers(reaction, memo=None):
+    return _get_notes_values(reaction, memo, EC_PREFIX)
 
 
 def _remove_duplicates(expression, flatten=False):
@@ -99,30 +140,37 @@ def _filter(expression, allowed_values, flatten=False):
     return '(%s)' % ' '.join(result[: -1]) if flatten else tuple(result[: -1])
 
 
-def parse_gene_association(ga, gene_parse_action=None, flatten=True):
-    if not ga:
-        return ga
-
-    gene = pp.Word(initChars=pp.alphanums + "_.-")
+def _simplify(res, flatten):
+    while not isinstance(res, str) and len(res) == 1:
+        res = res[0]
+    return _remove_duplicates(res, flatten=flatten)
 
-    if gene_parse_action:
-        gene = gene.setParseAction(gene_parse_action)
 
-    and_op = pp.oneOf(AND)
-    or_op = pp.oneOf(OR)
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse_gene_association(ga, flatten):
+    # the results are strings or tuples, so they can be shared
+    return _simplify(parse(ga), flatten)
 
-    expr = pp.operatorPrecedence(gene, [
-        (and_op, 2, pp.opAssoc.LEFT,),
-        (or_op, 2, pp.opAssoc.LEFT,)
-    ])
 
-    res = expr.parseString(ga, parseAll=True).asList()
-    while not isinstance(res, str) and len(res) == 1:
-        res = res[0]
-    return _remove_duplicates(res, flatten=flatten)
+def parse_gene_association(ga, gene_parse_action=None, flatten=True):
+    """
+    Parses a gene association (see mod_sbml.sbml.gpr_parser.parse) and removes the duplicated operands.
+    The results for the gene associations parsed without a gene parse action are cached.
+    :param ga: str, gene association, e.g. '(3906 and 2683) or 8704'
+    :param gene_parse_action: (optional) function to be applied to each gene (see get_gene_association)
+    :param flatten: whether to return the gene association as a string, e.g. '((3906 and 2683) or 8704)',
+    or as a tuple, e.g. (('3906', 'and', '2683'), 'or', '8704')
+    :return: the parsed gene association
+    :raise pyparsing.ParseException: if the gene association is malformed
+    """
+    if not ga:
+        return ga
+    if not gene_parse_action:
+        return _parse_gene_association(ga, flatten)
+    return _simplify(parse(ga, gene_parse_action), flatten)
 
 
-def get_gene_association(reaction, gene_parse_action=None, flatten=True, allowed_genes=None):
+def get_gene_association(reaction, gene_parse_action=None, flatten=True, allowed_genes=None, memo=None):
     """
     Extracts gene association encoded as a note prefixed with GENE_ASSOCIATION:.
     :param allowed_genes: if allowed_genes are specified the resulting gene association will be filtered
@@ -135,15 +183,14 @@ def get_gene_association(reaction, gene_parse_action=None, flatten=True, allowed
     If gene_parse_action is None (default), no modification to the genes is made.
     :param flatten: whether to return the gene association as a string (True), e.g. '((3906 and 2683) or 8704)',
     or as a list (False), e.g. [['3906', 'and', '2683'], 'or', '8704'].
+    :param memo: (optional) notes values memo (see get_notes_values)
     :return: the gene association as a string (if flatten is True), e.g. '((3906 and 2683) or 8704)',
     or as a list (if flatten is False), e.g. [['3906', 'and', '2683'], 'or', '8704']; empty for spontaneous reactions;
     or None if there was a parsing problem or if the needed genes are not present among the allowed ones.
     """
-    result = set()
-    node = reaction.getNotes()
-    _get_prefixed_notes_value(node, result, GA_PREFIX)
+    result = _get_notes_values(reaction, memo, GA_PREFIX)
     if result:
-        ga = result.pop()
+        ga = next(iter(result))
         try:
             ga = parse_gene_association(ga, gene_parse_action=gene_parse_action,
                                         flatten=False if allowed_genes else flatten)
@@ -182,10 +229,11 @@ def _get_nodes_of_type(node, type):
                 yield res
 
 
-def set_gene_association(reaction, gene_association):
+def set_gene_association(reaction, gene_association, memo=None):
     """Sets the reaction gene association. (The old gene association will be overwritten)
+    If the notes values memo is given (see get_notes_values), the reaction is removed from it.
     """
-    remove_gene_association(reaction)
+    remove_gene_association(reaction, memo)
 
     if not gene_association:
         return
@@ -194,16 +242,18 @@ def set_gene_association(reaction, gene_association):
 
     body = next(_get_nodes_of_type(reaction.getNotes(), 'body'), None)
     if body:
-        body.addChild(libsbml.XMLNode_convertStringToXMLNode(s))
+        body.addChild(libsbml.XMLNode.convertStringToXMLNode(s))
     else:
-        reaction.setNotes(libsbml.XMLNode_convertStringToXMLNode(
+        reaction.setNotes(libsbml.XMLNode.convertStringToXMLNode(
             str("<body xmlns='http://www.w3.org/1999/xhtml'>%s</body>" % s)))
 
 
-def set_formula(species, formula):
+def set_formula(species, formula, memo=None):
     """Sets the species formula. (The old formula will be overwritten)
+    If the notes values memo is given (see get_notes_values), the species is removed from it.
     """
     _remove_note_containing_text_of_interest(species.getNotes(), FORMULA_PREFIX)
+    _forget_notes(species, memo)
 
     if not formula:
         return
@@ -212,40 +262,33 @@ def set_formula(species, formula):
 
     body = next(_get_nodes_of_type(species.getNotes(), 'body'), None)
     if body:
-        body.addChild(libsbml.XMLNode_convertStringToXMLNode(s))
+        body.addChild(libsbml.XMLNode.convertStringToXMLNode(s))
     else:
-        species.setNotes(libsbml.XMLNode_convertStringToXMLNode(
+        species.setNotes(libsbml.XMLNode.convertStringToXMLNode(
             str("<body xmlns='http://www.w3.org/1999/xhtml'>%s</body>" % s)))
 
 
-def remove_gene_association(reaction):
+def remove_gene_association(reaction, memo=None):
     """Removes the reaction gene association.
+    If the notes values memo is given (see get_notes_values), the reaction is removed from it.
     """
     _remove_note_containing_text_of_interest(reaction.getNotes(), GA_PREFIX)
+    _forget_notes(reaction, memo)
 
 
-def get_genes(reaction):
+def get_genes(reaction, memo=None):
     """
     Extracts a set of genes from the gene association encoded as a note prefixed with GENE_ASSOCIATION:.
     :param reaction: the reaction of interest (libsbml.Reaction)
+    :param memo: (optional) notes values memo (see get_notes_values)
     :return: a set of genes of interest.
     """
-    genes = set()
-
-    def gene_parse_action(t):
-        genes.add(t[0])
-        return t[0]
+    ga = get_gene_association(reaction, flatten=False, memo=memo)
+    return get_parsed_genes(ga) if ga else set()
 
-    get_gene_association(reaction, gene_parse_action=gene_parse_action, flatten=False)
-    return genes
 
-
-def get_pathway_expression(reaction):
-    result = set()
-    node = reaction.getNotes()
-    _get_prefixed_notes_value(node, result, PATHWAY_PREFIX)
-    _get_prefixed_notes_value(node, result, "Pathway:")
-    return result
+def get_pathway_expression(reaction, memo=None):
+    return _get_notes_values(reaction, memo, PATHWAY_PREFIX, PW_PREFIX)
 
 
 def get_subsystem2r_ids(sbml=None, model=None):
@@ -265,18 +308,13 @@ def get_subsystem2r_ids(sbml=None, model=None):
     return subsystem2r_ids, no_pathway_r_ids
 
 
-def get_formulas(species):
-    result = set()
-    node = species.getNotes()
-    _get_prefixed_notes_value(node, result, FORMULA_PREFIX)
+def get_formulas(species, memo=None):
+    result = _get_notes_values(species, memo, FORMULA_PREFIX)
     return {formula.strip() for formula in result if formula and '.' != formula.strip()}
 
 
-def get_subsystem(reaction):
-    result = set()
-    node = reaction.getNotes()
-    _get_prefixed_notes_value(node, result, PATHWAY_PREFIX)
-    return result
+def get_subsystem(reaction, memo=None):
+    return _get_notes_values(reaction, memo, PATHWAY_PREFIX)
 
 
 def copy_sbml(sbml_in, sbml_out):
@@ -325,13 +363,22 @@ def get_metabolites(reaction, stoichiometry=False, include_modifiers=False):
     return result
 
 
-def get_r_comps(r_id, model):
+def get_r_comps(r_id, model, index=None):
+    """
+    Finds the compartments of the reaction reactants and products.
+    :param r_id: id of the reaction of interest
+    :param model: libsbml.Model model
+    :param index: (optional) mod_sbml.sbml.model_index.ModelIndex index of the model, to be used instead of it
+    :return: set of compartment ids
+    """
+    if index:
+        return index.get_r_comps(r_id)
     r = model.getReaction(r_id)
     return {model.getSpecies(s_id).getCompartment() for s_id in get_metabolites(r, include_modifiers=False)}
 
 
 def create_species(model, compartment_id, name=None, bound=False, id_=None, type_id=None, sbo_id=SBO_MATERIAL_ENTITY,
-                   charge=None):
+                   charge=None, index=None):
     new_species = model.createSpecies()
     id_ = generate_unique_id(model, id_ if id_ else "s")
     if libsbml.LIBSBML_OPERATION_SUCCESS != new_species.setId(id_):
@@ -349,6 +396,8 @@ def create_species(model, compartment_id, name=None, bound=False, id_=None, type
             new_species.setCharge(charge)
         except:
             pass
+    if index:
+        index.add_species(new_species)
     return new_species
 
 
@@ -396,11 +445,23 @@ def generate_unique_id(model, id_=None, i=0):
     return "%s%d" % (id_, i)
 
 
-def get_r_ids_by_s_ids(model, s_ids):
+def get_r_ids_by_s_ids(model, s_ids, index=None):
+    if index:
+        r_ids = set()
+        for s_id in s_ids:
+            r_ids |= index.get_r_ids(s_id)
+        return r_ids
     return {r.id for r in model.getListOfReactions() if set(s_ids) & get_metabolites(r)}
 
 
-def get_r_ids_by_comp(model, comps, strict=False):
+def get_r_ids_by_comp(model, comps, strict=False, index=None):
+    if index:
+        if strict:
+            return {r_id for r_id in index.get_reaction_ids() if not index.get_r_comps(r_id) - comps}
+        r_ids = set()
+        for c_id in comps:
+            r_ids |= index.get_r_ids_by_comp(c_id)
+        return r_ids
     r_ids = set()
     for r in model.getListOfReactions():
         s_ids = get_metabolites(r)
@@ -410,15 +471,16 @@ def get_r_ids_by_comp(model, comps, strict=False):
     return r_ids
 
 
-def get_pathway_by_species(s_ids, model, ubiquitous_s_ids, blocked_r_ids=None):
+def get_pathway_by_species(s_ids, model, ubiquitous_s_ids, blocked_r_ids=None, index=None):
     s_id2r_ids, r_id2s_ids = defaultdict(set), {}
-    for r in model.getListOfReactions():
-        if blocked_r_ids and r.id in blocked_r_ids:
+    for r_id, metabolites in ((r_id, index.get_metabolites(r_id)) for r_id in index.get_reaction_ids()) if index \
+            else ((r.id, get_metabolites(r)) for r in model.getListOfReactions()):
+        if blocked_r_ids and r_id in blocked_r_ids:
             continue
-        sp_ids = get_metabolites(r) - ubiquitous_s_ids
-        r_id2s_ids[r.id] = sp_ids
+        sp_ids = metabolites - ubiquitous_s_ids
+        r_id2s_ids[r_id] = sp_ids
         for sp_id in sp_ids:
-            s_id2r_ids[sp_id].add(r.id)
+            s_id2r_ids[sp_id].add(r_id)
     s_ids_to_process = set(s_ids)
     s_ids_processed = set()
     r_ids = set()
@@ -442,7 +504,7 @@ def get_pathway_by_species(s_ids, model, ubiquitous_s_ids, blocked_r_ids=None):
     return r_ids
 
 
-def create_reaction(model, r_id2st, p_id2st, name=None, reversible=True, id_=None):
+def create_reaction(model, r_id2st, p_id2st, name=None, reversible=True, id_=None, index=None):
     new_r_id = generate_unique_id(model, id_=id_)
     new_r = model.createReaction()
     if libsbml.LIBSBML_OPERATION_SUCCESS != new_r.setId(new_r_id):
@@ -459,6 +521,8 @@ def create_reaction(model, r_id2st, p_id2st, name=None, reversible=True, id_=Non
         sr = new_r.createProduct()
         sr.setSpecies(m_id)
         sr.setStoichiometry(st)
+    if index:
+        index.add_reaction(new_r)
     return new_r
 
 
@@ -1,10 +1,18 @@
 from collections import Counter
+from multiprocessing import Pool
 
+import libsbml
+
+from mod_sbml.sbml.gpr_evaluator import CompiledGPR
+from mod_sbml.sbml.model_index import ModelIndex
 from mod_sbml.sbml.sbml_manager import get_metabolites, get_reactants, get_products, get_modifiers, \
     get_gene_association, set_gene_association
 
 __author__ = 'anna'
 
+# the per-process _Template of the submodel batch, set by the pool initializer (see write_submodels_by_genes)
+_template = None
+
 
 def submodel_by_genes(model, genes_of_interest, keep_spontaneous_reactions=True):
     """
@@ -23,27 +31,32 @@ def submodel_by_genes(model, genes_of_interest, keep_spontaneous_reactions=True)
     submodel(r_ids, model)
 
 
-def extend_selection_with_spontaneous_reactions(model, r_ids, spontaneous_r_ids):
+def extend_selection_with_spontaneous_reactions(model, r_ids, spontaneous_r_ids, index=None):
     """
     Iteratively enlarges the selection of reaction ids with spontaneous reactions whose input(output) metabolites
     can be produced(consumed) by currently selected reactions.
     :param model: libsbml.Model
     :param r_ids: a collection of selected reaction ids
     :param spontaneous_r_ids: a collection of spontaneous reaction ids
+    :param index: (optional) mod_sbml.sbml.model_index.ModelIndex index of the model, to be used instead of it
     :return: an extended collection of selected reaction ids
     """
     new_r_ids = set(r_ids)
     if spontaneous_r_ids:
         s_ids = set()
-        for r in (model.getReaction(r_id) for r_id in new_r_ids):
-            s_ids |= get_metabolites(r)
+        for r_id in new_r_ids:
+            s_ids |= index.get_metabolites(r_id) if index else get_metabolites(model.getReaction(r_id))
         updated = True
         while updated:
             updated = False
-            for r in (model.getReaction(r_id) for r_id in spontaneous_r_ids):
-                rs, ps = set(get_reactants(r)), set(get_products(r))
+            for r_id in spontaneous_r_ids:
+                if index:
+                    rs, ps = set(index.get_reactants(r_id)), set(index.get_products(r_id))
+                else:
+                    r = model.getReaction(r_id)
+                    rs, ps = set(get_reactants(r)), set(get_products(r))
                 if rs and rs == rs & s_ids or ps and ps == ps & s_ids:
-                    new_r_ids.add(r.getId())
+                    new_r_ids.add(r_id)
                     n = len(s_ids)
                     s_ids |= rs | ps
                     if len(s_ids) > n:
@@ -72,19 +85,146 @@ def get_reaction_ids_by_genes(model, genes_of_interest):
     return r_ids, spontaneous_r_ids
 
 
-def submodel(r_ids_to_keep, model):
-    for r_id in [r.id for r in model.getListOfReactions() if r.id not in r_ids_to_keep]:
+class _Template(object):
+    """
+    Template model of a submodel batch, with its index and compiled gene associations.
+    It is pickled as its SBML string, so that the processes that are not forked can rebuild it.
+    """
+
+    def __init__(self, doc):
+        """
+        Indexes the template model and compiles its gene associations.
+        :param doc: libsbml.SBMLDocument document containing the template model
+        """
+        self.doc = doc
+        model = self.doc.getModel()
+        self.index = ModelIndex(model)
+        self.r_id2ga = {r.getId(): get_gene_association(r, flatten=False) for r in model.getListOfReactions()}
+        self.gpr = CompiledGPR(self.r_id2ga)
+        self.c_id2outside = {c.getId(): c.getOutside() for c in model.getListOfCompartments()}
+
+    def __getstate__(self):
+        return libsbml.writeSBMLToString(self.doc)
+
+    def __setstate__(self, state):
+        self.__init__(libsbml.readSBMLFromString(state))
+
+    def get_kept_ids(self, genes, keep_spontaneous_reactions=True):
+        """
+        Finds the reactions, species and compartments that submodel_by_genes would keep.
+        :param genes: collection of genes of interest
+        :param keep_spontaneous_reactions: whether the reactions that have no gene associations should be kept
+        :return: tuple (reaction ids, species ids, compartment ids)
+        """
+        # like in get_gene_association, no genes of interest means no filtering
+        active = self.gpr.evaluate([genes if genes else self.gpr.genes])[0]
+        r_ids = {r_id for (r_id, is_active) in zip(self.gpr.r_ids, active) if is_active and self.r_id2ga[r_id]}
+        if keep_spontaneous_reactions:
+            spontaneous_r_ids = {r_id for (r_id, ga) in self.r_id2ga.items() if ga is not None and not ga}
+            r_ids = extend_selection_with_spontaneous_reactions(None, r_ids, spontaneous_r_ids, self.index)
+        s_ids = set()
+        for r_id in r_ids:
+            s_ids |= self.index.get_metabolites(r_id)
+        c_ids = set()
+        for c_id in {self.index.get_compartment(s_id) for s_id in s_ids}:
+            while c_id and c_id not in c_ids:
+                c_ids.add(c_id)
+                c_id = self.c_id2outside.get(c_id)
+        return r_ids, s_ids, c_ids
+
+    def write_submodel(self, genes, path, keep_spontaneous_reactions=True):
+        """
+        Writes the submodel of the template model that submodel_by_genes would create to a file.
+        :param genes: collection of genes of interest
+        :param path: path to the output SBML file
+        :param keep_spontaneous_reactions: whether the reactions that have no gene associations should be kept
+        :return: tuple (path, number of reactions, number of species, number of compartments) of the submodel
+        """
+        r_ids, s_ids, c_ids = self.get_kept_ids(genes, keep_spontaneous_reactions)
+        doc = self.doc.clone()
+        model = doc.getModel()
+        for r_id in self.index.get_reaction_ids():
+            if r_id not in r_ids:
+                model.removeReaction(r_id)
+            elif self.r_id2ga[r_id]:
+                r = model.getReaction(r_id)
+                set_gene_association(r, get_gene_association(r, flatten=True, allowed_genes=genes))
+        for s_id in [s.getId() for s in model.getListOfSpecies() if s.getId() not in s_ids]:
+            model.removeSpecies(s_id)
+        for c_id in [c.getId() for c in model.getListOfCompartments() if c.getId() not in c_ids]:
+            model.removeCompartment(c_id)
+        libsbml.SBMLWriter().writeSBMLToFile(doc, path)
+        return path, len(r_ids), len(s_ids), len(c_ids)
+
+
+def _init_worker(template):
+    global _template
+    _template = template
+
+
+def _write_submodel(args):
+    genes, path, keep_spontaneous_reactions = args
+    return _template.write_submodel(genes, path, keep_spontaneous_reactions)
+
+
+def write_submodels_by_genes(sbml, gene_sets, paths, keep_spontaneous_reactions=True, processes=None):
+    """
+    Creates a submodel of the given model for each of the given gene sets (see submodel_by_genes)
+    and writes it to a file. The model is parsed once per call, indexed and its gene associations compiled,
+    the submodel elements are found with the index, and the submodels are created and written
+    in a pool of processes, each of which holds only the template and the submodel it is writing.
+    :param sbml: path to the SBML file containing the template model
+    :param gene_sets: list of collections of genes of interest, one per submodel
+    :param paths: list of paths to the output SBML files, one per submodel
+    :param keep_spontaneous_reactions: whether the reactions that have no gene associations should be kept
+    :param processes: number of processes to be used (by default as many as there are CPUs),
+    if 1 the submodels are written in the current process
+    :return: list of tuples (path, number of reactions, number of species, number of compartments),
+    one per submodel, in the order of the gene sets
+    """
+    template = _Template(libsbml.SBMLReader().readSBML(sbml))
+    jobs = [(set(genes), path, keep_spontaneous_reactions) for (genes, path) in zip(gene_sets, paths)]
+    if 1 == processes:
+        return [template.write_submodel(*job) for job in jobs]
+    # build the index now, so that the forked processes inherit it
+    template.index.get_reaction_ids()
+    path2result = {}
+    with Pool(processes, initializer=_init_worker, initargs=(template,)) as pool:
+        for result in pool.imap_unordered(_write_submodel, jobs):
+            path2result[result[0]] = result
+    return [path2result[path] for path in paths]
+
+
+def submodel(r_ids_to_keep, model, index=None):
+    """
+    Removes the reactions that are not to be kept from the model, together with the species and compartments
+    that become unused.
+    :param r_ids_to_keep: collection of ids of the reactions to be kept
+    :param model: libsbml.Model model to be modified
+    :param index: (optional) mod_sbml.sbml.model_index.ModelIndex index of the model, it gets invalidated
+    :return: void
+    """
+    r_ids = index.get_reaction_ids() if index else [r.id for r in model.getListOfReactions()]
+    for r_id in [r_id for r_id in r_ids if r_id not in r_ids_to_keep]:
         model.removeReaction(r_id)
-    remove_unused_species(model)
+    if index:
+        index.invalidate()
+    remove_unused_species(model, index=index)
     remove_unused_compartments(model)
 
 
-def remove_unused_species(model, keep_modifiers=False):
+def remove_unused_species(model, keep_modifiers=False, index=None):
     s_ids_to_keep = set()
-    for r in model.getListOfReactions():
-        s_ids_to_keep |= get_metabolites(r, include_modifiers=keep_modifiers)
+    if index:
+        for r_id in index.get_reaction_ids():
+            s_ids_to_keep |= index.get_metabolites(r_id, include_modifiers=keep_modifiers)
+    else:
+        for r in model.getListOfReactions():
+            s_ids_to_keep |= get_metabolites(r, include_modifiers=keep_modifiers)
     for s_id in [s.id for s in model.getListOfSpecies() if s.id not in s_ids_to_keep]:
         model.removeSpecies(s_id)
+    if index:
+        index.invalidate()
 
 
 def remove_unused_compartments(model):
@@ -121,8 +261,16 @@ def get_biomass_r_ids(model):
             or biomass_s_ids & get_metabolites(reaction, include_modifiers=False)}
 
 
-def remove_species(model, s_ids_to_remove):
-    for r in model.getListOfReactions():
+def remove_species(model, s_ids_to_remove, index=None):
+    if index:
+        r_ids = set()
+        for s_id in s_ids_to_remove:
+            r_ids |= index.get_r_ids(s_id, include_modifiers=True)
+        reactions = [model.getReaction(r_id) for r_id in index.get_reaction_ids() if r_id in r_ids]
+        index.invalidate()
+    else:
+        reactions = model.getListOfReactions()
+    for r in reactions:
         for iterator, remove in ((get_reactants(r), r.removeReactant), (get_products(r), r.removeProduct),
                                  (get_modifiers(r), r.removeModifier)):
             for s_id in s_ids_to_remove & set(iterator):
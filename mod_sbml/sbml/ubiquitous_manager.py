@@ -1,8 +1,9 @@
 from itertools import chain
 
 from mod_sbml.annotation.chebi.chebi_annotator import add_equivalent_chebi_ids, get_chebi_id
-from mod_sbml.annotation.chebi.chebi_serializer import get_chebi, COMMON_TERMS_FILE, COFACTORS_FILE, PROTONS_FILE
-from mod_sbml.onto import parse_simple
+from mod_sbml.annotation.chebi.chebi_serializer import get_chebi, get_chebi_equivalents, load_equivalent_ids, \
+    COMMON_TERMS_FILE, COFACTORS_FILE, PROTONS_FILE
+from mod_sbml.onto.registry import get_ontology
 from mod_sbml.sbml.sbml_manager import get_reactants, get_products
 
 __author__ = 'anna'
@@ -12,6 +13,7 @@ UBIQUITOUS_THRESHOLD = 20
 common_ch_ids = None
 cofactor_ch_ids = None
 proton_ch_ids = None
+chebi_id2eq_ids = None
 
 
 def get_frequent_term_ids(model, threshold=UBIQUITOUS_THRESHOLD):
@@ -58,10 +60,11 @@ def get_ubiquitous_chebi_ids(add_common=True, add_cofactors=True, add_frequent=F
     :param add_frequent: whether to add ChEBI ids of metabolites that appear frequently in the model.
     :param ubiquitous_threshold: a threshold for a ChEBI id to be considered appearing frequently in the model.
     :param model: libsbml.Model model of interest (to be used for add_frequent, otherwise can be left None)
-    :param chebi: mod_sbml.onto.obo_ontology.Ontology ChEBI ontology
+    :param chebi: mod_sbml.onto.obo_ontology.Ontology ChEBI ontology (to be used for add_frequent,
+    if not given the precalculated ChEBI equivalence classes are used instead)
     :return: a set of ubiquitous ChEBI ids.
     """
-    global cofactor_ch_ids, common_ch_ids
+    global cofactor_ch_ids, common_ch_ids, chebi_id2eq_ids
     ubiquitous_chebi_ids = set()
     if add_cofactors:
         if not cofactor_ch_ids:
@@ -72,12 +75,17 @@ def get_ubiquitous_chebi_ids(add_common=True, add_cofactors=True, add_frequent=F
         if not common_ch_ids:
             with open(COMMON_TERMS_FILE, 'r') as f:
                 common_ch_ids = set(f.readline().split('\t'))
-        ubiquitous_chebi_ids = common_ch_ids
+        ubiquitous_chebi_ids = set(common_ch_ids)
     if add_frequent and model:
+        id2eq_ids = None
         if not chebi:
-            chebi = parse_simple(get_chebi())
+            if chebi_id2eq_ids is None:
+                chebi_id2eq_ids = load_equivalent_ids(get_chebi_equivalents())
+            id2eq_ids = chebi_id2eq_ids
+            if id2eq_ids is None:
+                chebi = get_ontology(get_chebi())
         ubiquitous_chebi_ids |= \
-            add_equivalent_chebi_ids(chebi, get_frequent_term_ids(model, ubiquitous_threshold))
+            add_equivalent_chebi_ids(chebi, get_frequent_term_ids(model, ubiquitous_threshold), id2eq_ids=id2eq_ids)
     return ubiquitous_chebi_ids
 
 
@@ -5,7 +5,8 @@ from mod_sbml.annotation.chebi.chebi_annotator import get_chebi_id
 from mod_sbml.annotation.gene_ontology.go_annotator import get_go_id
 from mod_sbml.annotation.kegg.kegg_annotator import get_kegg_r_id, get_kegg_m_id
 from mod_sbml.sbml.reaction_boundary_manager import get_bounds
-from mod_sbml.sbml.sbml_manager import get_gene_association, get_formulas, get_pathway_expression, get_r_comps
+from mod_sbml.sbml.sbml_manager import get_gene_association, get_formulas, get_pathway_expression, get_r_comps, \
+    get_notes_values
 from mod_sbml.serialization import get_sbml_r_formula, df2csv
 
 __author__ = 'anna'
@@ -91,11 +92,14 @@ def reactions2df(model, r_ids=None, c_id2level=None, blocked_reactions=None):
 
     rs = model.getListOfReactions() if not r_ids else (r for r in model.getListOfReactions() if r.id in r_ids)
 
+    # the notes of each reaction are read once for all the notes values
+    memo = {}
     for r in sorted(rs, key=get_key):
+        get_notes_values(r, memo)
         record = (r.id, r.name, get_bounds(r)[0], get_bounds(r)[1],
                   get_sbml_r_formula(model, r, show_compartments=True, show_metabolite_ids=False),
                   ', '.join(tuple(sorted(model.getCompartment(c_id).getName() for c_id in get_r_comps(r.id, model)))),
-                  get_kegg_r_id(r), get_gene_association(r), ','.join(get_pathway_expression(r)))
+                  get_kegg_r_id(r), get_gene_association(r, memo=memo), ','.join(get_pathway_expression(r, memo)))
         if blocked_reactions:
             record += 'blocked' if r.id in blocked_reactions else '',
         data.append(record)
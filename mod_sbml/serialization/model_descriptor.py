@@ -3,14 +3,26 @@ from collections import defaultdict
 import libsbml
 
 from mod_sbml.annotation.kegg.kegg_annotator import get_pathway2r_ids
-from mod_sbml.sbml.sbml_manager import get_metabolites, get_subsystem2r_ids, \
-    get_reactants, get_products
+from mod_sbml.sbml.model_index import ModelIndex
+from mod_sbml.sbml.sbml_manager import get_subsystem2r_ids
 
 
 __author__ = 'anna'
 
 
-def model_statistics(model, pathways=True, extracellular=None):
+def model_statistics(model, pathways=True, extracellular=None, index=None):
+    """
+    Prints the numbers of compartments, metabolites and reactions of the model,
+    and the distribution of its reactions over compartments and pathways.
+    :param model: libsbml.Model model of interest
+    :param pathways: whether to print the pathway statistics
+    :param extracellular: (optional) id of the extracellular compartment, used to find the boundary metabolites
+    if none of them is marked as such
+    :param index: (optional) mod_sbml.sbml.model_index.ModelIndex index of the model (built if not given)
+    :return: void
+    """
+    if not index:
+        index = ModelIndex(model)
     print("Compartments: ", model.getNumCompartments(), "Metabolites: ", model.getNumSpecies(), "Reactions: ",
           model.getNumReactions())
     print("Compartments: %s" % ", ".join([c.name for c in model.getListOfCompartments()]))
@@ -19,18 +31,18 @@ def model_statistics(model, pathways=True, extracellular=None):
     s_id2r_rs = defaultdict(list)
     s_id2p_rs = defaultdict(list)
     transport = []
-    for r in model.getListOfReactions():
-        rs, ps = get_reactants(r), get_products(r)
-        ms = get_metabolites(r)
+    for r_id in index.get_reaction_ids():
+        rs, ps = index.get_reactants(r_id), index.get_products(r_id)
+        ms = index.get_metabolites(r_id)
         for m in rs:
-            s_id2r_rs[m].append(r.id)
+            s_id2r_rs[m].append(r_id)
         for m in ps:
-            s_id2p_rs[m].append(r.id)
+            s_id2p_rs[m].append(r_id)
         for m in ms:
-            s_id2rs[m].append(r)
-        c_ids = tuple(sorted({model.getSpecies(s_id).getCompartment() for s_id in ms}))
+            s_id2rs[m].append(r_id)
+        c_ids = tuple(sorted({index.get_compartment(s_id) for s_id in ms}))
         if len(c_ids) > 1:
-            transport.append(r.id)
+            transport.append(r_id)
         if c_ids not in c2reactions:
             c2reactions[c_ids] = 1
         else:
@@ -39,8 +51,8 @@ def model_statistics(model, pathways=True, extracellular=None):
     boundary_ms = {m for m in model.getListOfSpecies() if m.id in s_id2rs and m.getBoundaryCondition()}
     if not boundary_ms and extracellular:
         for m in (m for m in model.getListOfSpecies() if m.getCompartment() == extracellular):
-            for r in s_id2rs[m.id]:
-                if not set(get_reactants(r)) or not set(get_products(r)):
+            for r_id in s_id2rs[m.id]:
+                if not index.get_reactants(r_id) or not index.get_products(r_id):
                     boundary_ms.add(m)
                     break
     print("Boundary metabolites: ", len(boundary_ms))
@@ -34,3 +34,62 @@ def invert_map(key2value, factory=set):
         else:
             value2keys[value].add(key)
     return value2keys
+
+
+class UnionFind(object):
+    """
+    Disjoint-set forest (with path compression and union by size)
+    that partitions the added elements into equivalence classes.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, element):
+        """
+        Finds the representative of the class the element belongs to (adds the element if needed).
+        :param element: element of interest
+        :return: the representative element of its class
+        """
+        if element not in self.parent:
+            self.parent[element] = element
+            self.size[element] = 1
+            return element
+        root = element
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[element] != root:
+            self.parent[element], element = root, self.parent[element]
+        return root
+
+    def union(self, element_1, element_2):
+        """
+        Merges the classes of the two given elements.
+        :param element_1: element of interest
+        :param element_2: element of interest
+        :return: the representative element of the merged class
+        """
+        root_1, root_2 = self.find(element_1), self.find(element_2)
+        if root_1 == root_2:
+            return root_1
+        if self.size[root_1] < self.size[root_2]:
+            root_1, root_2 = root_2, root_1
+        self.parent[root_2] = root_1
+        self.size[root_1] += self.size[root_2]
+        return root_1
+
+    def get_classes(self):
+        """
+        Returns the equivalence classes.
+        :return: dict {element: frozenset of elements of its class}
+        """
+        root2elements = defaultdict(set)
+        for element in self.parent:
+            root2elements[self.find(element)].add(element)
+        element2class = {}
+        for elements in root2elements.values():
+            elements = frozenset(elements)
+            for element in elements:
+                element2class[element] = elements
+        return element2class
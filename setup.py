@@ -30,5 +30,5 @@ setup(
     url='https://github.com/annazhukova/mod_sbml',
     download_url='https://github.com/annazhukova/mod_sbml/archive/0.2.3.zip',
     keywords=['SBML', 'metabolic model', 'utility'],
-    install_requires=['openpyxl', 'python-libsbml-experimental', 'pandas', 'matplotlib', 'pyparsing', 'natsort']
+    install_requires=['openpyxl', 'python-libsbml-experimental', 'pandas', 'numpy', 'matplotlib', 'pyparsing', 'natsort']
 )
@@ -0,0 +1,167 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from mod_sbml.annotation.chebi import chebi_serializer
+from mod_sbml.annotation.chebi.chebi_annotator import add_equivalent_chebi_ids, EQUIVALENT_RELATIONSHIPS
+from mod_sbml.onto import parse_simple
+
+# molecular entity (23367) -> group (10) -> compounds with formulas (11, 12), cofactor role (23357) -> role (20)
+OBO = """format-version: 1.2
+
+[Term]
+id: CHEBI:23367
+name: molecular entity
+
+[Term]
+id: CHEBI:10
+name: group
+is_a: CHEBI:23367
+
+[Term]
+id: CHEBI:11
+name: acid
+synonym: "C2H2" RELATED FORMULA [ChEBI:]
+is_a: CHEBI:10
+relationship: has_role CHEBI:20
+
+[Term]
+id: CHEBI:12
+name: base
+is_a: CHEBI:10
+relationship: is_conjugate_base_of CHEBI:11
+
+[Term]
+id: CHEBI:13
+name: sub-acid
+is_a: CHEBI:11
+
+[Term]
+id: CHEBI:14
+name: no formula
+is_a: CHEBI:23367
+
+[Term]
+id: CHEBI:15
+name: sub-no formula
+is_a: CHEBI:14
+
+[Term]
+id: CHEBI:15378
+name: hydron
+synonym: "H" RELATED FORMULA [ChEBI:]
+is_a: CHEBI:23367
+
+[Term]
+id: CHEBI:23357
+name: cofactor
+
+[Term]
+id: CHEBI:20
+name: coenzyme
+is_a: CHEBI:23357
+"""
+
+PATH_NAMES = {'SUB_CHEBI_TXT': 'subchebi.txt', 'SUB_CHEBI': 'subchebi.obo',
+              'SUB_CHEBI_EQUIVALENTS': 'subchebi_equivalents.txt', 'COFACTORS_FILE': 'ub_cofactors.txt',
+              'PROTONS_FILE': 'protons.txt', 'COMMON_TERMS_FILE': 'ub_common.txt',
+              'CHEBI_DIGESTS': 'chebi_digests.txt'}
+
+
+class ClosestDescendantsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.obo = os.path.join(self.dir, 'chebi.obo')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def get_closest_ids(self, obo):
+        with open(self.obo, 'w') as f:
+            f.write(obo)
+        onto, _ = chebi_serializer.parse_chebi(self.obo)
+        return {t.get_id() for t in
+                chebi_serializer.get_closest_descendants_with_formulas(onto, onto.get_term('chebi:23367'))}
+
+    def test_closest_descendants_with_formulas(self):
+        self.assertEqual({'chebi:11', 'chebi:12', 'chebi:15378'}, self.get_closest_ids(OBO))
+
+    def test_closest_descendants_with_cycle(self):
+        obo = OBO.replace('name: sub-no formula\n', 'name: sub-no formula\nsynonym: "C" RELATED FORMULA [ChEBI:]\n')\
+            .replace('name: no formula\n', 'name: no formula\nis_a: CHEBI:10\n')\
+            .replace('name: group\n', 'name: group\nis_a: CHEBI:14\n')
+        self.assertEqual({'chebi:11', 'chebi:12', 'chebi:15', 'chebi:15378'}, self.get_closest_ids(obo))
+
+
+class EquivalentIdsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.obo = os.path.join(self.dir, 'chebi.obo')
+        with open(self.obo, 'w') as f:
+            f.write(OBO)
+        self.onto, _ = chebi_serializer.parse_chebi(self.obo)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def test_add_equivalent_chebi_ids(self):
+        self.assertEqual({'chebi:11', 'chebi:12', 'CHEBI:13', 'chebi:13'},
+                         add_equivalent_chebi_ids(self.onto, ['chebi:12', 'CHEBI:13']))
+
+    def test_saved_equivalent_ids(self):
+        path = os.path.join(self.dir, 'equivalents.txt')
+        chebi_serializer.save_equivalent_ids(self.onto.get_equivalent_id_map(EQUIVALENT_RELATIONSHIPS), path)
+        id2eq_ids = chebi_serializer.load_equivalent_ids(path)
+        self.assertEqual({'chebi:11': frozenset({'chebi:11', 'chebi:12'}),
+                          'chebi:12': frozenset({'chebi:11', 'chebi:12'})}, id2eq_ids)
+        self.assertEqual({'chebi:11', 'chebi:12', 'chebi:13'},
+                         add_equivalent_chebi_ids(None, ['chebi:11', 'chebi:13'], id2eq_ids=id2eq_ids))
+
+
+class RefreshTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.obo = os.path.join(self.dir, 'chebi.obo')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def build(self, obo, refresh, sub_dir):
+        with open(self.obo, 'w') as f:
+            f.write(obo)
+        data_dir = os.path.join(self.dir, sub_dir)
+        if not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        patches = [mock.patch.object(chebi_serializer, name, os.path.join(data_dir, file_name))
+                   for (name, file_name) in PATH_NAMES.items()]
+        for patch in patches:
+            patch.start()
+        try:
+            result = chebi_serializer.refresh_chebi_data(self.obo) if refresh \
+                else chebi_serializer.serialize_chebi_data(self.obo)
+        finally:
+            for patch in patches:
+                patch.stop()
+        onto = parse_simple(os.path.join(data_dir, 'subchebi.txt'), use_snapshot=False)
+        return result, {str(t) for t in onto.get_all_terms()}, set(onto.get_all_relationships())
+
+    def test_nothing_changed(self):
+        self.build(OBO, False, 'inc')
+        report, _, _ = self.build(OBO, True, 'inc')
+        self.assertEqual([], report['updated'])
+        self.assertFalse(report['added'] | report['removed'] | report['changed'])
+
+    def test_refresh_equals_rebuild(self):
+        new_obo = OBO.replace('name: no formula\n', 'name: no formula\nsynonym: "CH4" RELATED FORMULA [ChEBI:]\n')\
+            .replace('relationship: is_conjugate_base_of CHEBI:11\n', '')
+        self.build(OBO, False, 'inc')
+        report, terms, rels = self.build(new_obo, True, 'inc')
+        self.assertEqual({'chebi:12', 'chebi:14'}, report['changed'])
+        _, expected_terms, expected_rels = self.build(new_obo, False, 'full')
+        self.assertEqual(expected_terms, terms)
+        self.assertEqual(expected_rels, rels)
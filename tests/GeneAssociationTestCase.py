@@ -1,6 +1,13 @@
 import unittest
 
-from mod_sbml.sbml.sbml_manager import _filter, parse_gene_association
+import libsbml
+import pyparsing as pp
+
+from mod_sbml.sbml.gpr_evaluator import CompiledGPR, get_clauses
+from mod_sbml.sbml.gpr_parser import parse, parse_with_pyparsing
+from mod_sbml.sbml.sbml_manager import _filter, parse_gene_association, set_gene_association, \
+    get_gene_association, get_genes, get_pathway_expression, get_ec_numbers, set_formula, get_formulas, \
+    get_notes_values, get_subsystem
 
 
 class GATestCase(unittest.TestCase):
@@ -48,4 +55,130 @@ class GATestCase(unittest.TestCase):
     def test_complicated_expression(self):
         res = _filter(parse_gene_association('(A or B or C) and D', flatten=False), ['A', 'B', 'D'], flatten=True)
         self.assertIn(res, ['((A or B) and D)', '(D and (A or B))', '((B or A) and D)', '(D and (B or A))'],
-                      'Was expecting "((A or B) and D)", got %s' % res)
\ No newline at end of file
+                      'Was expecting "((A or B) and D)", got %s' % res)
+
+
+class GPRParserTestCase(unittest.TestCase):
+
+    def test_same_as_pyparsing(self):
+        for ga in ('A', '((A))', 'A and B and C or D', 'A AND (B Or c-1.2)', '(A or B) and (C or D_3)', 'A andB'):
+            self.assertEqual(parse_with_pyparsing(ga)[0], parse(ga), 'Different parsing of %s' % ga)
+
+    def test_malformed(self):
+        for ga in ('A B', 'A and', '(A or B', 'A, B'):
+            self.assertRaises(pp.ParseBaseException, parse, ga)
+            self.assertRaises(pp.ParseBaseException, parse_with_pyparsing, ga)
+
+    def test_gene_parse_action(self):
+        res = parse_gene_association('a and (b or a)', gene_parse_action=lambda t: t[0].upper(), flatten=False)
+        self.assertIn(res, [('A', 'and', ('B', 'or', 'A')), ('A', 'and', ('A', 'or', 'B')),
+                            (('B', 'or', 'A'), 'and', 'A'), (('A', 'or', 'B'), 'and', 'A')])
+
+    def test_get_genes(self):
+        document = libsbml.SBMLDocument(2, 4)
+        reaction = document.createModel().createReaction()
+        reaction.setId('r')
+        set_gene_association(reaction, '(A and B) or C or A')
+        self.assertEqual({'A', 'B', 'C'}, get_genes(reaction))
+
+
+class NotesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.document = libsbml.SBMLDocument(2, 4)
+        model = self.document.createModel()
+        self.reaction = model.createReaction()
+        self.reaction.setId('r')
+        self.reaction.setNotes("<body xmlns='http://www.w3.org/1999/xhtml'><p>GENE_ASSOCIATION: A</p>"
+                               "<p>SUBSYSTEM: glycolysis</p><p>Pathway: TCA</p><p>EC Number: 1.1.1.1</p>"
+                               "<p>Confidence Level: 2</p></body>")
+        self.species = model.createSpecies()
+        self.species.setId('s')
+
+    def test_notes_values(self):
+        self.assertEqual({'glycolysis', 'TCA'}, get_pathway_expression(self.reaction))
+        self.assertEqual({'1.1.1.1'}, get_ec_numbers(self.reaction))
+        self.assertEqual('A', get_gene_association(self.reaction))
+
+    def test_all_notes_values(self):
+        self.assertEqual({'GENE_ASSOCIATION:': {'A'}, 'SUBSYSTEM:': {'glycolysis'}, 'Pathway:': {'TCA'},
+                          'EC Number:': {'1.1.1.1'}, 'Confidence Level:': {'2'}}, get_notes_values(self.reaction))
+
+    def test_memo(self):
+        memo = {}
+        self.assertEqual('A', get_gene_association(self.reaction, memo=memo))
+        # the notes are not read again: the values modified other than via this module's functions are not seen
+        self.reaction.setNotes("<body xmlns='http://www.w3.org/1999/xhtml'><p>SUBSYSTEM: TCA</p></body>")
+        self.assertEqual({'glycolysis', 'TCA'}, get_pathway_expression(self.reaction, memo))
+        self.assertEqual({'glycolysis'}, get_subsystem(self.reaction, memo))
+        self.assertEqual(['r'], list(memo.keys()))
+
+    def test_memo_is_cleared_by_setters(self):
+        memo = {}
+        self.assertEqual('A', get_gene_association(self.reaction, memo=memo))
+        set_gene_association(self.reaction, 'B', memo)
+        self.assertEqual('B', get_gene_association(self.reaction, memo=memo))
+        self.assertEqual({'1.1.1.1'}, get_ec_numbers(self.reaction, memo))
+        self.assertEqual(set(), get_formulas(self.species, memo))
+        set_formula(self.species, 'H2O', memo)
+        self.assertEqual({'H2O'}, get_formulas(self.species, memo))
+
+    def test_set_gene_association(self):
+        self.assertEqual('A', get_gene_association(self.reaction))
+        set_gene_association(self.reaction, 'B or C')
+        self.assertIn(get_gene_association(self.reaction), ['(B or C)', '(C or B)'])
+        self.assertEqual({'glycolysis', 'TCA'}, get_pathway_expression(self.reaction))
+
+    def test_set_formula(self):
+        self.assertEqual(set(), get_formulas(self.species))
+        set_formula(self.species, 'C6H12O6')
+        self.assertEqual({'C6H12O6'}, get_formulas(self.species))
+        set_formula(self.species, 'H2O')
+        self.assertEqual({'H2O'}, get_formulas(self.species))
+
+    def test_same_ids_in_different_documents(self):
+        sbml = "<?xml version='1.0' encoding='UTF-8'?>" \
+               "<sbml xmlns='http://www.sbml.org/sbml/level2/version4' level='2' version='4'><model id='m'>" \
+               "<listOfReactions><reaction id='r1'><notes><body xmlns='http://www.w3.org/1999/xhtml'>" \
+               "<p>GENE_ASSOCIATION: %s</p></body></notes></reaction></listOfReactions></model></sbml>"
+        for _ in range(50):
+            for ga, expected in (('A or B', {'A', 'B'}), ('C and D', {'C', 'D'})):
+                document = libsbml.SBMLReader().readSBMLFromString(sbml % ga)
+                self.assertEqual(expected, get_genes(document.getModel().getReaction('r1')))
+                # the freed document's memory is reused by the next one
+                del document
+
+
+class GPREvaluatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.gpr = CompiledGPR({'r1': parse_gene_association('A and (B or C)', flatten=False),
+                                'r2': parse_gene_association('A or (A and D)', flatten=False),
+                                'r3': '', 'r4': None})
+
+    def test_clauses(self):
+        self.assertEqual({frozenset({'A', 'B'}), frozenset({'A', 'C'})},
+                         get_clauses(parse_gene_association('A and (B or C)', flatten=False)))
+        self.assertEqual({frozenset({'A'})}, get_clauses(parse_gene_association('A or (A and D)', flatten=False)))
+        self.assertEqual({frozenset({'A'}), frozenset({'B', 'C'})},
+                         get_clauses(parse_gene_association('(A or B) and (A or C)', flatten=False)))
+
+    def test_evaluate(self):
+        self.assertEqual([[True, True, True, False], [False, True, True, False], [False, False, True, False]],
+                         self.gpr.evaluate([{'A', 'C'}, {'A', 'D'}, {'B', 'C', 'E'}]).tolist())
+
+    def test_evaluate_knockouts(self):
+        self.assertEqual([[False, False, True, False], [True, True, True, False]],
+                         self.gpr.evaluate([{'A'}, {'B'}], knockout=True).tolist())
+
+    def test_wide_and_of_ors(self):
+        # 4^10 clauses in disjunctive normal form
+        ga = parse_gene_association(' and '.join('(%s)' % ' or '.join('%s%d' % (subunit, isoform)
+                                                                        for isoform in range(4))
+                                                 for subunit in 'ABCDEFGHIJ'), flatten=False)
+        self.assertIsNone(get_clauses(ga))
+        gpr = CompiledGPR({'r1': ga, 'r2': parse_gene_association('A0 or K', flatten=False)})
+        all_genes = {'%s%d' % (subunit, isoform) for subunit in 'ABCDEFGHIJ' for isoform in range(4)}
+        self.assertEqual([[True, True], [False, True], [True, True], [False, False]],
+                         gpr.evaluate([all_genes, all_genes - {'J0', 'J1', 'J2', 'J3'},
+                                       {'%s3' % subunit for subunit in 'ABCDEFGHIJ'} | {'K'}, {'B0'}]).tolist())
@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import libsbml
+
+from mod_sbml.sbml.gpr_evaluator import get_clauses
+from mod_sbml.sbml.model_index import ModelIndex
+from mod_sbml.sbml.sbml_manager import create_compartment, create_species, create_reaction, get_r_comps, \
+    get_r_ids_by_s_ids, get_r_ids_by_comp, get_pathway_by_species, set_gene_association, get_gene_association
+from mod_sbml.sbml.submodel_manager import submodel, remove_species, submodel_by_genes, write_submodels_by_genes
+
+
+def build_model():
+    """
+    Builds a small test model:
+        r1: a_c -> b_c, modified by e_c
+        r2: b_c -> b_m
+        r3: b_m + c_m -> 2 d_m
+    """
+    document = libsbml.SBMLDocument(2, 4)
+    model = document.createModel()
+    for c_id in ('c', 'm'):
+        create_compartment(model, id_=c_id)
+    for s_id in ('a_c', 'b_c', 'e_c', 'b_m', 'c_m', 'd_m'):
+        create_species(model, s_id[-1], id_=s_id)
+    create_reaction(model, {'a_c': 1}, {'b_c': 1}, id_='r1').createModifier().setSpecies('e_c')
+    create_reaction(model, {'b_c': 1}, {'b_m': 1}, id_='r2')
+    create_reaction(model, {'b_m': 1, 'c_m': 1}, {'d_m': 2}, id_='r3')
+    return document, model
+
+
+class ModelIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.document, self.model = build_model()
+        self.index = ModelIndex(self.model)
+
+    def test_participants(self):
+        self.assertEqual(['r1', 'r2', 'r3'], self.index.get_reaction_ids())
+        self.assertEqual({('b_m', 1), ('c_m', 1), ('d_m', 2)}, self.index.get_metabolites('r3', stoichiometry=True))
+        self.assertEqual({'r1'}, self.index.get_r_ids('e_c', include_modifiers=True))
+        self.assertEqual(set(), self.index.get_r_ids('e_c'))
+
+    def test_same_as_model(self):
+        for r_id in ('r1', 'r2', 'r3'):
+            self.assertEqual(get_r_comps(r_id, self.model), get_r_comps(r_id, self.model, self.index))
+        self.assertEqual(get_r_ids_by_s_ids(self.model, {'b_c'}), get_r_ids_by_s_ids(self.model, {'b_c'}, self.index))
+        for strict in (True, False):
+            self.assertEqual(get_r_ids_by_comp(self.model, {'c'}, strict),
+                             get_r_ids_by_comp(self.model, {'c'}, strict, self.index))
+        self.assertEqual(get_pathway_by_species({'a_c'}, self.model, {'b_m'}),
+                         get_pathway_by_species({'a_c'}, self.model, {'b_m'}, index=self.index))
+
+    def test_create_reaction(self):
+        self.index.get_reaction_ids()
+        create_species(self.model, 'm', id_='f_m', index=self.index)
+        create_reaction(self.model, {'d_m': 1}, {'f_m': 1}, id_='r4', index=self.index)
+        self.assertEqual({'r3', 'r4'}, get_r_ids_by_s_ids(self.model, {'d_m'}, self.index))
+        self.assertEqual({'m'}, get_r_comps('r4', self.model, self.index))
+
+    def test_submodel(self):
+        submodel({'r2', 'r3'}, self.model, self.index)
+        self.assertEqual(['r2', 'r3'], self.index.get_reaction_ids())
+        self.assertIsNone(self.index.get_compartment('a_c'))
+        remove_species(self.model, {'c_m'}, self.index)
+        self.assertEqual({'b_m', 'd_m'}, self.index.get_metabolites('r3'))
+
+
+class SubmodelBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.sbml = os.path.join(self.dir, 'model.xml')
+        document, model = build_model()
+        set_gene_association(model.getReaction('r1'), 'A or B')
+        set_gene_association(model.getReaction('r2'), 'A and C')
+        libsbml.SBMLWriter().writeSBMLToFile(document, self.sbml)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    @staticmethod
+    def describe(model):
+        # the operand order of the gene associations depends on the hash seed of the process that wrote them
+        return {r.getId(): get_clauses(get_gene_association(r, flatten=False)) for r in model.getListOfReactions()}, \
+               {s.getId() for s in model.getListOfSpecies()}, {c.getId() for c in model.getListOfCompartments()}
+
+    def check_same_as_submodel_by_genes(self, gene_sets, processes):
+        paths = [os.path.join(self.dir, 'submodel_%d.xml' % i) for i in range(len(gene_sets))]
+        results = write_submodels_by_genes(self.sbml, gene_sets, paths, processes=processes)
+        self.assertEqual(paths, [it[0] for it in results])
+        for genes, path in zip(gene_sets, paths):
+            document = libsbml.SBMLReader().readSBML(self.sbml)
+            submodel_by_genes(document.getModel(), genes)
+            self.assertEqual(self.describe(document.getModel()),
+                             self.describe(libsbml.SBMLReader().readSBML(path).getModel()),
+                             'Different submodels for %s' % genes)
+
+    def test_same_as_submodel_by_genes(self):
+        self.check_same_as_submodel_by_genes([{'B'}, {'A', 'C'}, {'D'}, set()], processes=2)
+
+    def test_same_as_submodel_by_genes_serial(self):
+        self.check_same_as_submodel_by_genes([{'B'}, {'A', 'C'}, {'D'}, set()], processes=1)
+
+    def test_modified_template(self):
+        path = os.path.join(self.dir, 'submodel.xml')
+        result = write_submodels_by_genes(self.sbml, [{'A', 'C'}], [path], processes=1)
+        document = libsbml.SBMLReader().readSBML(self.sbml)
+        set_gene_association(document.getModel().getReaction('r2'), 'D')
+        libsbml.SBMLWriter().writeSBMLToFile(document, self.sbml)
+        self.assertNotEqual(result, write_submodels_by_genes(self.sbml, [{'A', 'C'}], [path], processes=1))
+        self.check_same_as_submodel_by_genes([{'A', 'C'}], processes=1)
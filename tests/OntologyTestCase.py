@@ -0,0 +1,437 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mod_sbml.onto import parse_simple, save_simple, parse, Ontology, Term, filter_ontology, get_filtered_view
+from mod_sbml.onto.obo_parser import iter_obo
+from mod_sbml.onto.ontology_view import OntologyView
+from mod_sbml.onto.registry import OntologyRegistry
+from mod_sbml.onto.snapshot import get_snapshot_path, load_snapshot
+from mod_sbml.onto.shared_ontology import save_shared_ontology, SharedOntology
+from mod_sbml.onto.traversal import get_closure
+from mod_sbml.onto.trigram_index import TrigramIndex
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mod_sbml', 'data')
+
+
+def build_ontology():
+    r"""
+    Builds a small test ontology:
+        a
+       / \
+      b   c  part_of a
+      |\ /
+      | d  is_conjugate_base_of e
+      f
+    """
+    onto = Ontology()
+    for t_id, parents in (('a', []), ('b', ['a']), ('c', ['a']), ('d', ['b', 'c']), ('e', ['a']), ('f', ['b'])):
+        onto.add_term(Term(onto=onto, t_id=t_id, name='term %s' % t_id, parent_ids=parents))
+    onto.add_relationship('c', 'part_of', 'a')
+    onto.add_relationship('d', 'is_conjugate_base_of', 'e')
+    return onto
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'subgo.txt')
+        shutil.copy(os.path.join(DATA_DIR, 'subgo.txt'), self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def test_snapshot_is_saved(self):
+        parse_simple(self.path)
+        self.assertTrue(os.path.exists(get_snapshot_path(self.path)), 'Was expecting the snapshot to be saved')
+
+    def test_snapshot_is_equivalent(self):
+        parsed = parse_simple(self.path)
+        loaded = parse_simple(self.path)
+        self.assertEqual(parsed.get_all_term_ids(), loaded.get_all_term_ids(), 'Snapshot terms differ')
+        self.assertEqual(parsed.get_relationships(), loaded.get_relationships(), 'Snapshot relationships differ')
+        self.assertEqual(parsed.get_descendants('go:0005737', False), loaded.get_descendants('go:0005737', False),
+                         'Snapshot descendants differ')
+
+    def test_snapshot_is_invalidated(self):
+        parse_simple(self.path)
+        onto = parse_simple(self.path, use_snapshot=False)
+        onto.remove_term(onto.get_term('go:0005737'), True)
+        save_simple(onto, self.path)
+        self.assertIsNone(parse_simple(self.path).get_term('go:0005737'),
+                          'Was expecting the outdated snapshot to be ignored')
+
+    def test_snapshot_of_touched_file(self):
+        parse_simple(self.path)
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertIsNotNone(load_snapshot(self.path), 'Was expecting the snapshot of unchanged content to be used')
+        with open(self.path, 'r+b') as f:
+            content = f.read()
+            f.seek(0)
+            f.write(content.replace(b'cytoplasm', b'cytoplasn'))
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10 ** 9))
+        self.assertIsNone(load_snapshot(self.path), 'Was expecting the snapshot of changed content to be ignored')
+
+
+class IsATestCase(unittest.TestCase):
+
+    def test_descendants(self):
+        onto = build_ontology()
+        self.assertEqual({'b', 'c', 'd', 'e', 'f'}, onto.get_descendants('a', False))
+        self.assertEqual({'b', 'c', 'e'}, onto.get_descendants('a', True))
+
+    def test_is_a(self):
+        onto = build_ontology()
+        self.assertTrue(onto.is_a('D', 'a'), 'Was expecting d to be an a')
+        self.assertFalse(onto.is_a('c', 'b'), 'Was not expecting c to be a b')
+
+    def test_is_a_after_removal(self):
+        onto = build_ontology()
+        onto.build_descendant_index()
+        onto.remove_term(onto.get_term('b'), True)
+        self.assertFalse(onto.is_a('f', 'a'), 'Was not expecting f to be an a after b removal')
+        self.assertTrue(onto.is_a('d', 'a'), 'Was expecting d to still be an a after b removal')
+
+    def test_is_a_matrix(self):
+        onto = build_ontology()
+        self.assertEqual([[True, True], [False, True], [False, False], [False, False]],
+                         onto.get_is_a_matrix(['d', 'F', 'a', 'unknown'], ['c', 'b']).tolist())
+        onto.remove_term(onto.get_term('b'), True)
+        self.assertEqual([[True, False], [False, False]], onto.get_is_a_matrix(['d', 'f'], ['a', 'b']).tolist())
+
+
+class RemovalTestCase(unittest.TestCase):
+
+    def test_remove_terms_relinks_children(self):
+        onto = build_ontology()
+        onto.remove_terms([onto.get_term('b'), onto.get_term('c')])
+        self.assertEqual({'a'}, onto.get_term('d').get_parent_ids())
+        self.assertEqual({'d', 'e', 'f'}, onto.get_descendants('a', True))
+        self.assertEqual([], onto.get_term_relationships('a'))
+
+    def test_remove_terms_brutally(self):
+        onto = build_ontology()
+        onto.remove_terms([onto.get_term('b'), onto.get_term('c')], True)
+        self.assertEqual(set(), onto.get_term('d').get_parent_ids())
+        self.assertIn(onto.get_term('d'), onto.roots)
+        self.assertIsNone(onto.get_term('term b', False))
+
+
+class TraversalTestCase(unittest.TestCase):
+
+    def test_levels(self):
+        onto = build_ontology()
+        self.assertEqual([2], onto.get_level(onto.get_term('d')))
+        self.assertEqual({0}, onto.get_t_id2level()['a'])
+
+    def test_generalized_descendants(self):
+        onto = build_ontology()
+        b, d, e, f = (onto.get_term(t_id) for t_id in 'bdef')
+        self.assertEqual({d, e, f}, onto.get_generalized_descendants(b, False))
+        self.assertEqual({d, e, f}, onto.get_generalized_descendants(b, True))
+        self.assertEqual({onto.get_term('a'), b, onto.get_term('c')}, onto.get_generalized_ancestors(e, False))
+
+    def test_closure_with_cycle(self):
+        graph = {1: [2], 2: [3], 3: [1, 4], 4: [], 5: [1]}
+        id2closure = {}
+        self.assertEqual({1, 2, 3, 4}, get_closure(id2closure, 5, lambda it: graph[it]))
+        self.assertEqual({1, 2, 3, 4}, id2closure[2])
+        self.assertEqual(set(), id2closure[4])
+
+    def test_common_points(self):
+        onto = build_ontology()
+        a, b, c, d, f = (onto.get_term(t_id) for t_id in 'abcdf')
+        self.assertEqual([b], onto.common_points([d, f], relationships={'is_conjugate_base_of'}))
+        self.assertEqual([[b], [a], None],
+                         onto.get_common_points([[d, f], [b, c], []], relationships={'is_conjugate_base_of'}))
+
+    def test_deep_hierarchy(self):
+        onto = Ontology()
+        for i in range(5000):
+            onto.add_term(Term(onto=onto, t_id='t%d' % i, name='term %d' % i,
+                               parent_ids=['t%d' % (i - 1)] if i else []))
+        self.assertEqual([4999], onto.get_level(onto.get_term('t4999')))
+        self.assertEqual(4999, len(onto.get_ancestors(onto.get_term('t4999'), False)))
+
+
+class EquivalentsTestCase(unittest.TestCase):
+
+    def test_equivalents(self):
+        onto = build_ontology()
+        self.assertEqual({onto.get_term('e')}, onto.get_equivalents(onto.get_term('d')))
+        self.assertEqual({onto.get_term('d')}, onto.get_equivalents(onto.get_term('e'),
+                                                                    relationships={'is_conjugate_base_of'}))
+        self.assertEqual(set(), onto.get_equivalents(onto.get_term('e'), relationships={'is_tautomer_of'}))
+
+    def test_equivalents_after_relationship_removal(self):
+        onto = build_ontology()
+        onto.get_equivalents(onto.get_term('d'))
+        onto.filter_relationships({'part_of'})
+        self.assertEqual(set(), onto.get_equivalents(onto.get_term('d')))
+
+    def test_equivalent_id_map(self):
+        onto = build_ontology()
+        onto.get_term('e').add_alt_id('e2')
+        onto.add_term(onto.get_term('e'))
+        id2eq_ids = onto.get_equivalent_id_map({'is_conjugate_base_of'})
+        self.assertEqual(frozenset({'d', 'e', 'e2'}), id2eq_ids['e2'])
+        self.assertIs(id2eq_ids['d'], id2eq_ids['e'])
+        self.assertNotIn('a', id2eq_ids)
+
+
+class LookupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.onto = Ontology()
+        for t_id in ('chebi:10', 'chebi:9'):
+            term = Term(onto=self.onto, t_id=t_id, name='Water')
+            term.add_xref('KEGG COMPOUND', 'C00001')
+            self.onto.add_term(term)
+
+    def test_name_lookup(self):
+        self.assertEqual('chebi:9', self.onto.get_term('water', False).get_id())
+        self.assertIsNone(self.onto.get_term('water'))
+
+    def test_xref_lookup_after_removal(self):
+        self.assertEqual('chebi:9', self.onto.get_term('kegg.compound:c00001', False).get_id())
+        self.onto.remove_term(self.onto.get_term('chebi:9'))
+        self.assertEqual('chebi:10', self.onto.get_term('C00001', False).get_id())
+
+    def test_get_terms(self):
+        self.assertEqual({'H2O': None, 'water': self.onto.get_term('chebi:9')},
+                         self.onto.get_terms(['water', 'H2O', 'water'], False))
+        self.assertEqual({' Water ': self.onto.get_term('chebi:9'), 'C00001': self.onto.get_term('chebi:9'), '': None},
+                         self.onto.get_terms([' Water ', 'C00001', ''], False))
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.onto = Ontology()
+        for t_id, name in (('chebi:15361', 'pyruvate'), ('chebi:17234', 'glucose'), ('chebi:32816', 'pyruvic acid')):
+            self.onto.add_term(Term(onto=self.onto, t_id=t_id, name=name))
+        self.index = TrigramIndex(self.onto)
+
+    def test_similar_name(self):
+        self.assertEqual('chebi:15361', self.index.get_term('Pyruvate(1-)').get_id())
+
+    def test_dissimilar_name(self):
+        self.assertIsNone(self.index.get_term('fructose'))
+        self.assertEqual('chebi:17234', self.index.get_term('fructose', threshold=0.2).get_id())
+
+    def test_get_terms(self):
+        name2term = self.index.get_terms(['pyruvic  acid', 'ethanol'])
+        self.assertEqual('chebi:32816', name2term['pyruvic  acid'].get_id())
+        self.assertIsNone(name2term['ethanol'])
+
+
+class PartOfTestCase(unittest.TestCase):
+
+    def test_direct_part_of(self):
+        onto = build_ontology()
+        self.assertEqual({'a'}, onto.part_of('c', ['A', 'b']))
+
+    def test_inherited_part_of(self):
+        onto = build_ontology()
+        self.assertEqual({'a'}, onto.part_of('d', ['a']))
+
+    def test_is_a_is_not_part_of(self):
+        onto = build_ontology()
+        self.assertEqual(set(), onto.part_of('f', ['a', 'b']))
+
+    def test_part_of_matrix(self):
+        onto = build_ontology()
+        self.assertEqual([[True, False], [True, False], [False, False], [False, False]],
+                         onto.get_part_of_matrix(['c', 'd', 'f', 'unknown'], ['A', 'b']).tolist())
+
+
+OBO = """format-version: 1.2
+
+[Term]
+id: CHEBI:1
+name: acid ! comment
+relationship: is_conjugate_acid_of CHEBI:2
+relationship: has_role CHEBI:4
+
+[Term]
+id: CHEBI:2
+name: base
+synonym: "C2H" RELATED FORMULA [ChEBI:]
+is_a: CHEBI:1
+
+[Term]
+id: CHEBI:3
+name: old
+relationship: is_conjugate_acid_of CHEBI:2
+is_obsolete: true
+
+[Typedef]
+id: is_conjugate_acid_of
+name: is conjugate acid of
+"""
+
+
+class SharedOntologyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.shared')
+        save_shared_ontology(build_ontology(), self.path)
+        self.onto = SharedOntology(self.path)
+
+    def tearDown(self):
+        self.onto.close()
+        shutil.rmtree(self.dir, True)
+
+    def test_get_term(self):
+        self.assertEqual('term d', self.onto.get_term('D').get_name())
+        self.assertEqual('f', self.onto.get_term('term f', False).get_id())
+        self.assertIsNone(self.onto.get_term('term f'))
+
+    def test_queries(self):
+        self.assertEqual({'b', 'c', 'd', 'e', 'f'}, self.onto.get_descendants('a', False))
+        self.assertTrue(self.onto.is_a('d', 'a'), 'Was expecting d to be an a')
+        self.assertFalse(self.onto.is_a('c', 'b'), 'Was not expecting c to be a b')
+        self.assertEqual({'e'}, {t.get_id() for t in self.onto.get_equivalents(self.onto.get_term('d'))})
+        self.assertEqual({'a'}, self.onto.part_of('d', ['a']))
+        self.assertEqual(set(), self.onto.part_of('f', ['a', 'b']))
+
+    def test_matrices(self):
+        onto = build_ontology()
+        t_ids = ['a', 'b', 'C', 'd', 'e', 'f', 'unknown']
+        self.assertEqual(onto.get_is_a_matrix(t_ids, t_ids).tolist(), self.onto.get_is_a_matrix(t_ids, t_ids).tolist())
+        self.assertEqual(onto.get_part_of_matrix(t_ids, t_ids).tolist(),
+                         self.onto.get_part_of_matrix(t_ids, t_ids).tolist())
+
+
+class LazyOntologyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.onto')
+        save_simple(build_ontology(), self.path)
+        self.onto = parse_simple(self.path, lazy=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def test_get_term(self):
+        self.assertEqual('term d', self.onto.get_term('D').get_name())
+        self.assertEqual(1, len(self.onto._t_id2term), 'Was expecting only the term d to be created')
+        self.assertEqual('f', self.onto.get_term('term f', False).get_id())
+
+    def test_queries(self):
+        self.assertEqual({'b', 'c', 'd', 'e', 'f'}, self.onto.get_descendants('a', False))
+        self.assertEqual({'e'}, {t.get_id() for t in self.onto.get_equivalents(self.onto.get_term('d'))})
+        self.assertEqual({'a'}, self.onto.part_of('d', ['a']))
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.txt')
+        save_simple(build_ontology(), self.path)
+        self.registry = OntologyRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def test_loaded_once(self):
+        ontologies = []
+        threads = [threading.Thread(target=lambda: ontologies.append(self.registry.get(self.path)))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(ontologies))
+        self.assertTrue(all(onto is ontologies[0] for onto in ontologies), 'Was expecting the same ontology')
+        self.assertEqual('term d', ontologies[0].get_term('d').get_name())
+
+    def test_memory_usage_and_eviction(self):
+        onto = self.registry.warm_up([self.path])[0]
+        self.assertIn(self.path, self.registry)
+        self.assertTrue(all(size > 0 for size in self.registry.memory_usage().values()))
+        self.assertEqual(1, self.registry.evict(self.path))
+        self.assertNotIn(self.path, self.registry)
+        self.assertIsNot(onto, self.registry.get(self.path))
+
+
+class OntologyViewTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.onto = build_ontology()
+        self.view = OntologyView(self.onto, ['a', 'b', 'd', 'f'])
+
+    def test_view_hierarchy(self):
+        self.assertEqual({'b'}, {t.get_id() for t in self.view.get_ancestors(self.view.get_term('d'), True)})
+        self.assertEqual({'b', 'd', 'f'}, self.view.get_descendants('a', False))
+        self.assertIsNone(self.view.get_term('term c', False))
+        self.assertEqual([], self.view.get_term_relationships('d'))
+        self.assertEqual({'b', 'c'}, self.onto.get_term('d').get_parent_ids(), 'The ontology should not change')
+
+    def test_view_is_read_only(self):
+        self.assertRaises(TypeError, self.view.add_term, Term(onto=None, t_id='g', name='term g'))
+
+    def test_view_equals_filtered_ontology(self):
+        view = get_filtered_view(self.onto, [self.onto.get_term('f')], min_deepness=1)
+        onto = build_ontology()
+        filter_ontology(onto, [onto.get_term('f')], min_deepness=1)
+        self.assertEqual({str(t) for t in onto.get_all_terms()},
+                         {str(t) for t in view.to_ontology().get_all_terms()})
+        self.assertEqual(set(onto.get_all_relationships()), set(view.get_all_relationships()))
+
+
+class OboParserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'test.obo')
+        with open(self.path, 'w') as f:
+            f.write(OBO)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, True)
+
+    def test_obsolete_terms_are_skipped(self):
+        self.assertEqual(['chebi:1', 'chebi:2'], [term.get_id() for (term, _) in iter_obo(self.path)])
+
+    def test_relationships_are_filtered(self):
+        rels = [rel for (_, rels) in iter_obo(self.path, relationships={'is_conjugate_acid_of'}) for rel in rels]
+        self.assertEqual([('chebi:1', 'is_conjugate_acid_of', 'chebi:2')], rels)
+
+    def test_parse(self):
+        onto = parse(self.path)
+        self.assertEqual({'chebi:1', 'chebi:2'}, onto.get_all_term_ids())
+        self.assertEqual('acid', onto.get_term('chebi:1').get_name())
+        self.assertEqual({'C2H'}, onto.get_term('chebi:2').get_formulas())
+        self.assertTrue(onto.is_a('chebi:2', 'chebi:1'))
+        self.assertEqual({'is_conjugate_acid_of', 'has_role'}, onto.get_relationships())
+
+    def test_terms_are_frozen(self):
+        for term, _ in iter_obo(self.path):
+            self.assertIsInstance(term.synonyms, tuple)
+            self.assertIsInstance(term.parent_ids, tuple)
+            self.assertIn(type(term.xrefs), (dict, type(None)))
+            for values in (term.xrefs or {}).values():
+                self.assertIsInstance(values, tuple)
+
+
+class RelationshipsTestCase(unittest.TestCase):
+
+    def test_term_relationships_by_role(self):
+        onto = build_ontology()
+        self.assertEqual([('c', 'part_of', 'a')], onto.get_term_relationships('c', 'part_of', 1))
+        self.assertEqual([], onto.get_term_relationships('c', 'part_of', 2))
+        self.assertEqual([('c', 'part_of', 'a')], onto.get_term_relationships('a', role=0))
+
+    def test_relationships_after_term_removal(self):
+        onto = build_ontology()
+        onto.remove_term(onto.get_term('e'))
+        self.assertEqual({'part_of'}, onto.get_relationships())
+        self.assertEqual([], onto.get_term_relationships('d'))